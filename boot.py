@@ -0,0 +1,27 @@
+# Runs before code.py, after every reset.
+#
+# The spool in code.py (demo_badge/spool.py) keeps reported values across reboots only if
+# CircuitPython may write the CIRCUITPY drive, and then the computer connected over USB may not.
+# So this is opt-in: create an empty file named `persistent_spool` on the drive and reset the badge.
+# To edit files from the computer again, hold button 1 while resetting the badge, and delete
+# `persistent_spool` before the next reset.
+import os
+import board
+import storage
+import digitalio
+
+button = digitalio.DigitalInOut(board.GP13) # BUTTON1 in demo_badge/hardware.py
+button.switch_to_input(pull=digitalio.Pull.UP)
+override = not button.value # pressed
+button.deinit()
+
+try:
+    os.stat("/persistent_spool")
+    wanted = True
+except OSError:
+    wanted = False
+
+if wanted and not override:
+    # writable for code.py, read-only for the computer
+    storage.remount("/", readonly=False)
+    print("boot.py: CIRCUITPY is writable for code.py, the spool persists across reboots")
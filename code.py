@@ -1,61 +1,92 @@
+from demo_badge.boot_timing import boot_timer
 from demo_badge import Badge
-from demo_badge.expresslink import Event
+from demo_badge.dashboard import Dashboard
+from demo_badge.connection import ConnectionManager
+from demo_badge.shadow_parser import ShadowParser
+from demo_badge.spool import ReportSpool
+from demo_badge.shadows import CLASSIC, ShadowRouter
+from demo_badge.telemetry import TelemetryEncoder
+from demo_badge.inbox import MessageInbox
+from demo_badge.power import PowerManager
+from demo_badge.reporting import ReportingPolicy
+from demo_badge.scenes import SceneManager
+from demo_badge.text import GlyphLRU, load_font
+from demo_badge.battery import BatteryMonitor, CRITICAL, NORMAL, SAVER
+from demo_badge.topics import TopicManager
 import json
 from adafruit_ticks import ticks_add, ticks_less, ticks_ms
+boot_timer.mark('imports')
 
 badge = Badge()
 current_config=0
-next_data_update = ticks_ms()
-last_reported_state = {}
+button_mapping_version = 0 # bumped on every buttons_config change, so the dict is not compared each tick
 DEFAULT_UPDATE_RATE = 4000 # milliseconds
-update_rate = DEFAULT_UPDATE_RATE
+CONFIG_UPDATE_RATE = 1000 # milliseconds, configuration changes are reported at most this often
+TELEMETRY_SHADOW = 1 # Shadow1, named "telemetry"
+telemetry_rate = DEFAULT_UPDATE_RATE
+battery_rate_scale = 1 # telemetry is reported less often when the battery runs low
+compact_telemetry = False # publish sensor values as binary frames instead of shadow updates
+telemetry = TelemetryEncoder()
+topics = TopicManager(badge.expresslink, inbox=MessageInbox(capacity=16))
+telemetry_topic = None # topic index, assigned after connecting
+DIAGNOSTICS_INTERVAL = 60000 # milliseconds
+next_diagnostics = ticks_add(ticks_ms(), DIAGNOSTICS_INTERVAL)
 button_mapping = {}
 
+# reported state deltas are kept on flash while offline, and replayed in rate-limited batches
+spool = ReportSpool("/spool.bin")
+
+# live sensor values below the QR code, only the characters that changed are redrawn
+# a BDF or PCF font copied to the badge replaces the built-in font of the dashboard
+dashboard_font = load_font("/fonts/dashboard.bdf")
+dashboard = Dashboard(
+    [
+        ('temperature', 19, "{:.1f} C"),
+        ('humidity', 19, "{:.0f} %RH"),
+        ('ambient_light', 19, "light {:.0f}"),
+        ('nfc_reads', 19, "NFC reads {}"),
+    ],
+    y=200, width=240, height=40, columns=2, font=dashboard_font,
+)
+
+# QR code, NDEF message and LED colors of every buttons_config entry are compiled when the
+# configuration arrives, a button press only swaps them in and the NFC tag is written in the background
+scenes = SceneManager(badge, footer=dashboard)
+
+# desired values that local code overwrites, e.g. a scene sets all LEDs and full brightness
+LED_KEYS = ('led_1', 'led_2', 'led_3', 'led_4', 'led_5', 'led_brightness')
+
+def invalidate_leds():
+    # the next desired LED values are applied again, even if they equal the last applied ones
+    for k in LED_KEYS:
+        shadows.invalidate(k)
+
 def change_url(config_index):
     global current_config
-    global button_mapping
-
-    if bool(button_mapping):
-        url_to_share = button_mapping[f'button_{config_index}'][0]
-        print(f"Sharing URL: {url_to_share}")
-        #print("Setting NFC tag...")
-        #badge.nfc_tag.set_url(button_mapping[f'button_{config_index}'][0])
-        print("Displaying QR code...")
-        badge.show_qr_code(button_mapping[f'button_{config_index}'][0])
-        print("Setting LEDs...")
-
-        led_tuple = (button_mapping[f'button_{config_index}'][1][0], button_mapping[f'button_{config_index}'][1][1], button_mapping[f'button_{config_index}'][1][2])
-        for l in range(0,5):
-            badge.leds[l] = led_tuple
-        badge.leds.brightness = 1.0
 
+    if scenes.activate(f'button_{config_index}'):
         current_config = config_index
-        new_reported_state = report_changed_values(last_reported_state)
-        last_reported_state.update(new_reported_state)
+        invalidate_leds()
+        shadows.request(CLASSIC) # reported with the next loop iteration, not inline
 
 
-def handle_shadow_doc(line):
-    if line.startswith("1 "):
-        line = line[2:]
-    elif line.startswith("0 "):
-        print("ExpressLink SHADOW rejected:", line)
-        return
-
-    state = json.loads(line)['state']
-
-    if 'desired' in state:
-        # first: handle delta updates and unfinished desired
-        handle_desired_shadow_state(state['desired'])
-    elif 'reported' in state:
-        # second: handle initial shadow doc from previous reported
-        handle_desired_shadow_state(state['reported'])
-    else:
-        handle_desired_shadow_state(state)
+shadow_parser = ShadowParser()
 
-def t2rgb(t): # convert RGB color to integer
-    return t[0] << 16 | t[1] << 8 | t[2]
+def handle_shadow_doc(index, line):
+    # the desired (or reported, or delta) section, oversized or malformed documents are counted and dropped
+    if not shadow_parser.parse(line):
+        return
+    # documents and deltas race after (re)connecting, an older one must not undo a newer one
+    changed = shadows.accept(index, shadow_parser.version, shadow_parser.state)
+    if changed is None:
+        print(f"Dropping stale shadow {index} document version {shadow_parser.version}")
+        return
+    unchanged = [k for k in shadow_parser.state if k not in changed]
+    if not changed and (not unchanged or shadow_parser.section == 'reported'):
+        return # already applied, nothing to acknowledge
+    handle_desired_shadow_state(changed, index, unchanged)
 
-def handle_desired_shadow_state(desired_state):
+def handle_desired_shadow_state(desired_state, index=CLASSIC, unchanged=()):
     payload = {}
     payload['state'] = {}
     payload['state']['desired'] = {}
@@ -63,6 +94,10 @@ def handle_desired_shadow_state(desired_state):
 
     global current_config
 
+    # values already applied only need their desired entry cleared
+    for k in unchanged:
+        payload['state']['desired'][k] = None
+
     # Iterate over all desired state keys and update the Demo Badge components accordingly
     for k, v in desired_state.items():
         payload['state']['desired'][k] = None
@@ -71,8 +106,11 @@ def handle_desired_shadow_state(desired_state):
             badge.display.brightness = float(v) / 100
         elif k == 'buttons_config':
             global button_mapping
+            global button_mapping_version
             for z in v:
                 button_mapping[z] = v[z]
+            button_mapping_version += 1
+            scenes.load(button_mapping)
         elif k == 'active_button_config':
             if v > 0 and v < 4:
                 change_url(v)
@@ -82,12 +120,13 @@ def handle_desired_shadow_state(desired_state):
             badge.leds.brightness = float(v) / 100
         elif k == 'led_animation':
             badge.set_led_animation(v)
+            invalidate_leds() # animations change the LEDs, Static resets the brightness
             if v == 'Static':
-                payload['state']['reported']['led_1'] = t2rgb(badge.leds[0])
-                payload['state']['reported']['led_2'] = t2rgb(badge.leds[1])
-                payload['state']['reported']['led_3'] = t2rgb(badge.leds[2])
-                payload['state']['reported']['led_4'] = t2rgb(badge.leds[3])
-                payload['state']['reported']['led_5'] = t2rgb(badge.leds[4])
+                payload['state']['reported']['led_1'] = badge.leds.packed(0)
+                payload['state']['reported']['led_2'] = badge.leds.packed(1)
+                payload['state']['reported']['led_3'] = badge.leds.packed(2)
+                payload['state']['reported']['led_4'] = badge.leds.packed(3)
+                payload['state']['reported']['led_5'] = badge.leds.packed(4)
         elif k == 'led_1':
             badge.leds[0] = v
         elif k == 'led_2':
@@ -108,79 +147,220 @@ def handle_desired_shadow_state(desired_state):
             elif v == 'blinking':
                 badge.back_led.blink = True
         elif k == 'high_update_rate':
-            global update_rate
+            global telemetry_rate
             if v:
                 badge.expresslink.debug = False
-                update_rate = 100
+                telemetry_rate = 100
+                apply_update_rate()
                 print("Using high update rate - going silent on ExpressLink command output.")
             else:
                 badge.expresslink.debug = True
-                update_rate = DEFAULT_UPDATE_RATE
+                telemetry_rate = DEFAULT_UPDATE_RATE
+                apply_update_rate()
                 print("Using normal update rate - enabling ExpressLink command output for visibility.")
+        elif k == 'compact_telemetry':
+            global compact_telemetry
+            compact_telemetry = bool(v)
+        elif k == 'reporting':
+            try:
+                payload['state']['reported'][k] = reporting.configure(v)
+                apply_update_rate()
+            except ValueError as e:
+                print(f"Invalid reporting policy: {e}")
+                del payload['state']['reported'][k]
 
     # Publish that now everything is not only desired, but also active = reported
-    badge.expresslink.shadow_update(json.dumps(payload))
+    shadows.update(index, payload)
+
+# configuration goes to the classic shadow, sensor values to the "telemetry" named shadow,
+# each reported at its own rate so fast telemetry does not delay or churn configuration updates
+shadows = ShadowRouter(badge.expresslink, on_document=handle_shadow_doc)
+shadows.add(CLASSIC, None, (
+    'led_1', 'led_2', 'led_3', 'led_4', 'led_5',
+    'active_button_config', 'buttons_config',
+), rate_ms=CONFIG_UPDATE_RATE)
+telemetry_shadow = shadows.add(TELEMETRY_SHADOW, 'telemetry', (
+    'temperature', 'humidity', 'ambient_light',
+    'acceleration_x', 'acceleration_y', 'acceleration_z',
+    'button_1', 'button_2', 'button_3',
+    'nfc_taps', 'nfc_reads', 'nfc_per_url',
+    'reconnects', 'reconnect_latency_ms',
+    'average_ma', 'battery_hours',
+    'battery_voltage', 'battery_soc', 'battery_level', 'battery_time_to_empty_h',
+), rate_ms=DEFAULT_UPDATE_RATE)
+
+# per-key rate, deadband, enable and aggregation, from the `reporting` section of the desired shadow
+reporting = ReportingPolicy(shadows)
+
+def apply_update_rate():
+    # each shadow is scheduled at the fastest rate of its keys, telemetry_rate is the default for telemetry keys
+    reporting.scale = battery_rate_scale
+    shadows.set_rate(CLASSIC, reporting.shadow_rate(CLASSIC, CONFIG_UPDATE_RATE))
+    shadows.set_rate(TELEMETRY_SHADOW, reporting.shadow_rate(TELEMETRY_SHADOW, telemetry_rate) * battery_rate_scale)
+
+# battery level -> (telemetry interval scale, maximum LED brightness, pause LED animation)
+BATTERY_POLICY = {
+    NORMAL: (1, 1.0, False),
+    SAVER: (3, 0.4, False),
+    CRITICAL: (10, 0.1, True),
+}
+
+def on_battery_level(level):
+    # scale back reporting, LED brightness and animations as the battery drops
+    global battery_rate_scale
+    battery_rate_scale, max_brightness, paused = BATTERY_POLICY[level]
+    badge.leds.max_brightness = max_brightness
+    badge.led_animation_paused = paused
+    apply_update_rate()
 
-def report_changed_values(last_reported_state):
+def button_state(button):
+    return 'pressed' if not button.value else 'not pressed'
+
+def report_changed_values():
+    # only changed fields are formatted, directly into the reusable report buffer
+    # reporting.field() applies the per-key policy before a value reaches the shadow
     acceleration_x, acceleration_y, acceleration_z = badge.accelerometer.acceleration
+    temperature = badge.temperature_humidity.temperature
+    humidity = badge.temperature_humidity.relative_humidity
+    ambient_light = float(badge.ambient_light.value)
+    dashboard.set('temperature', temperature)
+    dashboard.set('humidity', humidity)
+    dashboard.set('ambient_light', ambient_light)
+    dashboard.set('nfc_reads', badge.nfc_activity.reads)
 
-    reported_state = {}
-
-    def conditional_report(name, value):
-        if name not in last_reported_state or last_reported_state[name] != value:
-            reported_state[name] = value
-
-    conditional_report('temperature', badge.temperature_humidity.temperature)
-    conditional_report('humidity', badge.temperature_humidity.relative_humidity)
-    conditional_report('ambient_light', float(badge.ambient_light.value))
-    conditional_report('acceleration_x', acceleration_x)
-    conditional_report('acceleration_y', acceleration_y)
-    conditional_report('acceleration_z', acceleration_z)
-    conditional_report('button_1', 'pressed' if not badge.button1.value else 'not pressed')
-    conditional_report('button_2', 'pressed' if not badge.button2.value else 'not pressed')
-    conditional_report('button_3', 'pressed' if not badge.button3.value else 'not pressed')
-    conditional_report('led_1', t2rgb(badge.leds[0]))
-    conditional_report('led_2', t2rgb(badge.leds[1]))
-    conditional_report('led_3', t2rgb(badge.leds[2]))
-    conditional_report('led_4', t2rgb(badge.leds[3]))
-    conditional_report('led_5', t2rgb(badge.leds[4]))
-    conditional_report('active_button_config', current_config)
-    conditional_report('buttons_config', button_mapping)
-
-    # Publish shadow update
-    payload = {}
-    payload['state'] = {}
-    payload['state']['reported'] = reported_state
-    badge.expresslink.shadow_update(json.dumps(payload))
+    shadows.begin()
+    if compact_telemetry and telemetry_shadow.due and connection.connected:
+        # sensor values go out as a binary frame on the telemetry topic, see demo_badge/telemetry.py
+        buttons = (not badge.button1.value) | (not badge.button2.value) << 1 | (not badge.button3.value) << 2
+        telemetry.publish(badge.expresslink, telemetry_topic, ticks_ms(), temperature, humidity, ambient_light, (acceleration_x, acceleration_y, acceleration_z), buttons)
+    else:
+        reporting.field('temperature', temperature)
+        reporting.field('humidity', humidity)
+        reporting.field('ambient_light', ambient_light)
+        reporting.field('acceleration_x', acceleration_x)
+        reporting.field('acceleration_y', acceleration_y)
+        reporting.field('acceleration_z', acceleration_z)
+        reporting.field('button_1', button_state(badge.button1))
+        reporting.field('button_2', button_state(badge.button2))
+        reporting.field('button_3', button_state(badge.button3))
+    reporting.field('led_1', badge.leds.packed(0))
+    reporting.field('led_2', badge.leds.packed(1))
+    reporting.field('led_3', badge.leds.packed(2))
+    reporting.field('led_4', badge.leds.packed(3))
+    reporting.field('led_5', badge.leds.packed(4))
+    reporting.field('active_button_config', current_config)
+    reporting.field('buttons_config', button_mapping, token=button_mapping_version)
+    nfc_changed = reporting.field('nfc_taps', badge.nfc_activity.taps)
+    nfc_changed = reporting.field('nfc_reads', badge.nfc_activity.reads) or nfc_changed
+    if nfc_changed:
+        reporting.field('nfc_per_url', badge.nfc_activity.metrics()['nfc_per_url'])
+    reporting.field('reconnects', connection.reconnects)
+    reporting.field('reconnect_latency_ms', connection.last_reconnect_latency_ms)
+    if telemetry_shadow.due:
+        power_stats = power.stats()
+        reporting.field('average_ma', power_stats['average_ma'])
+        reporting.field('battery_hours', power_stats['battery_hours'])
+        for k, v in battery.stats().items():
+            reporting.field(k, v)
+
+    # Publish shadow updates, if anything changed
+    shadows.end(send_report)
 
-    return reported_state
+def reported():
+    # start of code.py to the first shadow report that reached AWS IoT, the number startup work is measured by
+    if not boot_timer.done('first_report'):
+        boot_timer.mark('first_report')
+        boot_timer.print_report()
 
+def send_report(index, payload):
+    if connection.connected:
+        # live values go out directly, also while older values are replayed from the spool
+        success, line, err = shadows.send(index, payload)
+        if success:
+            if spool:
+                spool.discard(json.loads(bytes(payload))['state']['reported'])
+            reported()
+            return True
+    # offline or failed: spool the delta, the latest value per key wins
+    spool.append(json.loads(bytes(payload))['state']['reported'])
+    return True
 
-# Connect to AWS, stop if there is any error
-success, status, err = badge.expresslink.connect()
-if not success:
-    print(f"Unable to connect: {err} {status}")
-    while True: pass
+def send_spooled(values):
+    # spooled values are sent to the shadow that owns their key
+    ok = shadows.send_values(values)
+    if ok:
+        reported()
+    return ok
+
+
+def handle_command(topic_name, message):
+    # commands use the same keys as the desired shadow state, e.g. {"led_animation": "Rainbow"}
+    try:
+        command = json.loads(message)
+        if not isinstance(command, dict):
+            raise ValueError("not a JSON object")
+        handle_desired_shadow_state(command)
+        for k in command:
+            shadows.invalidate(k) # applied outside of the shadow
+    except (ValueError, TypeError, AttributeError, KeyError, IndexError) as e:
+        # one bad command is logged and dropped, it must not stop the main loop
+        print(f"Invalid command on {topic_name}: {e}")
 
 thing_name = badge.expresslink.config.ThingName
-badge.expresslink.config.enable_shadow = True
-badge.expresslink.shadow_init()
-badge.expresslink.shadow_doc()
-badge.expresslink.shadow_subscribe()
+telemetry_topic = topics.register(f"badge/{thing_name}/telemetry")
+diagnostics_topic = topics.register(f"badge/{thing_name}/diagnostics")
+
+def publish_diagnostics():
+    # ExpressLink command counts, latency histograms and UART traffic, to spot saturated badges in the fleet
+    if badge.expresslink.debug:
+        badge.expresslink.metrics.print_stats()
+    stats = badge.expresslink.stats()
+    stats['boot'] = boot_timer.report()
+    stats['shadow_docs_rejected'] = shadow_parser.rejected
+    stats.update(spool.stats())
+    stats.update(dashboard.stats())
+    if isinstance(dashboard_font, GlyphLRU):
+        stats.update(dashboard_font.stats())
+    badge.expresslink.publish(diagnostics_topic, json.dumps(stats))
+
+def on_connected(first):
+    # (re-)initialise shadows and topics after every connect
+    if first:
+        boot_timer.mark('connected')
+    shadows.setup()
+    if first:
+        topics.subscribe(f"badge/{thing_name}/command", handle_command)
+    else:
+        topics.restore()
+    # everything reported while offline is replayed from the spool in the main loop
+
+# Connect to AWS without blocking the loop, failed attempts are retried with backoff
+connection = ConnectionManager(badge.expresslink, on_connected=on_connected)
+
+# ExpressLink sleeps while nobody uses the badge, the connection is re-established after waking up
+battery = BatteryMonitor(badge.battery_voltage, on_level=on_battery_level)
+power = PowerManager(badge, battery, on_sleep=connection.sleep, on_wake=connection.wake)
 
 
 print("Looping...")
 while True:
     badge.update()
+    scenes.update()
+    power.update()
+    battery.update()
+    connection.update()
 
     if current_config == 0:
         change_url(1)
     if badge.button1.pressed:
         change_url(1)
+        shadows.invalidate('active_button_config')
     if badge.button2.pressed:
         change_url(2)
+        shadows.invalidate('active_button_config')
     if badge.button3.pressed:
         change_url(3)
+        shadows.invalidate('active_button_config')
 
     while badge.expresslink.event_signal.value:
         badge.update()
@@ -188,24 +368,31 @@ while True:
         event_id, parameter, mnemonic, detail = badge.expresslink.get_event()
         if not event_id:
             pass # no event pending
-        elif event_id == Event.SHADOW_DOC:
-            success, line, err = badge.expresslink.shadow_get_doc()
-            handle_shadow_doc(line)
-        elif event_id == Event.SHADOW_DELTA:
-            success, line, err = badge.expresslink.shadow_get_delta()
-            handle_shadow_doc(line)
-        elif event_id == Event.SHADOW_UPDATE:
-            t = badge.expresslink.debug
-            badge.expresslink.debug = False
-            success, line, err = badge.expresslink.shadow_get_update()
-            badge.expresslink.debug = t
-            # shadow update accepted, no further processing needed
+        elif connection.handle_event(event_id, parameter):
+            pass # CONNECT / CONLOST handled by the connection manager
+        elif shadows.handle_event(event_id, parameter):
+            pass # documents and deltas of every shadow index are applied in handle_shadow_doc
+        elif topics.handle_event(event_id, parameter, detail):
+            pass # messages drained into the inbox, overruns counted
         else:
             print(f"Ignoring event: {event_id} {parameter} {mnemonic} {detail}")
-    
-    if ticks_less(next_data_update, ticks_ms()):
-        new_reported_state = report_changed_values(last_reported_state)
-        last_reported_state.update(new_reported_state)
 
-        # set the next data update timestamp
-        next_data_update = ticks_add(ticks_ms(), update_rate)
\ No newline at end of file
+    topics.process()
+
+    if connection.connected and spool:
+        spool.flush(send_spooled)
+    spool.update() # spooled values reach the flash at most every few seconds
+
+    if connection.connected and not ticks_less(ticks_ms(), next_diagnostics):
+        next_diagnostics = ticks_add(ticks_ms(), DIAGNOSTICS_INTERVAL)
+        publish_diagnostics()
+
+    # while ExpressLink sleeps every report would only be spooled and replayed as stale telemetry
+    # after waking up, the first report after waking carries the current values instead
+    if shadows.due() and not power.sleeping:
+        report_changed_values()
+
+        if power.display_due():
+            dashboard.refresh(badge.display)
+
+    power.wait()
\ No newline at end of file
@@ -0,0 +1,220 @@
+"""
+Configures and harvests many Demo Badges at once over USB serial.
+
+Every badge is driven through the CircuitPython raw REPL by its own worker thread, using the
+ExpressLink class from the demo_badge library on the badge itself. Requires pyserial on the host:
+
+  pip install pyserial
+  python deploy/fleet.py --ssid MyWifi --manifest fleet.json
+
+The Wi-Fi passphrase is read from the WIFI_PASSPHRASE environment variable, or prompted for,
+so it never shows up in the process list or the shell history.
+
+Ports are discovered by USB vendor ID (Raspberry Pi RP2040 and Adafruit CircuitPython boards),
+or given explicitly with --port (any pyserial URL, e.g. a pseudo-terminal of a simulator).
+"""
+
+import argparse
+import getpass
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+from serial.tools import list_ports
+
+USB_VENDOR_IDS = (0x2E8A, 0x239A) # Raspberry Pi, Adafruit
+RESULT_MARKER = "FLEET_RESULT "
+PASSPHRASE_VARIABLE = "WIFI_PASSPHRASE"
+
+# runs on the badge: AT commands are sent with ExpressLink.cmd(), which waits for all response lines
+BADGE_SETUP = """
+import busio, json
+from demo_badge import EXPRESSLINK_TX, EXPRESSLINK_RX
+from demo_badge.expresslink import ExpressLink
+uart = busio.UART(EXPRESSLINK_TX, EXPRESSLINK_RX, baudrate=115200, receiver_buffer_size=4096, timeout=0.1)
+el = ExpressLink(uart, debug=False)
+def at(c):
+    success, line, err = el.cmd(c)
+    return {'success': success, 'line': line, 'error': err}
+"""
+
+
+class RawREPL:
+    """
+    Minimal client for the MicroPython/CircuitPython raw REPL: Ctrl-A enters it, code is sent
+    followed by Ctrl-D, and the badge answers with OK, stdout, Ctrl-D, stderr, Ctrl-D, >.
+    """
+
+    def __init__(self, port: str, baudrate: int=115200, timeout: float=30) -> None:
+        self.port = port
+        self.timeout = timeout
+        self.serial = serial.serial_for_url(port, baudrate=baudrate, timeout=0.1)
+        self._rx = b"" # received, but after the last marker
+
+    def close(self):
+        self.serial.close()
+
+    def read_until(self, marker: bytes, timeout: float=None) -> bytes:
+        deadline = time.monotonic() + (timeout or self.timeout)
+        while True:
+            i = self._rx.find(marker)
+            if i >= 0:
+                data = self._rx[:i]
+                self._rx = self._rx[i + len(marker):]
+                return data
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{self.port}: no {marker!r} after {self._rx[-80:]!r}")
+            self._rx += self.serial.read(max(1, self.serial.in_waiting))
+
+    def enter(self):
+        # interrupt code.py, then switch to the raw REPL
+        self.serial.write(b"\r\x03\x03")
+        time.sleep(0.2)
+        self.serial.reset_input_buffer()
+        self._rx = b""
+        self.serial.write(b"\r\x01")
+        self.read_until(b"raw REPL; CTRL-B to exit\r\n>", timeout=10)
+
+    def exec(self, code: str, timeout: float=None) -> str:
+        data = code.encode()
+        for i in range(0, len(data), 256):
+            # the badge's USB input buffer is small
+            self.serial.write(data[i:i + 256])
+            time.sleep(0.01)
+        self.serial.write(b"\x04")
+        self.read_until(b"OK", timeout=10)
+        out = self.read_until(b"\x04", timeout)
+        err = self.read_until(b"\x04", timeout)
+        self.read_until(b">", timeout=10)
+        if err:
+            raise RuntimeError(f"{self.port}: {err.decode(errors='replace').strip()}")
+        return out.decode(errors="replace")
+
+    def call(self, expression: str, timeout: float=None):
+        # evaluates an expression on the badge and returns its JSON-decoded result
+        out = self.exec(f"print({RESULT_MARKER!r} + json.dumps({expression}))", timeout)
+        for line in out.splitlines():
+            if line.startswith(RESULT_MARKER):
+                return json.loads(line[len(RESULT_MARKER):])
+        raise RuntimeError(f"{self.port}: no result in {out!r}")
+
+    def leave(self, reboot: bool=True):
+        self.serial.write(b"\x02") # back to the friendly REPL
+        if reboot:
+            time.sleep(0.1)
+            self.serial.write(b"\x04") # soft reboot, restarts code.py
+
+
+def discover_ports():
+    return sorted(p.device for p in list_ports.comports() if p.vid in USB_VENDOR_IDS)
+
+
+def certificate_body(pem: str) -> str:
+    # the CloudFormation template adds the BEGIN/END lines back, see deploy/README.md
+    # ExpressLink echoes the `pem` argument of CONF? Certificate pem, it is no part of the body
+    return "".join(l.strip() for l in pem.splitlines() if l.strip() and l.strip() != "pem" and "CERTIFICATE" not in l)
+
+
+def provision(port: str, args) -> dict:
+    result = {'port': port}
+    repl = RawREPL(port, timeout=args.timeout)
+    try:
+        repl.enter()
+        repl.exec(BADGE_SETUP)
+
+        def at(command):
+            r = repl.call(f"at({command!r})")
+            if not r['success']:
+                raise RuntimeError(f"{port}: AT+{command.split('=')[0]} failed: {r['error']} {r['line']}")
+            return r['line']
+
+        if args.ssid:
+            at(f"CONF SSID={args.ssid}")
+        if args.passphrase:
+            at(f"CONF Passphrase={args.passphrase}")
+        if args.endpoint:
+            at(f"CONF Endpoint={args.endpoint}")
+        # the Config accessors of the badge library, Certificate strips the echoed `pem`
+        result['thing_name'] = repl.call("el.config.ThingName")
+        result['certificate_pem'] = repl.call("el.config.Certificate")
+        if args.connect:
+            result['connected'] = repl.call("at('CONNECT')", timeout=120)['success']
+        repl.leave(reboot=not args.no_reboot)
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        repl.close()
+    return result
+
+
+def write_outputs(badges, args):
+    if args.manifest:
+        with open(args.manifest, "w") as f:
+            json.dump({'badges': badges}, f, indent=2)
+        print(f"Wrote manifest for {len(badges)} badges to {args.manifest}")
+
+    if args.registration:
+        # one line of provisioning template parameters per thing, for an AWS IoT bulk registration task
+        with open(args.registration, "w") as f:
+            for b in badges:
+                f.write(json.dumps({'ThingName': b['thing_name'], 'CertificatePem': b['certificate_pem']}) + "\n")
+        print(f"Wrote bulk registration file to {args.registration}")
+
+    if args.parameters:
+        # CloudFormation parameters for deploying demo_deploy.yaml once per badge
+        os.makedirs(args.parameters, exist_ok=True)
+        for b in badges:
+            path = os.path.join(args.parameters, f"{b['thing_name']}.json")
+            with open(path, "w") as f:
+                json.dump([
+                    {'ParameterKey': 'ExpressLinkThingName', 'ParameterValue': b['thing_name']},
+                    {'ParameterKey': 'ExpressLinkCertPem', 'ParameterValue': certificate_body(b['certificate_pem'])},
+                ], f, indent=2)
+        print(f"Wrote CloudFormation parameters to {args.parameters}/")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", action="append", help="serial port or pyserial URL, repeatable (default: discover)")
+    parser.add_argument("--ssid", help="WiFi network to configure")
+    parser.add_argument("--endpoint", help="AWS IoT Core device data endpoint to configure")
+    parser.add_argument("--connect", action="store_true", help="connect each badge to AWS IoT Core afterwards")
+    parser.add_argument("--no-reboot", action="store_true", help="stay in the REPL instead of restarting code.py")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for a badge response")
+    parser.add_argument("--manifest", help="write all harvested badges to this JSON file")
+    parser.add_argument("--registration", help="write an AWS IoT bulk registration file (JSON lines)")
+    parser.add_argument("--parameters", help="write one CloudFormation parameters file per badge into this directory")
+    args = parser.parse_args(argv)
+
+    # only together with an SSID, an empty passphrase leaves it unchanged (e.g. open networks)
+    args.passphrase = None
+    if args.ssid:
+        args.passphrase = os.environ.get(PASSPHRASE_VARIABLE)
+        if args.passphrase is None:
+            args.passphrase = getpass.getpass(f"WiFi passphrase for {args.ssid} (or set {PASSPHRASE_VARIABLE}): ")
+
+    ports = args.port or discover_ports()
+    if not ports:
+        print("No badges found, connect them via USB or use --port")
+        return 1
+    print(f"Provisioning {len(ports)} badges: {', '.join(ports)}")
+
+    with ThreadPoolExecutor(max_workers=len(ports)) as pool:
+        results = list(pool.map(lambda p: provision(p, args), ports))
+
+    badges = []
+    for r in results:
+        if 'error' in r:
+            print(f"FAILED {r['port']}: {r['error']}")
+        else:
+            print(f"OK     {r['port']}: {r['thing_name']}")
+            badges.append(r)
+    write_outputs(badges, args)
+    return 0 if len(badges) == len(results) else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
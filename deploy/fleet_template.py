@@ -0,0 +1,401 @@
+"""
+Generates a CloudFormation template that registers a whole fleet of Demo Badges in one stack.
+
+Takes the manifest written by fleet.py and emits a JSON template with one thing, certificate
+and policy attachment per badge. All things carry the thing attribute fleet=<group>, and a
+dynamic thing group selects them by that attribute. The getShadow/updateShadow Lambdas are
+parameterised by the group instead of a single THING_NAME, and read or write every badge in it.
+
+  python deploy/fleet_template.py --manifest fleet.json --group workshop --output fleet_deploy.json
+
+The template is validated locally before it is written, no AWS access is needed.
+The dynamic thing group requires fleet indexing of the thing registry, see
+https://docs.aws.amazon.com/iot/latest/developerguide/dynamic-thing-groups.html
+(use --no-thing-group without it, the Lambdas do not depend on the thing group).
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lambda")
+FLEET_ATTRIBUTE = "fleet"
+
+# CloudFormation and AWS IoT limits checked by validate()
+MAX_RESOURCES = 500
+MAX_TEMPLATE_BYTES = 1024 * 1024 # when deployed from S3
+MAX_INLINE_TEMPLATE_BYTES = 51200
+MAX_ZIPFILE_BYTES = 4096
+MAX_ROLE_POLICY_CHARS = 10240 # all inline policies of one IAM role, without whitespace
+MAX_LAMBDA_TIMEOUT = 900
+THING_NAME = re.compile(r"^[a-zA-Z0-9:_-]{1,128}$")
+ATTRIBUTE_VALUE = re.compile(r"^[a-zA-Z0-9_.,@/:#-]{1,800}$")
+LOGICAL_ID = re.compile(r"^[A-Za-z0-9]{1,255}$")
+# getFleetShadow reads two shadows per badge one after the other, the default of 3 s is too short
+LAMBDA_TIMEOUT = 10 # seconds, the fleet Lambdas get LAMBDA_TIMEOUT_PER_BADGE more per badge
+LAMBDA_TIMEOUT_PER_BADGE = 1
+# longest values of the pseudo parameters, to size the policies after Fn::Sub
+PSEUDO_PARAMETERS = {"AWS::Partition": "aws-us-gov", "AWS::Region": "ap-southeast-4", "AWS::AccountId": "123456789012"}
+PEM = re.compile(r"^-----BEGIN CERTIFICATE-----\n[A-Za-z0-9+/=\n]{256,}\n-----END CERTIFICATE-----\n?$")
+
+# resource type -> required properties
+RESOURCE_SCHEMAS = {
+    "AWS::IoT::Policy": ("PolicyDocument",),
+    "AWS::IoT::Thing": (),
+    "AWS::IoT::ThingGroup": (),
+    "AWS::IoT::Certificate": ("Status",),
+    "AWS::IoT::ThingPrincipalAttachment": ("Principal", "ThingName"),
+    "AWS::IoT::PolicyPrincipalAttachment": ("PolicyName", "Principal"),
+    "AWS::IoT::TopicRule": ("TopicRulePayload",),
+    "AWS::IAM::Role": ("AssumeRolePolicyDocument",),
+    "AWS::Lambda::Function": ("Code", "Role"),
+    "AWS::Lambda::Permission": ("Action", "FunctionName", "Principal"),
+    "AWS::Lambda::Url": ("AuthType", "TargetFunctionArn"),
+}
+
+
+def sub(s):
+    return {"Fn::Sub": s}
+
+
+def ref(name):
+    return {"Ref": name}
+
+
+def get_att(name, attribute):
+    return {"Fn::GetAtt": [name, attribute]}
+
+
+def logical_id(prefix, thing_name):
+    return prefix + re.sub(r"[^A-Za-z0-9]", "", thing_name)
+
+
+def certificate_pem(pem):
+    # the manifest holds whatever the module returned, rebuild a canonical PEM from the body
+    body = "".join(l.strip() for l in pem.splitlines() if l.strip() and "CERTIFICATE" not in l)
+    lines = [body[i:i + 64] for i in range(0, len(body), 64)]
+    return "-----BEGIN CERTIFICATE-----\n" + "\n".join(lines) + "\n-----END CERTIFICATE-----\n"
+
+
+def lambda_code(name):
+    with open(os.path.join(LAMBDA_DIR, f"{name}.py")) as f:
+        return f.read()
+
+
+def lambda_role(name, statements):
+    return {
+        "Type": "AWS::IAM::Role",
+        "Properties": {
+            "AssumeRolePolicyDocument": {
+                "Version": "2012-10-17",
+                "Statement": [{
+                    "Effect": "Allow",
+                    "Principal": {"Service": ["lambda.amazonaws.com"]},
+                    "Action": ["sts:AssumeRole"],
+                }],
+            },
+            "Policies": [{
+                "PolicyName": f"{name}Policy",
+                "PolicyDocument": {
+                    "Version": "2012-10-17",
+                    "Statement": statements + [
+                        {"Effect": "Allow", "Action": ["iot:DescribeEndpoint"], "Resource": ["*"]},
+                        {"Effect": "Allow", "Action": ["logs:CreateLogGroup"], "Resource": [sub("arn:${AWS::Partition}:logs:${AWS::Region}:${AWS::AccountId}:*")]},
+                        {"Effect": "Allow", "Action": ["logs:CreateLogStream", "logs:PutLogEvents"], "Resource": [
+                            sub("arn:${AWS::Partition}:logs:${AWS::Region}:${AWS::AccountId}:log-group:/aws/lambda/${FleetGroupName}-" + name + ":*")]},
+                    ],
+                },
+            }],
+        },
+    }
+
+
+def lambda_function(name, role, environment, timeout=LAMBDA_TIMEOUT):
+    return {
+        "Type": "AWS::Lambda::Function",
+        "Properties": {
+            "Architectures": ["arm64"],
+            "Runtime": "python3.9",
+            "Handler": "index.lambda_handler",
+            "Code": {"ZipFile": lambda_code(name)},
+            "Environment": {"Variables": environment},
+            "FunctionName": sub("${FleetGroupName}-" + name),
+            "Role": get_att(role, "Arn"),
+            "Timeout": timeout,
+        },
+    }
+
+
+def function_url(resources, function):
+    resources[f"{function}UrlPermission"] = {
+        "Type": "AWS::Lambda::Permission",
+        "Properties": {
+            "FunctionName": ref(function),
+            "FunctionUrlAuthType": "NONE",
+            "Action": "lambda:InvokeFunctionUrl",
+            "Principal": "*",
+        },
+    }
+    resources[f"{function}Url"] = {
+        "Type": "AWS::Lambda::Url",
+        "Properties": {
+            "AuthType": "NONE",
+            "Cors": {"AllowCredentials": False, "AllowOrigins": ["*"]},
+            "TargetFunctionArn": get_att(function, "Arn"),
+        },
+    }
+
+
+def generate(badges, group, thing_group=True, all_things=False):
+    resources = {
+        "IoTPolicy": {
+            "Type": "AWS::IoT::Policy",
+            "Properties": {
+                "PolicyName": sub("${FleetGroupName}-DemoBadgePolicy"),
+                "PolicyDocument": {
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {"Effect": "Allow", "Action": ["iot:Connect"], "Resource": ["*"]},
+                        {"Effect": "Allow", "Action": ["iot:Publish", "iot:Receive"], "Resource": [
+                            sub("arn:${AWS::Partition}:iot:${AWS::Region}:${AWS::AccountId}:topic/*")]},
+                        {"Effect": "Allow", "Action": ["iot:Subscribe"], "Resource": [
+                            sub("arn:${AWS::Partition}:iot:${AWS::Region}:${AWS::AccountId}:topicfilter/*")]},
+                    ],
+                },
+            },
+        },
+    }
+
+    if thing_group:
+        resources["FleetThingGroup"] = {
+            "Type": "AWS::IoT::ThingGroup",
+            "Properties": {
+                "ThingGroupName": ref("FleetGroupName"),
+                "QueryString": sub(f"attributes.{FLEET_ATTRIBUTE}:${{FleetGroupName}}"),
+            },
+        }
+
+    thing_arns = []
+    for badge in badges:
+        name = badge["thing_name"]
+        thing = logical_id("Thing", name)
+        cert = logical_id("Cert", name)
+        resources[thing] = {
+            "Type": "AWS::IoT::Thing",
+            "Properties": {
+                "ThingName": name,
+                "AttributePayload": {"Attributes": {FLEET_ATTRIBUTE: ref("FleetGroupName")}},
+            },
+        }
+        resources[cert] = {
+            "Type": "AWS::IoT::Certificate",
+            "Properties": {
+                "CertificatePem": certificate_pem(badge["certificate_pem"]),
+                "Status": "ACTIVE",
+                "CertificateMode": "SNI_ONLY",
+            },
+        }
+        resources[logical_id("ThingCertAttach", name)] = {
+            "Type": "AWS::IoT::ThingPrincipalAttachment",
+            "Properties": {"Principal": get_att(cert, "Arn"), "ThingName": ref(thing)},
+        }
+        resources[logical_id("CertPolicyAttach", name)] = {
+            "Type": "AWS::IoT::PolicyPrincipalAttachment",
+            "Properties": {"PolicyName": ref("IoTPolicy"), "Principal": get_att(cert, "Arn")},
+        }
+        # the classic shadow and all named shadows of this thing
+        thing_arns.append(sub("arn:${AWS::Partition}:iot:${AWS::Region}:${AWS::AccountId}:thing/" + name))
+        thing_arns.append(sub("arn:${AWS::Partition}:iot:${AWS::Region}:${AWS::AccountId}:thing/" + name + "/*"))
+    if all_things:
+        # one ARN per thing does not fit the IAM policy size limit for large fleets,
+        # the fleet Lambdas only touch things with the fleet attribute anyway
+        thing_arns = [sub("arn:${AWS::Partition}:iot:${AWS::Region}:${AWS::AccountId}:thing/*")]
+
+    list_things = {"Effect": "Allow", "Action": ["iot:ListThings"], "Resource": ["*"]}
+    environment = {"THING_GROUP": ref("FleetGroupName"), "FLEET_ATTRIBUTE": FLEET_ATTRIBUTE}
+    timeout = min(LAMBDA_TIMEOUT + LAMBDA_TIMEOUT_PER_BADGE * len(badges), MAX_LAMBDA_TIMEOUT)
+
+    resources["GetFleetShadowRole"] = lambda_role("getFleetShadow", [
+        {"Effect": "Allow", "Action": ["iot:GetThingShadow"], "Resource": thing_arns}, list_things])
+    resources["GetFleetShadowFunction"] = lambda_function("getFleetShadow", "GetFleetShadowRole", environment, timeout)
+    function_url(resources, "GetFleetShadowFunction")
+
+    resources["UpdateFleetShadowRole"] = lambda_role("updateFleetShadow", [
+        {"Effect": "Allow", "Action": ["iot:UpdateThingShadow"], "Resource": thing_arns}, list_things])
+    resources["UpdateFleetShadowFunction"] = lambda_function("updateFleetShadow", "UpdateFleetShadowRole", environment, timeout)
+    function_url(resources, "UpdateFleetShadowFunction")
+
+    resources["DecodeTelemetryRole"] = lambda_role("decodeTelemetry", [
+        {"Effect": "Allow", "Action": ["iot:UpdateThingShadow"], "Resource": thing_arns}])
+    resources["DecodeTelemetryFunction"] = lambda_function("decodeTelemetry", "DecodeTelemetryRole", {})
+    resources["DecodeTelemetryRule"] = {
+        "Type": "AWS::IoT::TopicRule",
+        "Properties": {
+            "TopicRulePayload": {
+                "AwsIotSqlVersion": "2016-03-23",
+                "RuleDisabled": False,
+                "Sql": "SELECT encode(*, 'base64') AS data, topic(2) AS thing_name FROM 'badge/+/telemetry'",
+                "Actions": [{"Lambda": {"FunctionArn": get_att("DecodeTelemetryFunction", "Arn")}}],
+            },
+        },
+    }
+    resources["DecodeTelemetryRulePermission"] = {
+        "Type": "AWS::Lambda::Permission",
+        "Properties": {
+            "FunctionName": ref("DecodeTelemetryFunction"),
+            "Action": "lambda:InvokeFunction",
+            "Principal": "iot.amazonaws.com",
+            "SourceArn": get_att("DecodeTelemetryRule", "Arn"),
+        },
+    }
+
+    return {
+        "AWSTemplateFormatVersion": "2010-09-09",
+        "Description": f"IoT ExpressLink Demo fleet of {len(badges)} badges",
+        "Parameters": {
+            "FleetGroupName": {
+                "Type": "String",
+                "Description": "Name of the thing group, also set as the fleet attribute of every thing",
+                "Default": group,
+                "AllowedPattern": "^[a-zA-Z0-9:_-]+$",
+            },
+        },
+        "Resources": resources,
+        "Outputs": {
+            "GetFleetShadowUrl": {"Value": get_att("GetFleetShadowFunctionUrl", "FunctionUrl")},
+            "UpdateFleetShadowUrl": {"Value": get_att("UpdateFleetShadowFunctionUrl", "FunctionUrl")},
+        },
+    }
+
+
+def _references(node, found):
+    # collects all Ref and Fn::GetAtt targets, and the ${Name} references in Fn::Sub strings
+    if isinstance(node, dict):
+        for k, v in node.items():
+            if k == "Ref":
+                found.add(v)
+            elif k == "Fn::GetAtt":
+                found.add(v[0])
+            elif k == "Fn::Sub" and isinstance(v, str):
+                found.update(n.split(".")[0] for n in re.findall(r"\$\{([^}!]+)\}", v))
+            else:
+                _references(v, found)
+    elif isinstance(node, list):
+        for v in node:
+            _references(v, found)
+    return found
+
+
+def _policy_text(node, parameters):
+    # the policy as IAM counts it: without whitespace, with the Fn::Sub variables replaced
+    if isinstance(node, dict):
+        if "Fn::Sub" in node and isinstance(node["Fn::Sub"], str):
+            return json.dumps(re.sub(r"\$\{([^}!]+)\}", lambda m: parameters.get(m.group(1), m.group(0)), node["Fn::Sub"]))
+        return "{" + ",".join(json.dumps(k) + ":" + _policy_text(v, parameters) for k, v in node.items()) + "}"
+    if isinstance(node, list):
+        return "[" + ",".join(_policy_text(v, parameters) for v in node) + "]"
+    return json.dumps(node)
+
+
+def validate(template, badges):
+    """
+    Returns a list of problems, empty if the template looks deployable.
+    """
+    errors = []
+    resources = template.get("Resources", {})
+    if not resources:
+        errors.append("template has no resources")
+    if len(resources) > MAX_RESOURCES:
+        errors.append(f"{len(resources)} resources, CloudFormation allows {MAX_RESOURCES} per stack - split the manifest")
+
+    names = set()
+    ids = {}
+    for badge in badges:
+        name = badge.get("thing_name", "")
+        if not THING_NAME.match(name):
+            errors.append(f"invalid thing name {name!r}")
+        if name in names:
+            errors.append(f"duplicate thing name {name!r}")
+        elif logical_id("", name) in ids:
+            errors.append(f"thing names {ids[logical_id('', name)]!r} and {name!r} map to the same logical ID")
+        names.add(name)
+        ids[logical_id("", name)] = name
+        if not PEM.match(certificate_pem(badge.get("certificate_pem", ""))):
+            errors.append(f"{name}: certificate is not a single PEM certificate")
+
+    group = template["Parameters"]["FleetGroupName"]["Default"]
+    if not ATTRIBUTE_VALUE.match(group) or not THING_NAME.match(group):
+        errors.append(f"invalid group name {group!r}")
+    parameters = dict(PSEUDO_PARAMETERS, FleetGroupName=group)
+
+    for logical, resource in resources.items():
+        if not LOGICAL_ID.match(logical):
+            errors.append(f"{logical}: invalid logical ID")
+        schema = RESOURCE_SCHEMAS.get(resource.get("Type"))
+        if schema is None:
+            errors.append(f"{logical}: unknown resource type {resource.get('Type')}")
+            continue
+        properties = resource.get("Properties", {})
+        for p in schema:
+            if p not in properties:
+                errors.append(f"{logical}: missing required property {p}")
+        code = properties.get("Code", {}).get("ZipFile")
+        if code is not None:
+            if len(code.encode()) > MAX_ZIPFILE_BYTES:
+                errors.append(f"{logical}: inline code exceeds {MAX_ZIPFILE_BYTES} bytes")
+            try:
+                compile(code, logical, "exec")
+            except SyntaxError as e:
+                errors.append(f"{logical}: {e}")
+        timeout = properties.get("Timeout")
+        if timeout is not None and not 1 <= timeout <= MAX_LAMBDA_TIMEOUT:
+            errors.append(f"{logical}: timeout of {timeout} s, Lambda allows 1 to {MAX_LAMBDA_TIMEOUT}")
+        policies = properties.get("Policies")
+        if policies:
+            chars = sum(len(_policy_text(p.get("PolicyDocument", {}), parameters)) for p in policies)
+            if chars > MAX_ROLE_POLICY_CHARS:
+                errors.append(f"{logical}: inline policies have {chars} characters, IAM allows {MAX_ROLE_POLICY_CHARS} per role - use --all-things")
+
+    known = set(resources) | set(template.get("Parameters", {}))
+    for target in sorted(_references(template, set())):
+        if target not in known and not target.startswith("AWS::"):
+            errors.append(f"reference to undefined {target}")
+
+    size = len(json.dumps(template))
+    if size > MAX_TEMPLATE_BYTES:
+        errors.append(f"template is {size} bytes, CloudFormation allows {MAX_TEMPLATE_BYTES}")
+    return errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--manifest", required=True, help="badge manifest written by fleet.py")
+    parser.add_argument("--group", required=True, help="thing group / fleet attribute value")
+    parser.add_argument("--output", default="fleet_deploy.json", help="template file to write")
+    parser.add_argument("--no-thing-group", action="store_true", help="skip the dynamic thing group (no fleet indexing)")
+    parser.add_argument("--all-things", action="store_true", help="grant the Lambdas shadow access to thing/* instead of each badge (large fleets)")
+    args = parser.parse_args(argv)
+
+    with open(args.manifest) as f:
+        badges = json.load(f)["badges"]
+
+    template = generate(badges, args.group, thing_group=not args.no_thing_group, all_things=args.all_things)
+    errors = validate(template, badges)
+    if errors:
+        for e in errors:
+            print("ERROR", e)
+        return 1
+
+    body = json.dumps(template, indent=2)
+    with open(args.output, "w") as f:
+        f.write(body)
+    print(f"Wrote {args.output}: {len(badges)} badges, {len(template['Resources'])} resources")
+    if len(body) > MAX_INLINE_TEMPLATE_BYTES:
+        print(f"Template is larger than {MAX_INLINE_TEMPLATE_BYTES} bytes, deploy it from an S3 bucket")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
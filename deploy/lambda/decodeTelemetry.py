@@ -0,0 +1,58 @@
+import base64
+import boto3
+import json
+import logging
+import struct
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# checked against lib/demo_badge/telemetry.py by deploy/sync_lambda.py
+MAGIC = 0xEB
+SCHEMA_VERSION = 1
+FRAME_FORMAT = "<BBHIhHHhhhB"
+FIELDS = (
+  "sequence", "uptime_ms", "temperature", "humidity", "ambient_light",
+  "acceleration_x", "acceleration_y", "acceleration_z", "buttons",
+)
+
+def decode(data):
+  raw = base64.b64decode(data)
+  if len(raw) != struct.calcsize(FRAME_FORMAT) or raw[0] != MAGIC or raw[1] != SCHEMA_VERSION:
+    raise ValueError("unsupported telemetry frame")
+  frame = dict(zip(FIELDS, struct.unpack(FRAME_FORMAT, raw)[2:]))
+  for k in ("temperature", "humidity", "acceleration_x", "acceleration_y", "acceleration_z"):
+    frame[k] = frame[k] / 100
+  frame["ambient_light"] = float(frame["ambient_light"])
+  for i in range(3):
+    frame[f"button_{i + 1}"] = "pressed" if frame["buttons"] & (1 << i) else "not pressed"
+  del frame["buttons"]
+  return frame
+
+def lambda_handler(event, context):
+  logger.debug("event:\n{}".format(json.dumps(event, indent=2)))
+
+  try:
+    # the IoT rule delivers the non-JSON payload base64 encoded, and the badge already sends base64 text
+    frame = decode(base64.b64decode(event['data']))
+
+    client = boto3.client('iot')
+    response = client.describe_endpoint(endpointType="iot:Data-ats")
+    iot_endpoint = f"https://{response['endpointAddress']}"
+
+    client = boto3.client(
+      'iot-data', 
+      endpoint_url=iot_endpoint
+    )
+
+    reported_state = {k: v for k, v in frame.items() if k not in ("sequence", "uptime_ms")}
+    client.update_thing_shadow(
+      thingName=event['thing_name'],
+      shadowName="telemetry",
+      payload=json.dumps({"state": {"reported": reported_state}}).encode('utf-8')
+    )
+  except Exception as e:
+    logger.error("{}".format(e))
+    return({"decode_status":"failed"})
+
+  return({"decode_status":"success"})
@@ -0,0 +1,64 @@
+import boto3
+import json
+import logging
+import os
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+FLEET_ATTRIBUTE = os.environ.get("FLEET_ATTRIBUTE", "fleet")
+THING_GROUP = os.environ.get("THING_GROUP", "")
+TELEMETRY_SHADOW = os.environ.get("TELEMETRY_SHADOW", "telemetry")
+
+def fleet_things(iot):
+  # things are grouped by a thing attribute, which works without fleet indexing
+  things = []
+  kwargs = {"attributeName": FLEET_ATTRIBUTE, "attributeValue": THING_GROUP}
+  while True:
+    response = iot.list_things(**kwargs)
+    things += [t['thingName'] for t in response['things']]
+    if not response.get('nextToken'):
+      return things
+    kwargs['nextToken'] = response['nextToken']
+
+def reported_state(client, thing_name):
+  shadow = client.get_thing_shadow(thingName=thing_name)
+  reported = json.loads(shadow['payload'].read())['state'].get('reported', {})
+  try:
+    telemetry = client.get_thing_shadow(thingName=thing_name, shadowName=TELEMETRY_SHADOW)
+    reported.update(json.loads(telemetry['payload'].read())['state'].get('reported', {}))
+  except client.exceptions.ResourceNotFoundException:
+    pass # badge has not reported any telemetry yet
+  return reported
+
+def lambda_handler(event, context):
+  logger.debug("event:\n{}".format(json.dumps(event, indent=2)))
+
+  try:
+    iot = boto3.client('iot')
+    response = iot.describe_endpoint(endpointType="iot:Data-ats")
+    iot_endpoint = f"https://{response['endpointAddress']}"
+
+    client = boto3.client(
+      'iot-data', 
+      endpoint_url=iot_endpoint
+    )
+
+    things = fleet_things(iot)
+    thing = (event.get('queryStringParameters') or {}).get('thing')
+    if thing:
+      if thing not in things:
+        return("Unknown thing")
+      return(reported_state(client, thing))
+
+    fleet = {}
+    for thing_name in things:
+      try:
+        fleet[thing_name] = reported_state(client, thing_name)
+      except client.exceptions.ResourceNotFoundException:
+        fleet[thing_name] = {} # never connected
+  except Exception as e:
+    logger.error("{}".format(e))
+    return("An error occurred, try again later") 
+
+  return(fleet)
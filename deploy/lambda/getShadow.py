@@ -7,6 +7,7 @@ logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 THING_NAME = os.environ.get("THING_NAME", "")
+TELEMETRY_SHADOW = os.environ.get("TELEMETRY_SHADOW", "telemetry")
 
 def lambda_handler(event, context):
   logger.debug("event:\n{}".format(json.dumps(event, indent=2)))
@@ -24,8 +25,19 @@ def lambda_handler(event, context):
     shadow = client.get_thing_shadow(
         thingName=THING_NAME
     )
+    reported = json.loads(shadow['payload'].read())['state']['reported']
+
+    # sensor values are reported to a separate named shadow, see lib/demo_badge/shadows.py
+    try:
+      telemetry = client.get_thing_shadow(
+          thingName=THING_NAME,
+          shadowName=TELEMETRY_SHADOW
+      )
+      reported.update(json.loads(telemetry['payload'].read())['state'].get('reported', {}))
+    except client.exceptions.ResourceNotFoundException:
+      pass # badge has not reported any telemetry yet
   except Exception as e:
     logger.error("{}".format(e))
     return("An error occurred, try again later") 
 
-  return(json.loads(shadow['payload'].read())['state']['reported'])
\ No newline at end of file
+  return(reported)
\ No newline at end of file
@@ -0,0 +1,60 @@
+import boto3
+import json
+import logging
+import os
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+FLEET_ATTRIBUTE = os.environ.get("FLEET_ATTRIBUTE", "fleet")
+THING_GROUP = os.environ.get("THING_GROUP", "")
+
+def fleet_things(iot):
+  # things are grouped by a thing attribute, which works without fleet indexing
+  things = []
+  kwargs = {"attributeName": FLEET_ATTRIBUTE, "attributeValue": THING_GROUP}
+  while True:
+    response = iot.list_things(**kwargs)
+    things += [t['thingName'] for t in response['things']]
+    if not response.get('nextToken'):
+      return things
+    kwargs['nextToken'] = response['nextToken']
+
+def lambda_handler(event, context):
+  logger.info("event:\n{}".format(json.dumps(event, indent=2)))
+
+  try:
+    iot = boto3.client('iot')
+    response = iot.describe_endpoint(endpointType="iot:Data-ats")
+    iot_endpoint = f"https://{response['endpointAddress']}"
+
+    client = boto3.client(
+      'iot-data', 
+      endpoint_url=iot_endpoint
+    )
+
+    request = json.loads(event['body']) if event.get('body') else {}
+    config = request.get('active_button_config')
+    if not isinstance(config, int) or not 0 < config < 4:
+      return({"update_status":"failed"})
+
+    # update one badge, or fan out to every badge in the group
+    things = fleet_things(iot)
+    if request.get('thing'):
+      if request['thing'] not in things:
+        return({"update_status":"failed"})
+      things = [request['thing']]
+
+    desired_state = json.dumps({"state": {"desired": {"active_button_config": config}}}).encode('utf-8')
+    failed = []
+    for thing_name in things:
+      try:
+        client.update_thing_shadow(thingName=thing_name, payload=desired_state)
+      except Exception as e:
+        logger.error("{}: {}".format(thing_name, e))
+        failed.append(thing_name)
+  except Exception as e:
+    logger.error("{}".format(e))
+    return({"update_status":"failed"}) 
+
+  return({"update_status":"success" if not failed else "partial", "updated": len(things) - len(failed), "failed": failed})
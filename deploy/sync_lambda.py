@@ -0,0 +1,149 @@
+"""
+Keeps the inline Lambda code of demo_deploy.yaml identical to deploy/lambda/*.py.
+
+The files in deploy/lambda are the source: every `ZipFile: |` block of a function whose
+FunctionName has a file of the same name must match it. The telemetry decoder is also checked
+against lib/demo_badge/telemetry.py, by decoding frames packed with the badge's own encoder.
+
+  python deploy/sync_lambda.py          # check, exits with 1 if anything differs
+  python deploy/sync_lambda.py --write  # regenerate the inline copies from deploy/lambda
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+import types
+
+DEPLOY_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(DEPLOY_DIR, "lambda")
+TEMPLATE = os.path.join(DEPLOY_DIR, "demo_deploy.yaml")
+TELEMETRY = os.path.join(DEPLOY_DIR, "..", "lib", "demo_badge", "telemetry.py")
+ZIPFILE = "ZipFile: |"
+INDENT = 10 # of the code in demo_deploy.yaml
+
+
+def _indent(line):
+    return len(line) - len(line.lstrip(" "))
+
+
+def inline_blocks(lines):
+    """
+    Yields (function name, first line, end line) of every inline ZipFile block,
+    the FunctionName follows the Code property in the same resource.
+    """
+    i = 0
+    while i < len(lines):
+        if lines[i].strip() != ZIPFILE:
+            i += 1
+            continue
+        start = i + 1
+        end = start
+        while end < len(lines) and (not lines[end].strip() or _indent(lines[end]) >= INDENT):
+            end += 1
+        # trailing empty lines belong to the YAML, not the code
+        code_end = end
+        while code_end > start and not lines[code_end - 1].strip():
+            code_end -= 1
+        name = None
+        for line in lines[end:]:
+            if line.strip().startswith("FunctionName:"):
+                name = line.split(":", 1)[1].strip()
+                break
+            if _indent(line) <= 2 and line.strip():
+                break # next resource
+        yield name, start, code_end
+        i = end
+
+
+def lambda_source(name):
+    path = os.path.join(LAMBDA_DIR, f"{name}.py")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read().rstrip("\n").split("\n")
+
+
+def sync(write=False):
+    with open(TEMPLATE) as f:
+        lines = f.read().split("\n")
+
+    differ = []
+    # replace from the end, so the line numbers of earlier blocks stay valid
+    for name, start, end in reversed(list(inline_blocks(lines))):
+        source = lambda_source(name)
+        if source is None:
+            continue
+        inline = [line[INDENT:] for line in lines[start:end]]
+        if inline != source:
+            differ.append(name)
+            lines[start:end] = [(" " * INDENT + line) if line else "" for line in source]
+
+    if differ and write:
+        with open(TEMPLATE, "w") as f:
+            f.write("\n".join(lines))
+    return sorted(differ)
+
+
+def _load(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def check_decoder():
+    # the Lambda decoder must read what the badge encodes, field by field
+    errors = []
+    telemetry = _load("telemetry", TELEMETRY)
+    if importlib.util.find_spec("boto3") is None:
+        sys.modules["boto3"] = types.ModuleType("boto3") # only used inside lambda_handler
+    decoder = _load("decodeTelemetry", os.path.join(LAMBDA_DIR, "decodeTelemetry.py"))
+    for name in ("MAGIC", "SCHEMA_VERSION", "FRAME_FORMAT", "FIELDS"):
+        if getattr(decoder, name) != getattr(telemetry, name):
+            errors.append(f"decodeTelemetry.{name} differs from telemetry.{name}")
+
+    encoder = telemetry.TelemetryEncoder()
+    for args in (
+        (1234, 21.37, 45.5, 1843.0, (0.11, -0.23, 9.81), 0b101),
+        (0xFFFFFFFF, -40.0, 0.0, 0.0, (-327.68, 327.67, 0.0), 0),
+    ):
+        data = encoder.encode(*args)
+        expected = telemetry.decode(data)
+        expected.pop("schema_version")
+        expected.pop("buttons")
+        # lambda_handler() undoes the IoT rule's base64 first, decode() gets the badge's base64 text
+        try:
+            actual = decoder.decode(data)
+        except Exception as e:
+            errors.append(f"decodeTelemetry.decode() failed on a badge frame: {e}")
+            break
+        if actual != expected:
+            errors.append(f"decodeTelemetry.decode() returned {actual}, telemetry.decode() {expected}")
+    return errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--write", action="store_true", help="regenerate the inline Lambda code in demo_deploy.yaml")
+    args = parser.parse_args(argv)
+
+    differ = sync(write=args.write)
+    errors = check_decoder()
+    for name in differ:
+        if args.write:
+            print(f"Updated {name} in demo_deploy.yaml")
+        else:
+            errors.append(f"inline {name} in demo_deploy.yaml differs from lambda/{name}.py")
+    for e in errors:
+        print(e, file=sys.stderr)
+    if errors:
+        if differ and not args.write:
+            print("Run with --write to regenerate demo_deploy.yaml from deploy/lambda", file=sys.stderr)
+        return 1
+    print("Lambda code in sync")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,13 @@
-from .badge import Badge
-from .expresslink import readline
 from .hardware import *
 
+def __getattr__(name):
+    # Badge pulls in displayio and all peripheral drivers, so it is only imported when used
+    # (scripts that only need the pins or send_command() start faster)
+    if name == "Badge":
+        from .badge import Badge
+        return Badge
+    raise AttributeError(name)
+
 def welcome_message():
     import supervisor
     from demo_badge.provisioning import run
@@ -16,4 +22,8 @@ def send_command(uart, command, debug=True) -> str:
     c = command.strip() + "\n"
     print(">", command)
     uart.write(c.encode())
-    return readline(uart, debug=debug)
+    from .uart_framer import LineFramer
+    l = str(LineFramer(uart, size=1024).readline(), "utf-8")
+    if debug:
+        print("< " + l)
+    return l
@@ -6,19 +6,16 @@ import analogio
 import usb_cdc
 from adafruit_ticks import ticks_add, ticks_less, ticks_ms
 
-import adafruit_miniqr
 import adafruit_debouncer
-import adafruit_lis3dh
-import adafruit_sht31d
-import neopixel
-from adafruit_st7789 import ST7789
 from adafruit_bus_device.i2c_device import I2CDevice
 from adafruit_debouncer import _DEBOUNCED_STATE ,_CHANGED_STATE
 
+from .boot_timing import boot_timer
 from .hardware import *
 from .expresslink import ExpressLink
-from .nfc_nt3hxxxx import NT3Hxxxx
-from .qrcode import encode_qr_code
+from .led_frames import FramePlayer, compile_animation, compile_custom
+from .led_output import LEDOutput
+from .nfc_activity import NFCActivity
 from .simple_led import SimpleLED
 
 
@@ -27,48 +24,39 @@ class Badge:
         print("Demo Badge initializing...")
         self._first_update = True
 
-        self.display = self._init_display(display_init_screen)
-
-        i2c = busio.I2C(I2C_SCL, I2C_SDA)
-
-        try:
-            self.accelerometer = adafruit_lis3dh.LIS3DH_I2C(i2c, address=LIS3DH_I2C_ADDR)
-        except:
-            self.accelerometer = None
-            print("Error: Failed to init accelerometer device!")
+        # The default UART configuration shall be 115200, 8, N, 1
+        # (baud rate: 115200; data bits: 8; parity: none; stop bits: 1).
+        # There is no hardware or software flow control for UART communications.
+        # Buffer size to most likely to fit a certificate in PEM format.
+        # The module is reset first, and boots while the other peripherals are initialized.
+        # The first command waits until it answers, see ExpressLink.wait_ready().
+        self._expresslink_uart = busio.UART(EXPRESSLINK_TX, EXPRESSLINK_RX, baudrate=ExpressLink.BAUDRATE, receiver_buffer_size=4096)
+        self.expresslink = ExpressLink(self._expresslink_uart, event_pin=EXPRESSLINK_EVENT, wake_pin=EXPRESSLINK_WAKE, reset_pin=EXPRESSLINK_RESET, defer_ready=True)
 
-        try:
-            self.temperature_humidity = adafruit_sht31d.SHT31D(i2c, address=SHT30_I2C_ADDR)
-        except:
-            self.temperature_humidity = None
-            print("Error: Failed to init temperature_humidity device!")
+        # the display, LEDs, NFC tag and sensors are created on first use, see their properties
+        self._display = None
+        self._display_init_screen = display_init_screen
+        self._qr_screen = None
+        if display_init_screen:
+            self.display # shown right away, e.g. the logo while provisioning
 
-        try:
-            self.nfc_tag = NT3Hxxxx(I2CDevice(i2c, NFC_I2C_ADDR), NFC_FIELD_DETECT)
-            self.nfc_tag.write_register(1, 0xFF, 0x01) # set session register for LAST_NDEF_BLOCK to 0x01
-        except:
-            self.nfc_tag = None
-            print("Error: Failed to init nfc_tag device!")
-        self.nfc_tag_read = False
-        self._next_nfc_tag_read = ticks_ms()
+        i2c = self._i2c = busio.I2C(I2C_SCL, I2C_SDA)
+        self._accelerometer = None
+        self._temperature_humidity = None
+        self._nfc_tag = None
+        self._nfc_activity = None
 
         self.ambient_light = analogio.AnalogIn(AMBIENT_LIGHT_ANALOG)
 
         # Waveshare RP2040-Plus connects VSYS via a 200k/100k voltage divider to GP29/ADC3
         self.battery_voltage = analogio.AnalogIn(board.VOLTAGE_MONITOR)
 
-        self.leds = neopixel.NeoPixel(pin=NEOPIXEL_DATA, n=NEOPIXEL_CHAIN_LENGTH, brightness=0.2)
+        self._leds = None
         self.led_animation = None
+        self.led_animation_paused = False # e.g. to save battery, the LEDs keep the last frame
 
         self.back_led = SimpleLED(board.GP25)
 
-        # The default UART configuration shall be 115200, 8, N, 1
-        # (baud rate: 115200; data bits: 8; parity: none; stop bits: 1).
-        # There is no hardware or software flow control for UART communications.
-        # Buffer size to most likely to fit a certificate in PEM format.
-        self._expresslink_uart = busio.UART(EXPRESSLINK_TX, EXPRESSLINK_RX, baudrate=ExpressLink.BAUDRATE, receiver_buffer_size=4096)
-        self.expresslink = ExpressLink(self._expresslink_uart, event_pin=EXPRESSLINK_EVENT, wake_pin=EXPRESSLINK_WAKE, reset_pin=EXPRESSLINK_RESET)
-
         self._expresslink_debug_uart = None
         # self._expresslink_debug_uart = busio.UART(EXPRESSLINK_DEBUG_TX, EXPRESSLINK_DEBUG_RX, baudrate=115200, timeout=1, receiver_buffer_size=4096)
 
@@ -81,9 +69,70 @@ class Badge:
         self.button2 = user_button(BUTTON2)
         self.button3 = user_button(BUTTON3)
 
+        boot_timer.mark('badge')
         print("Demo Badge ready!")
 
+    @property
+    def display(self):
+        if self._display is None:
+            self._display = self._init_display(self._display_init_screen)
+            boot_timer.mark('display')
+        return self._display
+
+    @property
+    def leds(self):
+        if self._leds is None:
+            import neopixel
+            # all pixel and brightness changes are batched and sent in one transmission by update()
+            self._leds = LEDOutput(neopixel.NeoPixel(pin=NEOPIXEL_DATA, n=NEOPIXEL_CHAIN_LENGTH, brightness=0.2, auto_write=False))
+        return self._leds
+
+    @property
+    def nfc_tag(self):
+        if self._nfc_tag is None:
+            try:
+                from .nfc_nt3hxxxx import NT3Hxxxx
+                self._nfc_tag = NT3Hxxxx(I2CDevice(self._i2c, NFC_I2C_ADDR), NFC_FIELD_DETECT)
+                self._nfc_tag.write_register(1, 0xFF, 0x01) # set session register for LAST_NDEF_BLOCK to 0x01
+            except:
+                self._nfc_tag = False
+                print("Error: Failed to init nfc_tag device!")
+        return self._nfc_tag or None
+
+    @property
+    def nfc_activity(self):
+        if self._nfc_activity is None:
+            self._nfc_activity = NFCActivity(self.nfc_tag)
+        return self._nfc_activity
+
+    @property
+    def accelerometer(self):
+        if self._accelerometer is None:
+            try:
+                import adafruit_lis3dh
+                self._accelerometer = adafruit_lis3dh.LIS3DH_I2C(self._i2c, address=LIS3DH_I2C_ADDR)
+            except:
+                self._accelerometer = False
+                print("Error: Failed to init accelerometer device!")
+        return self._accelerometer or None
+
+    @property
+    def temperature_humidity(self):
+        if self._temperature_humidity is None:
+            try:
+                import adafruit_sht31d
+                self._temperature_humidity = adafruit_sht31d.SHT31D(self._i2c, address=SHT30_I2C_ADDR)
+            except:
+                self._temperature_humidity = False
+                print("Error: Failed to init temperature_humidity device!")
+        return self._temperature_humidity or None
+
+    @property
+    def nfc_tag_read(self) -> bool:
+        return self.nfc_activity.tag_read
+
     def _init_display(self, display_init_screen=None):
+        from adafruit_st7789 import ST7789
         displayio.release_displays()
         if hasattr(self, "spi") and self.spi:
             self.spi.deinit()
@@ -136,28 +185,29 @@ class Badge:
         else:
             self.expresslink.event_signal.update()
 
-        # FD pin is only useful when used as interrupt - otherwise a short pulse might be missed
-        self.nfc_tag.field_detect.update()
+        # NS_REG is only read over I2C after a field-detect edge, see NFCActivity
+        self.nfc_activity.update()
 
-        # read NS_REG register and extract NDEF_DATA_READ at bit7
-        if self.nfc_tag.read_register(6) & 0x80:
-            if ticks_less(self._next_nfc_tag_read, ticks_ms()):
-                # debounce the value if multiple reads occur within a short time, as is common on most smartphones
-                self.nfc_tag_read = True
-                self._next_nfc_tag_read = ticks_add(ticks_ms(), 500)
-        else:
-                self.nfc_tag_read = False
-
-        if self.led_animation:
+        if self.led_animation and not self.led_animation_paused:
             self.led_animation.animate()
+        if self._leds is not None:
+            self._leds.commit()
 
         self.back_led.update()
 
-    def show_qr_code(self, data: str="https://aws.amazon.com/iot-expresslink/", qr_type=6, error_correct=adafruit_miniqr.L) -> displayio.Group:
+    def show_qr_code(self, data: str="https://aws.amazon.com/iot-expresslink/", qr_type=6, error_correct=None, footer=None) -> displayio.Group:
         if not data.strip():
-            self.display.show(None)
+            self.display.show(footer)
             return
+        import adafruit_miniqr # import only on-demand, scenes render their QR codes once
+        from .qrcode import encode_qr_code
+        if error_correct is None:
+            error_correct = adafruit_miniqr.L
         try:
+            if footer:
+                # QR code on top, footer (e.g. a Dashboard) below - both stay on screen
+                qr_group = encode_qr_code(self.display, data, qr_type, error_correct, height=self.display.height - footer.height)
+                return self.show_qr_group(qr_group, footer)
             qr_group = encode_qr_code(self.display, data, qr_type, error_correct)
             self.display.show(qr_group)
             return qr_group
@@ -165,6 +215,20 @@ class Badge:
             print(e)
             return displayio.Group()
 
+    def show_qr_group(self, qr_group: displayio.Group, footer) -> displayio.Group:
+        # shows an already rendered QR code above the footer
+        screen = self._qr_screen
+        if screen is None or screen[-1] is not footer:
+            # a layer can only be part of one group, so the screen is kept and only the QR code is swapped
+            screen = self._qr_screen = displayio.Group()
+            screen.append(footer)
+        if len(screen) == 1 or screen[0] is not qr_group:
+            if len(screen) > 1:
+                screen.pop(0)
+            screen.insert(0, qr_group)
+        self.display.show(screen)
+        return screen
+
     def show_picture(self, name, force_fail=False):
         if name == 'none':
             self.display.show(None)
@@ -193,44 +257,18 @@ class Badge:
             return self.show_picture(name, True)
 
     def set_led_animation(self, animation):
-        # import each animation only on-demand to save memory
-
+        # animations are compiled once into a frame table, playback only copies bytes into the pixel buffer
         if animation == 'Static':
             self.led_animation = None
             self.leds.brightness = 0.3
-            self.leds.auto_write = True
-        elif animation == 'Blink':
-            from adafruit_led_animation.animation.blink import Blink
-            self.led_animation = Blink(self.leds, speed=0.2, color=0xff9900)
-        elif animation == 'SparklePulse':
-            from adafruit_led_animation.animation.sparklepulse import SparklePulse
-            self.led_animation = SparklePulse(self.leds, speed=0.1, color=0xff9900)
-        elif animation == 'Comet':
-            from adafruit_led_animation.animation.comet import Comet
-            self.led_animation = Comet(self.leds, speed=0.2, color=0xff9900, tail_length=2)
-            self.leds.brightness = 0.8
-        elif animation == 'Chase':
-            from adafruit_led_animation.animation.chase import Chase
-            self.led_animation = Chase(self.leds, speed=0.1, color=0xff9900, size=1, spacing=2)
-            self.leds.brightness = 0.2
-        elif animation == 'Pulse':
-            from adafruit_led_animation.animation.pulse import Pulse
-            self.led_animation = Pulse(self.leds, speed=0.1, color=0xff9900)
-        elif animation == 'Sparkle':
-            from adafruit_led_animation.animation.sparkle import Sparkle
-            self.led_animation = Sparkle(self.leds, speed=0.1, color=0xff9900)
-        elif animation == 'RainbowChase':
-            from adafruit_led_animation.animation.rainbowchase import RainbowChase
-            self.led_animation = RainbowChase(self.leds, speed=0.1, size=5, spacing=0, step=16)
-        elif animation == 'RainbowSparkle':
-            from adafruit_led_animation.animation.rainbowsparkle import RainbowSparkle
-            self.led_animation = RainbowSparkle(self.leds, speed=0.1)
-        elif animation == 'RainbowComet':
-            from adafruit_led_animation.animation.rainbowcomet import RainbowComet
-            self.led_animation = RainbowComet(self.leds, speed=0.1)
-        elif animation == 'ColorCycle':
-            from adafruit_led_animation.animation.colorcycle import ColorCycle
-            self.led_animation = ColorCycle(self.leds, speed=0.05)
-        elif animation == 'Rainbow':
-            from adafruit_led_animation.animation.rainbow import Rainbow
-            self.led_animation = Rainbow(self.leds, speed=0.05)
+            return
+
+        try:
+            if isinstance(animation, dict):
+                table = compile_custom(animation, NEOPIXEL_CHAIN_LENGTH)
+            else:
+                table = compile_animation(animation, NEOPIXEL_CHAIN_LENGTH)
+        except (ValueError, KeyError, TypeError) as e:
+            print("Invalid LED animation:", e)
+            return
+        self.led_animation = FramePlayer(self.leds, table)
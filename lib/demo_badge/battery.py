@@ -0,0 +1,148 @@
+from array import array
+from adafruit_ticks import ticks_add, ticks_diff, ticks_less, ticks_ms
+
+# LiPo open-circuit voltage to state of charge, linear in between
+SOC_CURVE = ((3.3, 0), (3.6, 10), (3.7, 30), (3.8, 55), (3.9, 70), (4.0, 85), (4.2, 100))
+EMPTY_VOLTAGE = SOC_CURVE[0][0]
+USB_VOLTAGE = 4.5 # VSYS above this means the badge is powered via USB
+
+# battery levels, each scales back reporting, LED brightness and animations a bit more
+NORMAL = 0
+SAVER = 1
+CRITICAL = 2
+SAVER_SOC = 40
+CRITICAL_SOC = 15
+HYSTERESIS_SOC = 5 # a level is only left again once the charge is this much above its threshold
+
+
+def battery_volts(analog_in, samples: int=1) -> float:
+    # Waveshare RP2040-Plus connects VSYS via a 200k/100k voltage divider to GP29/ADC3
+    total = 0
+    for _ in range(samples):
+        total += analog_in.value
+    return total / samples / 65535 * analog_in.reference_voltage * 3
+
+
+def state_of_charge(volts: float) -> int:
+    if volts <= SOC_CURVE[0][0]:
+        return 0
+    for i in range(1, len(SOC_CURVE)):
+        v, soc = SOC_CURVE[i]
+        if volts <= v:
+            v0, soc0 = SOC_CURVE[i - 1]
+            return int(soc0 + (soc - soc0) * (volts - v0) / (v - v0))
+    return 100
+
+
+class BatteryMonitor:
+    """
+    Samples the battery voltage every sample_interval_ms into a ring buffer, and fits a linear
+    discharge trend (least squares) over the buffer to estimate the time to empty.
+
+    on_level(level) is called whenever the battery level (NORMAL, SAVER, CRITICAL) changes, so
+    reporting, LED brightness and animations can be scaled back before the battery dies.
+    """
+
+    def __init__(self, analog_in, on_level=None, size: int=64, sample_interval_ms: int=30000, oversampling: int=16, min_trend_samples: int=8) -> None:
+        self.analog_in = analog_in
+        self.on_level = on_level
+        self.size = size
+        self.sample_interval_ms = sample_interval_ms
+        self.oversampling = oversampling
+        self.min_trend_samples = min_trend_samples
+
+        self._times = array('f', bytes(4 * size)) # seconds since start
+        self._volts = array('f', bytes(4 * size))
+        self._head = 0
+        self._count = 0
+        self._start = ticks_ms()
+        self._next_sample = self._start
+
+        self.volts = battery_volts(analog_in, oversampling)
+        self.level = NORMAL
+        self.samples = 0
+
+    @property
+    def usb_powered(self) -> bool:
+        return self.volts > USB_VOLTAGE
+
+    @property
+    def soc(self):
+        if self.usb_powered:
+            return None
+        return state_of_charge(self.volts)
+
+    def update(self) -> bool:
+        now = ticks_ms()
+        if ticks_less(now, self._next_sample):
+            return False
+        self._next_sample = ticks_add(now, self.sample_interval_ms)
+
+        self.volts = battery_volts(self.analog_in, self.oversampling)
+        self.samples += 1
+        if self.usb_powered:
+            # charging or on USB, an old discharge trend is meaningless
+            self._head = 0
+            self._count = 0
+        else:
+            self._times[self._head] = ticks_diff(now, self._start) / 1000
+            self._volts[self._head] = self.volts
+            self._head = (self._head + 1) % self.size
+            self._count = min(self._count + 1, self.size)
+        self._update_level()
+        return True
+
+    def _update_level(self):
+        soc = self.soc
+        if soc is None:
+            level = NORMAL
+        elif soc <= CRITICAL_SOC or (self.level == CRITICAL and soc <= CRITICAL_SOC + HYSTERESIS_SOC):
+            level = CRITICAL
+        elif soc <= SAVER_SOC or (self.level != NORMAL and soc <= SAVER_SOC + HYSTERESIS_SOC):
+            level = SAVER
+        else:
+            level = NORMAL
+        if level != self.level:
+            print(f"Battery: level {self.level} -> {level} at {soc}%")
+            self.level = level
+            if self.on_level:
+                self.on_level(level)
+
+    def trend(self):
+        # discharge rate in volts per hour, None until enough samples were taken
+        n = self._count
+        if n < self.min_trend_samples:
+            return None
+        t = self._times
+        v = self._volts
+        mean_t = 0.0
+        mean_v = 0.0
+        for i in range(n):
+            mean_t += t[i]
+            mean_v += v[i]
+        mean_t /= n
+        mean_v /= n
+        num = 0.0
+        den = 0.0
+        for i in range(n):
+            dt = t[i] - mean_t
+            num += dt * (v[i] - mean_v)
+            den += dt * dt
+        if den == 0:
+            return None
+        return num / den * 3600
+
+    def time_to_empty_h(self):
+        slope = self.trend()
+        if slope is None or slope >= 0 or self.usb_powered:
+            return None
+        return max(0.0, (self.volts - EMPTY_VOLTAGE) / -slope)
+
+    def stats(self) -> dict:
+        tte = self.time_to_empty_h()
+        return {
+            'battery_voltage': round(self.volts, 2),
+            'battery_soc': self.soc,
+            'battery_level': self.level,
+            'battery_time_to_empty_h': None if tte is None else round(tte, 1),
+        }
@@ -0,0 +1,42 @@
+from adafruit_ticks import ticks_diff, ticks_ms
+
+
+class BootTimer:
+    """
+    Records named milestones of the badge startup, e.g. imports done, display ready, ExpressLink
+    ready, connected, first shadow report.
+
+    Marks are ms since the timer was created, i.e. since code.py started importing. The raw
+    ticks of adafruit_ticks are no time since power-on: supervisor.ticks_ms() starts close to
+    2**29 so that it wraps soon after power-on, and only differences between ticks are meaningful.
+    """
+
+    def __init__(self) -> None:
+        self.start = ticks_ms()
+        self.marks = [] # (name, ms since start)
+
+    def mark(self, name: str) -> int:
+        t = ticks_diff(ticks_ms(), self.start)
+        self.marks.append((name, t))
+        return t
+
+    def done(self, name: str) -> bool:
+        for n, _ in self.marks:
+            if n == name:
+                return True
+        return False
+
+    def report(self) -> dict:
+        # milestone -> ms since start, in order
+        return {name: t for name, t in self.marks}
+
+    def print_report(self):
+        print("Boot timing (ms since start, +ms since previous milestone):")
+        previous = 0
+        for name, t in self.marks:
+            print(f"  {name:<24} {t:>7} {t - previous:>+7}")
+            previous = t
+
+
+# shared by the library and code.py, so every stage can add its milestone
+boot_timer = BootTimer()
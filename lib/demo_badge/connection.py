@@ -0,0 +1,146 @@
+import random
+from adafruit_ticks import ticks_add, ticks_diff, ticks_less, ticks_ms
+
+from .expresslink import Event
+
+DISCONNECTED = 0
+CONNECTING = 1
+CONNECTED = 2
+
+
+class ConnectionManager:
+    """
+    Non-blocking connection state machine on top of ExpressLink.
+
+    CONNECT! returns immediately and the result arrives as a CONNECT event. Failed attempts and
+    lost connections are retried with jittered exponential backoff. on_connected(first) is called
+    after every successful connect, to re-initialise shadows and topics.
+    """
+
+    def __init__(self, el, on_connected=None, base_backoff_ms: int=1000, max_backoff_ms: int=60000, connect_timeout_ms: int=60000) -> None:
+        self.el = el
+        self.on_connected = on_connected
+        self.base_backoff_ms = base_backoff_ms
+        self.max_backoff_ms = max_backoff_ms
+        self.connect_timeout_ms = connect_timeout_ms
+
+        self.state = DISCONNECTED
+        self._failures = 0
+        self._next_attempt = ticks_ms()
+        self._attempt_start = ticks_ms()
+        self._disconnected_at = ticks_ms()
+        self._last_tick = ticks_ms()
+
+        self.connects = 0
+        self.reconnects = 0
+        self.failed_attempts = 0
+        self.last_reconnect_latency_ms = None
+        self.session_uptime_ms = 0
+        self.total_uptime_ms = 0
+
+    @property
+    def connected(self) -> bool:
+        return self.state == CONNECTED
+
+    def _schedule_retry(self, now):
+        delay = min(self.max_backoff_ms, self.base_backoff_ms * (1 << min(self._failures, 16)))
+        # full jitter in the upper half, so a room full of badges does not reconnect in lockstep
+        delay = int(delay * (0.5 + random.random() / 2))
+        self._failures += 1
+        self._next_attempt = ticks_add(now, delay)
+        self.state = DISCONNECTED
+        print(f"ExpressLink: next connection attempt in {delay} ms")
+
+    def _connected(self, now):
+        if self.connects:
+            self.reconnects += 1
+            self.last_reconnect_latency_ms = ticks_diff(now, self._disconnected_at)
+        first = self.connects == 0
+        self.connects += 1
+        self._failures = 0
+        self.session_uptime_ms = 0
+        self.state = CONNECTED
+        if self.on_connected:
+            self.on_connected(first)
+
+    def _lost(self, now):
+        if self.state == CONNECTED:
+            self._disconnected_at = now
+        self._schedule_retry(now)
+
+    def update(self):
+        now = ticks_ms()
+        elapsed = ticks_diff(now, self._last_tick)
+        self._last_tick = now
+
+        if self.state == CONNECTED:
+            self.session_uptime_ms += elapsed
+            self.total_uptime_ms += elapsed
+        elif self.state == DISCONNECTED:
+            if not ticks_less(now, self._next_attempt):
+                success, line, err = self.el.connect(non_blocking=True)
+                if success:
+                    self.state = CONNECTING
+                    self._attempt_start = now
+                else:
+                    print(f"Unable to connect: {err} {line}")
+                    self.failed_attempts += 1
+                    self._schedule_retry(now)
+        elif self.state == CONNECTING:
+            if ticks_diff(now, self._attempt_start) > self.connect_timeout_ms:
+                # no CONNECT event arrived, ask the module directly
+                try:
+                    is_connected, _ = self.el.connected
+                except ValueError:
+                    is_connected = False
+                if is_connected:
+                    self._connected(now)
+                else:
+                    self.failed_attempts += 1
+                    self._schedule_retry(now)
+
+    def sleep(self, duration_s: int):
+        # ExpressLink drops the connection during SLEEP, reconnect once the duration is over
+        now = ticks_ms()
+        if self.state == CONNECTED:
+            self._disconnected_at = now
+        self.state = DISCONNECTED
+        self._failures = 0
+        self._next_attempt = ticks_add(now, duration_s * 1000)
+
+    def wake(self):
+        if self.state == DISCONNECTED:
+            self._next_attempt = ticks_ms()
+
+    def handle_event(self, event_id, parameter) -> bool:
+        now = ticks_ms()
+        if event_id == Event.CONNECT:
+            # parameter is the connection hint, 0 means connected
+            if parameter == 0:
+                self._connected(now)
+            else:
+                print(f"ExpressLink connection failed, hint {parameter}")
+                self.failed_attempts += 1
+                self._schedule_retry(now)
+        elif event_id == Event.CONLOST:
+            print("ExpressLink connection lost")
+            self._lost(now)
+        elif event_id == Event.STARTUP:
+            # the module (re)started, any previous connection is gone
+            if self.state == CONNECTED:
+                self._lost(now)
+            return False # others might need to know about a module restart as well
+        else:
+            return False
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'connected': self.connected,
+            'connects': self.connects,
+            'reconnects': self.reconnects,
+            'failed_attempts': self.failed_attempts,
+            'session_uptime_ms': self.session_uptime_ms,
+            'total_uptime_ms': self.total_uptime_ms,
+            'last_reconnect_latency_ms': self.last_reconnect_latency_ms,
+        }
@@ -0,0 +1,120 @@
+import displayio
+import terminalio
+from adafruit_display_text import label
+from adafruit_displayio_layout.layouts.grid_layout import GridLayout
+from adafruit_ticks import ticks_diff, ticks_ms
+
+from .text import NumericField
+
+
+class Field:
+    """
+    A fixed-width text cell. The text is padded to `width` characters of a monospaced font,
+    so its bounding box never changes and only this cell is redrawn when the value changes.
+    """
+
+    def __init__(self, name: str, width: int, fmt: str="{}", color=0xFFFFFF, font=terminalio.FONT, scale: int=1) -> None:
+        self.name = name
+        self.width = width
+        self.fmt = fmt
+        self.text = " " * width
+        self.label = label.Label(font, text=self.text, color=color, scale=scale)
+        glyph_width, glyph_height = font.get_bounding_box()[:2]
+        self.pixels = width * glyph_width * glyph_height * scale * scale
+        self.changed_pixels = self.pixels
+
+    def set(self, value) -> bool:
+        text = self.fmt.format(value) if value is not None else ""
+        if len(text) > self.width:
+            text = text[:self.width]
+        elif len(text) < self.width:
+            text = text + " " * (self.width - len(text))
+        if text == self.text:
+            return False
+        self.text = text
+        self.label.text = text
+        return True
+
+
+class Dashboard(displayio.Group):
+    """
+    A grid of fixed-width fields on top of adafruit_displayio_layout.
+
+    fields: list of (name, width, fmt) tuples, laid out row by row in `columns` columns.
+    Only changed fields are marked dirty, and refresh() reports the time of each frame and an
+    estimate of the pixels it pushed: the changed cells times their area. displayio does not
+    expose the real dirty area, and with auto_refresh on it may also redraw other groups.
+
+    With a font (see text.load_font), fields are NumericFields drawn from pre-rendered character
+    tiles, so only the changed characters of a field are redrawn instead of its whole label.
+    """
+
+    def __init__(self, fields, x: int=0, y: int=0, width: int=240, height: int=40, columns: int=1, color=0xFFFFFF, background=None, font=None) -> None:
+        super().__init__(x=x, y=y)
+        self.width = width
+        self.height = height
+        self.fields = {}
+        self._dirty_pixels = 0
+
+        self.refreshes = 0
+        self.last_refresh_ms = 0
+        self.last_refresh_pixels_estimate = 0
+        self.max_refresh_ms = 0
+
+        if background is not None:
+            palette = displayio.Palette(1)
+            palette[0] = background
+            self.append(displayio.TileGrid(displayio.Bitmap(width, height, 1), pixel_shader=palette))
+
+        rows = (len(fields) + columns - 1) // columns
+        self.layout = GridLayout(x=0, y=0, width=width, height=height, grid_size=(columns, rows), cell_padding=1)
+        for i, f in enumerate(fields):
+            name, field_width = f[0], f[1]
+            fmt = f[2] if len(f) > 2 else "{}"
+            if font:
+                field = content = NumericField(font, field_width, fmt, color=color, name=name)
+            else:
+                field = Field(name, field_width, fmt, color=color)
+                content = field.label
+            self.fields[name] = field
+            self.layout.add_content(content, grid_position=(i % columns, i // columns), cell_size=(1, 1))
+        self.append(self.layout)
+
+    def __getitem__(self, name):
+        return self.fields[name]
+
+    def set(self, name: str, value) -> bool:
+        field = self.fields[name]
+        if field.set(value):
+            self._dirty_pixels += field.changed_pixels
+            return True
+        return False
+
+    def update(self, values: dict):
+        for name, value in values.items():
+            if name in self.fields:
+                self.set(name, value)
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty_pixels > 0
+
+    def refresh(self, display) -> bool:
+        if not self._dirty_pixels:
+            return False
+        start = ticks_ms()
+        display.refresh(minimum_frames_per_second=0)
+        self.last_refresh_ms = ticks_diff(ticks_ms(), start)
+        self.max_refresh_ms = max(self.max_refresh_ms, self.last_refresh_ms)
+        self.last_refresh_pixels_estimate = self._dirty_pixels
+        self.refreshes += 1
+        self._dirty_pixels = 0
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'refreshes': self.refreshes,
+            'last_refresh_ms': self.last_refresh_ms,
+            'max_refresh_ms': self.max_refresh_ms,
+            'last_refresh_pixels_estimate': self.last_refresh_pixels_estimate,
+        }
@@ -4,53 +4,33 @@ except ImportError:
     pass
 
 import time
-import re
 import digitalio
-from collections import namedtuple
+from array import array
 from adafruit_debouncer import Debouncer
+from adafruit_ticks import ticks_add, ticks_diff, ticks_less, ticks_ms
 
+from .boot_timing import boot_timer
+from .responses import NO_EVENT, Event, parse_connect, parse_event, parse_ota, parse_time, parse_where
+from .uart_framer import LineFramer
 
-def readline(uart, debug=False, delay=True) -> str:
-    if delay:
-        time.sleep(0.1) # give it a bit of time to accumulate data - it might crash or loose bytes without it!
-
-    l = b""
-    counter = 300 # or ExpressLink.TIMEOUT
-    for _ in range(counter):
-        p = uart.readline()
-        if p:
-            l += p
-        if l.endswith("\n"):
-            break
-    else:
-        print("Expresslink uart timeout - response might be incomplete.")
-
-    l = l.decode().strip("\r\n\x00\xff\xfe\xfd\xfc\xfb\xfa")
-    if debug:
-        print("< " + l)
-    return l
-
-
-class Event:
-    MSG = 1 # parameter = topic index. A message was received on topic #.
-    STARTUP = 2 # parameter = 0. The module has entered the active state.
-    CONLOST = 3 # parameter = 0. Connection unexpectedly lost.
-    OVERRUN = 4 # parameter = 0. Receive buffer Overrun (topic in detail).
-    OTA = 5 # parameter = 0. OTA event (see OTA? command for details).
-    CONNECT = 6 # parameter = Connection Hint. Connection established or failed.
-    CONFMODE = 7 # parameter = 0. CONFMODE exit with success.
-    SUBACK = 8 # parameter = Topic Index. Subscription accepted.
-    SUBNACK = 9 # parameter = Topic Index. Subscription rejected.
-    # 10..19 RESERVED
-    SHADOW_INIT = 20 # parameter = Shadow Index. Shadow initialization successfully.
-    SHADOW_INIT_FAILED = 21 # parameter = Shadow Index. Shadow initialization failed.
-    SHADOW_DOC = 22 # parameter = Shadow Index. Shadow document received.
-    SHADOW_UPDATE = 23 # parameter = Shadow Index. Shadow update result received.
-    SHADOW_DELTA = 24 # parameter = Shadow Index. Shadow delta update received.
-    SHADOW_DELETE = 25 # parameter = Shadow Index. Shadow delete result received
-    SHADOW_SUBACK = 26 # parameter = Shadow Index. Shadow delta subscription accepted.
-    SHADOW_SUBNACK = 27 # parameter = Shadow Index. Shadow delta subscription rejected.
-    # <= 999 RESERVED
+
+def _startswith(line, prefix) -> bool:
+    # works on memoryview slices, which cannot be compared to bytes on CircuitPython
+    if len(line) < len(prefix):
+        return False
+    for i in range(len(prefix)):
+        if line[i] != prefix[i]:
+            return False
+    return True
+
+
+def _digits(line, i):
+    # parses an optional decimal number at line[i:], returns (index after it, number or 0)
+    n = 0
+    while i < len(line) and 0x30 <= line[i] <= 0x39:
+        n = n * 10 + line[i] - 0x30
+        i += 1
+    return i, n
 
 
 # https://docs.aws.amazon.com/iot-expresslink/latest/programmersguide/elpg-ota-updates.html#elpg-ota-commands
@@ -63,6 +43,94 @@ class OTACodes:
     NewHostImageReady = 5 # A new host image has arrived. The signature has been verified and the ExpressLink module is ready to read its contents to the host. The size of the file is indicated in the response detail. (Also, an event was generated.)
 
 
+class Metrics:
+    """
+    Per-verb command statistics: call count, errors, timeouts and a latency histogram.
+    The verb is the command without indices and arguments, e.g. SHADOW UPDATE, EVENT?, CONF?, SEND.
+    """
+    # upper bounds of the latency buckets in ms, the last bucket counts everything slower
+    BUCKETS_MS = (100, 150, 200, 300, 500, 1000, 2000, 5000, 10000)
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self):
+        self._verbs = {} # verb -> [count, errors, timeouts, total_ms, max_ms]
+        self._histograms = {} # verb -> array of len(BUCKETS_MS) + 1 counters
+        self.commands = 0
+        self.timeouts = 0
+        self.overlong = 0
+        self.parse_failures = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @staticmethod
+    def _word(s, start):
+        end = s.find(" ", start)
+        return end if end >= 0 else len(s)
+
+    @staticmethod
+    def verb(s: str) -> str:
+        # only the first words are looked at, so large payloads are not split or copied
+        end = Metrics._word(s, 0)
+        verb = s[:end].rstrip("0123456789")
+        if (verb == "SHADOW" or verb == "OTA") and end < len(s):
+            end2 = Metrics._word(s, end + 1)
+            word = s[end + 1:end2]
+            verb += " " + word
+            if word == "GET" and end2 < len(s):
+                verb += " " + s[end2 + 1:Metrics._word(s, end2 + 1)]
+        return verb
+
+    def record(self, verb: str, ms: int, success: bool, timeouts: int):
+        entry = self._verbs.get(verb)
+        if entry is None:
+            entry = self._verbs[verb] = [0, 0, 0, 0, 0]
+            self._histograms[verb] = array('L', [0] * (len(self.BUCKETS_MS) + 1))
+        entry[0] += 1
+        if not success:
+            entry[1] += 1
+        entry[2] += timeouts
+        entry[3] += ms
+        if ms > entry[4]:
+            entry[4] = ms
+        buckets = self.BUCKETS_MS
+        i = 0
+        while i < len(buckets) and ms > buckets[i]:
+            i += 1
+        self._histograms[verb][i] += 1
+        self.commands += 1
+
+    def stats(self) -> dict:
+        # compact keys, so the snapshot fits into a single MQTT message
+        verbs = {}
+        for verb, (count, errors, timeouts, total_ms, max_ms) in self._verbs.items():
+            verbs[verb] = {
+                'n': count,
+                'err': errors,
+                'to': timeouts,
+                'avg': total_ms // count,
+                'max': max_ms,
+                'h': list(self._histograms[verb]),
+            }
+        return {
+            'commands': self.commands,
+            'timeouts': self.timeouts,
+            'overlong': self.overlong,
+            'parse_failures': self.parse_failures,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'buckets_ms': self.BUCKETS_MS,
+            'verbs': verbs,
+        }
+
+    def print_stats(self):
+        print(f"ExpressLink: {self.commands} commands, {self.timeouts} timeouts, {self.parse_failures} parse failures, {self.bytes_out} bytes out, {self.bytes_in} bytes in")
+        print(f"{'verb':20} count errors timeouts avg_ms max_ms histogram (ms <= {self.BUCKETS_MS})")
+        for verb, (count, errors, timeouts, total_ms, max_ms) in self._verbs.items():
+            print(f"{verb:20} {count:5} {errors:6} {timeouts:8} {total_ms // count:6} {max_ms:6} {list(self._histograms[verb])}")
+
+
 class Config:
     def __init__(self, el) -> None:
         self.el = el
@@ -229,14 +297,25 @@ class ExpressLink:
     No command can take more than 120 seconds to complete (the maximum time for a TCP connection timeout).
     """
     TIMEOUT = 100 # CircuitPython has a maxium of 100 seconds.
-
-    def __init__(self, uart, event_pin=None, wake_pin=None, reset_pin=None, default_uart_config=True, debug=True) -> None:
+    RESPONSE_TIMEOUT_MS = 30000 # waiting for a response line, the UART itself times out after 0.1s
+    RESET_PULSE_MS = 20 # reset held low, the module boots after it is released
+    BOOT_TIMEOUT_MS = 5000 # after releasing reset, the module is polled with AT until it answers
+    BOOT_POLL_MS = 200
+
+    def __init__(self, uart, event_pin=None, wake_pin=None, reset_pin=None, default_uart_config=True, debug=True, defer_ready=False) -> None:
+        """
+        The constructor resets the module with a short pulse. With defer_ready it returns right
+        away: the module boots while the caller initialises other peripherals, and wait_ready()
+        polls until it answers on the first command (or when called explicitly).
+        """
         print("ExpressLink initializing...")
 
         self.uart = uart
         self.config = Config(self)
         self.debug = debug
-        self._topics = {}
+        self.metrics = Metrics()
+        # responses are framed in place in one buffer, sized like the UART receive buffer
+        self._framer = LineFramer(uart, size=4096, metrics=self.metrics)
 
         if default_uart_config:
             self.uart.baudrate = self.BAUDRATE
@@ -266,23 +345,60 @@ class ExpressLink:
         else:
             self.wake_signal = None
 
+        self._ready = None # None while the module still boots
+        self._boot_start = None # ticks when reset was released
         if reset_pin:
             self.reset_signal = digitalio.DigitalInOut(reset_pin)
             self.reset_signal.direction = digitalio.Direction.OUTPUT
-            self.reset_signal.value = False
-            time.sleep(1.00)
-            self.reset_signal.value = True
-            time.sleep(2.00)
+            self._pulse_reset()
         else:
             self.reset_signal = None
 
-        if not self.self_test():
-            print("ERROR: Failed ExpressLink UART self-test check!")
-            self.ready = False
+        if not defer_ready:
+            self.wait_ready()
+
+    @property
+    def ready(self) -> bool:
+        return self.wait_ready()
+
+    def _pulse_reset(self):
+        self.reset_signal.value = False
+        time.sleep(self.RESET_PULSE_MS / 1000)
+        self.reset_signal.value = True
+        self._boot_start = ticks_ms()
+
+    def wait_ready(self) -> bool:
+        # completes a pending reset: polls until the module, booting since the reset, answers
+        if self._ready is not None:
+            return self._ready
+        self._ready = False # no recursion through cmd()
+        if self._boot_start is not None:
+            self._ready = self._poll_boot()
         else:
-            self.ready = True
+            self._ready = self.self_test()
 
+        if not self._ready:
+            print("ERROR: Failed ExpressLink UART self-test check!")
+        boot_timer.mark('expresslink')
         print("ExpressLink ready!")
+        return self._ready
+
+    def _poll_boot(self) -> bool:
+        # instead of a fixed boot delay, ask until the module answers OK
+        start = self._boot_start
+        self._boot_start = None
+        deadline = ticks_add(start, self.BOOT_TIMEOUT_MS)
+        while True:
+            self.uart.reset_input_buffer()
+            self._framer.reset()
+            self.uart.write(b"AT\n")
+            line = self._framer.readline(self.BOOT_POLL_MS, quiet=True)
+            if bytes(line) == b"OK":
+                if self.debug:
+                    print(f"ExpressLink booted {ticks_diff(ticks_ms(), start)} ms after reset.")
+                return True
+            if not ticks_less(ticks_ms(), deadline):
+                return False
 
     def self_test(self):
         for _ in range(5):
@@ -290,8 +406,10 @@ class ExpressLink:
                 if self.debug:
                     print("ExpressLink: performing self-test...")
                 self.uart.write(b"AT\n")
-                r = readline(self.uart, self.debug)
-                if r.strip() == "OK":
+                r = str(self._framer.readline(self.RESPONSE_TIMEOUT_MS), "utf-8")
+                if self.debug:
+                    print("< " + r)
+                if r == "OK":
                     if self.debug:
                         print("ExpressLink UART self-test successful.")
                     return True
@@ -300,58 +418,83 @@ class ExpressLink:
                     print("ExpressLink self-test error:", e)
         return False
 
-    def cmd(self, s: str) -> Tuple[bool, str, Optional[int]]:
+    def cmd(self, s: str, payload=None) -> Tuple[bool, str, Optional[int]]:
         assert s
+        if self._ready is None:
+            self.wait_ready()
+
+        metrics = self.metrics
+        start = ticks_ms()
+        timeouts = metrics.timeouts
 
         # clear any previous un-read input data
         self.uart.reset_input_buffer()
+        self._framer.reset()
 
         # see command format definition
         # https://docs.aws.amazon.com/iot-expresslink/latest/programmersguide/elpg-commands.html#elpg-commands-format
-        self.uart.write(f"AT+{s}\r\n".encode())
-        if self.debug:
-            print("> AT+" + s)
-
+        if payload is None:
+            data = f"AT+{s}\r\n".encode()
+            self.uart.write(data)
+            metrics.bytes_out += len(data)
+            if self.debug:
+                print("> AT+" + s)
+        else:
+            # pre-encoded payload (bytes, bytearray or memoryview) is appended without copying it into a str
+            data = s.encode()
+            self.uart.write(b"AT+")
+            self.uart.write(data)
+            self.uart.write(payload)
+            self.uart.write(b"\r\n")
+            metrics.bytes_out += len(data) + len(payload) + 5
+            if self.debug:
+                print("> AT+" + s + bytes(payload).decode())
+
+        success, l, error_code = self._response()
+        metrics.record(Metrics.verb(s), ticks_diff(ticks_ms(), start), success, metrics.timeouts - timeouts)
+        return success, l, error_code
+
+    def _response(self) -> Tuple[bool, str, Optional[int]]:
         # see command response format definition
         # https://docs.aws.amazon.com/iot-expresslink/latest/programmersguide/elpg-commands.html#elpg-responses-formats
-        l = readline(self.uart, self.debug)
+        line = self._framer.readline(self.RESPONSE_TIMEOUT_MS) # waits for the complete line
+        if self.debug:
+            print("< " + str(line, "utf-8"))
 
         success = False
         additional_lines = 0
         error_code = None
-        if l.startswith("OK"):
+        if _startswith(line, b"OK"):
             success = True
-            l = l[2:] # consume the OK prefix
-
             # optional numerical suffix [#] indicates the number of additional output lines,
             # with no additional lines expected if this suffix is omitted.
-            r = l.find(" ")
-            if r > 0:
-                additional_lines = int(l[0:r])
-                l = l[r:]
-        elif l.startswith("ERR"):
-            l = l[3:] # consume the ERR prefix
-            r = l.find(" ")
-            if r > 0:
-                # https://docs.aws.amazon.com/iot-expresslink/latest/programmersguide/elpg-commands.html#elpg-table1
-                error_code = int(l[0:r])
-                l = l[r:]
-            else:
+            i, additional_lines = _digits(line, 2)
+            l = str(line[i:], "utf-8")
+        elif _startswith(line, b"ERR"):
+            # https://docs.aws.amazon.com/iot-expresslink/latest/programmersguide/elpg-commands.html#elpg-table1
+            i, error_code = _digits(line, 3)
+            l = str(line[i:], "utf-8")
+            if i == 3:
+                self.metrics.parse_failures += 1
                 print(f"failed to parse error code: {len(l)} | {l}")
                 return False, l, 2
         else:
+            l = str(line, "utf-8")
+            self.metrics.parse_failures += 1
             print(f"unexpected response: {len(l)} | {l}")
             return False, l, 2
 
-        # read as many additional lines as needed, and concatenate them
-        for _ in range(additional_lines):
-            al = readline(self.uart, debug=False, delay=False)
-            if not al:
-                break
-            l += "\n" + al
+        # read all additional lines at once, they arrive as one block in the framer buffer
+        if additional_lines:
+            lines = self._framer.readlines(additional_lines, self.RESPONSE_TIMEOUT_MS)
+            if lines:
+                l += "\n" + str(lines, "utf-8").replace("\r", "")
 
         return success, l.strip(), error_code
 
+    def stats(self) -> dict:
+        return self.metrics.stats()
+
     def info(self):
         # see configuration dictionary
         # https://docs.aws.amazon.com/iot-expresslink/latest/programmersguide/elpg-configuration-dictionary.html
@@ -384,10 +527,8 @@ class ExpressLink:
 
     def reset(self):
         if self.reset_signal:
-            self.reset_signal.value = False
-            time.sleep(1.00)
-            self.reset_signal.value = True
-            time.sleep(2.00)
+            self._pulse_reset()
+            self._poll_boot()
         # double reset is twice as good (AT commands might be stuck, so hardware reset + software reset)
         return self.cmd("RESET")
 
@@ -404,54 +545,35 @@ class ExpressLink:
     @property
     def connected(self) -> Tuple[bool, bool]:
         success, line, err = self.cmd("CONNECT?")
-        if not success:
+        state = parse_connect(line) if success else None
+        if not state:
             raise ValueError(f"CONNECT? {err} {line}")
-        r = line.split(" ")
-        is_connected = False
-        if r[0] == "1":
-            is_connected = True
-        is_customer_account = False
-        if r[1] == "1":
-            is_customer_account = True
-        return is_connected, is_customer_account
+        return state.connected, state.customer_account
 
     @property
     def time(self):
         success, line, _ = self.cmd("TIME?")
-        if not success or not line.startswith("date"):
+        if not success:
             return None
-
         # {date YYYY/MM/DD} {time hh:mm:ss.xx} {source}
         # date 2022/10/30 time 09:38:34.04 SNTP
-        dt = namedtuple("datetime", ("year", "month", "day", "hour", "minute", "second", "microsecond", "source"))
-        return dt(
-            year=int(line[5:9]),
-            month=int(line[10:12]),
-            day=int(line[13:15]),
-            hour=int(line[21:23]),
-            minute=int(line[24:26]),
-            second=int(line[27:29]),
-            microsecond=int(line[30:32]) * 10**4,
-            source=line[33:]
-        )
+        return parse_time(line)
 
     @property
     def where(self):
         success, line, _ = self.cmd("WHERE?")
-        if not success or not line.startswith("date"):
+        if not success:
             return None
         # {date} {time} {lat} {long} {elev} {accuracy} {source}
-        return line
+        return parse_where(line)
 
     @property
     def ota_state(self):
-        _, line, _ = self.cmd("OTA?")
-        r = line.split(" ", 1)
-        code = int(r[0])
-        detail = None # detail is optional
-        if len(r) == 2:
-            detail = r[1]
-        return code, detail
+        success, line, _ = self.cmd("OTA?")
+        if not success:
+            return None
+        # {code} {detail}
+        return parse_ota(line)
 
     def ota_accept(self):
         return self.cmd("OTA ACCEPT")
@@ -475,7 +597,7 @@ class ExpressLink:
         # OK [{event_identifier} {parameter} {mnemonic [detail]}]{EOL}
         success, line, _ = self.cmd("EVENT?")
         if (success and not line) or not success:
-            return None, None, None, None
+            return NO_EVENT
 
         if self.event_signal: # update signal state after getting an event and debounce signal
             self.event_signal.update()
@@ -483,8 +605,7 @@ class ExpressLink:
             self.event_signal.update()
 
         # https://docs.aws.amazon.com/iot-expresslink/latest/programmersguide/elpg-event-handling.html
-        event_id, parameter, mnemonic, detail = re.match("(\d+) (\d+) (\S+)( \S+)?", line).groups()
-        return int(event_id), int(parameter), mnemonic, detail
+        return parse_event(line)
 
     def wait_for_event(self, polling=None):
         if polling:
@@ -503,29 +624,23 @@ class ExpressLink:
                     print("ExpressLink: event signal pin not defined.")
                     return None, None, None, None
 
-    @property
-    def topics(self):
-        return self._topics.copy()
+    # topic names and their TopicN indices are kept by TopicManager (topics.py), the only topic map
 
-    def subscribe(self, topic_index, topic_name):
-        topic_name = topic_name.strip()
-        self._topics[topic_index] = topic_name
-        self.config.set_topic(topic_index, topic_name)
+    def subscribe(self, topic_index: int, topic_name: str=None):
+        if topic_name is not None:
+            self.config.set_topic(topic_index, topic_name.strip())
         return self.cmd(f"SUBSCRIBE{topic_index}")
 
-    def unsubscribe(self, *, topic_name=None, topic_index=None):
-        if topic_name:
-            topic_index = self._topics.values().index(topic_name)
-        if topic_index:
-            del self._topics[topic_index]
+    def unsubscribe(self, topic_index: int):
         return self.cmd(f"UNSUBSCRIBE{topic_index}")
 
-    def get_message(self, topic_index=None, topic_name=None):
-        if topic_name:
-            topic_index = self._topics.values().index(topic_name)
-        elif topic_index and topic_index > 0:
-            topic_name = self._topics[topic_index]
-        elif topic_index is None:
+    def get_message(self, topic_index=None):
+        """
+        Without topic_index: the next pending message of any topic, as (topic_name, message),
+        or (True, None) if there is none.
+        With topic_index: (True, message) for the next message of that topic, or (False, error code).
+        """
+        if topic_index is None:
             topic_index = ''
 
         success, line, error_code = self.cmd(f"GET{topic_index}")
@@ -539,7 +654,7 @@ class ExpressLink:
         else:
             # indicated topic with index
             if success:
-                return topic_name, line
+                return True, line
             else:
                 return False, error_code
 
@@ -555,8 +670,10 @@ class ExpressLink:
     def shadow_get_doc(self, index: Union[int, str]=''):
         return self.cmd(f"SHADOW{index} GET DOC")
 
-    def shadow_update(self, new_state: str, index: Union[int, str]=''):
-        return self.cmd(f"SHADOW{index} UPDATE {new_state}")
+    def shadow_update(self, new_state: Union[str, bytes, memoryview], index: Union[int, str]=''):
+        if isinstance(new_state, str):
+            return self.cmd(f"SHADOW{index} UPDATE {new_state}")
+        return self.cmd(f"SHADOW{index} UPDATE ", payload=new_state)
 
     def shadow_get_update(self, index: Union[int, str]=''):
         return self.cmd(f"SHADOW{index} GET UPDATE")
@@ -0,0 +1,122 @@
+from adafruit_ticks import ticks_add, ticks_diff, ticks_less, ticks_ms
+
+DROP_OLDEST = 'drop_oldest' # a full queue drops its oldest message
+COALESCE_BY_TOPIC = 'coalesce' # a newer message replaces a queued one on the same topic
+
+
+class MessageInbox:
+    """
+    Bounded host-side queue for inbound MQTT messages.
+
+    drain() fetches every pending message from ExpressLink per wake-up (up to max_drain), so its
+    receive buffer does not fill up while the host is busy. Topics sending more than noisy_limit
+    messages per window_ms are throttled for throttle_ms. After overrun_limit receive buffer
+    overruns, a topic is also unsubscribed for throttle_ms, so ExpressLink stops buffering it.
+    """
+
+    def __init__(self, capacity: int=16, policy: str=DROP_OLDEST, max_drain: int=16,
+                 noisy_limit: int=20, window_ms: int=1000, throttle_ms: int=10000, overrun_limit: int=3) -> None:
+        self.capacity = capacity
+        self.policy = policy
+        self.max_drain = max_drain
+        self.noisy_limit = noisy_limit
+        self.window_ms = window_ms
+        self.throttle_ms = throttle_ms
+        self.overrun_limit = overrun_limit
+
+        self._queue = [] # [topic_name, message]
+        self._window_start = ticks_ms()
+        self._window_counts = {} # topic -> messages in current window
+        self._throttled = {} # topic -> ticks until which messages are dropped
+
+        self.received = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.overruns = 0
+        self.overruns_per_topic = {}
+
+    def __len__(self):
+        return len(self._queue)
+
+    def _is_throttled(self, topic, now):
+        until = self._throttled.get(topic)
+        if until is None:
+            return False
+        if ticks_less(now, until):
+            return True
+        del self._throttled[topic]
+        return False
+
+    def _count(self, topic, now):
+        if ticks_diff(now, self._window_start) >= self.window_ms:
+            self._window_start = now
+            self._window_counts.clear()
+        n = self._window_counts.get(topic, 0) + 1
+        self._window_counts[topic] = n
+        if n > self.noisy_limit:
+            print(f"Throttling noisy topic {topic} for {self.throttle_ms} ms")
+            self._throttled[topic] = ticks_add(now, self.throttle_ms)
+
+    def push(self, topic, message):
+        now = ticks_ms()
+        self.received += 1
+        if self._is_throttled(topic, now):
+            self.dropped += 1
+            return False
+        self._count(topic, now)
+
+        if self.policy == COALESCE_BY_TOPIC:
+            for entry in self._queue:
+                if entry[0] == topic:
+                    entry[1] = message
+                    self.coalesced += 1
+                    return True
+
+        if len(self._queue) >= self.capacity:
+            self._queue.pop(0)
+            self.dropped += 1
+        self._queue.append([topic, message])
+        return True
+
+    def drain(self, el) -> int:
+        n = 0
+        for _ in range(self.max_drain):
+            topic, message = el.get_message()
+            if topic is True or topic is False or message is None:
+                break # no more messages pending
+            self.push(topic, message)
+            n += 1
+        return n
+
+    def overrun(self, topic=None, topics=None):
+        """
+        Records an OVERRUN event (the topic is given in the event detail).
+        With a TopicManager, a topic that keeps overrunning the receive buffer is paused: it is
+        unsubscribed for throttle_ms and then subscribed again.
+        """
+        self.overruns += 1
+        if not topic:
+            return
+        topic = topic.strip()
+        n = self.overruns_per_topic.get(topic, 0) + 1
+        self.overruns_per_topic[topic] = n
+        self._throttled[topic] = ticks_add(ticks_ms(), self.throttle_ms)
+        if topics and n >= self.overrun_limit:
+            print(f"Pausing {topic} for {self.throttle_ms} ms after {n} receive buffer overruns")
+            topics.pause(topic, self.throttle_ms)
+            self.overruns_per_topic[topic] = 0
+
+    def pop(self):
+        if not self._queue:
+            return None, None
+        topic, message = self._queue.pop(0)
+        return topic, message
+
+    def stats(self) -> dict:
+        return {
+            'received': self.received,
+            'queued': len(self._queue),
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'overruns': self.overruns,
+        }
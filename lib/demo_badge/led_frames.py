@@ -0,0 +1,175 @@
+import random
+from adafruit_ticks import ticks_add, ticks_less, ticks_ms
+
+AWS_ORANGE = 0xFF9900
+MAX_FRAMES = 256
+
+
+class FrameTable:
+    """
+    A precompiled LED animation: `frames` frames of `n` pixels, stored as packed R, G, B bytes.
+    """
+
+    def __init__(self, n: int, frames: int, fps: float, brightness=None) -> None:
+        if not 0 < frames <= MAX_FRAMES:
+            raise ValueError(f"invalid number of frames: {frames}")
+        self.n = n
+        self.frames = frames
+        self.fps = fps
+        self.brightness = brightness
+        self.data = bytearray(n * frames * 3)
+
+    def set_pixel(self, frame: int, pixel: int, color: int):
+        o = (frame * self.n + pixel) * 3
+        self.data[o] = (color >> 16) & 0xFF
+        self.data[o + 1] = (color >> 8) & 0xFF
+        self.data[o + 2] = color & 0xFF
+
+
+class FramePlayer:
+    """
+    Plays a FrameTable at its fixed frame rate. animate() only copies bytes into the pixel
+    buffer, so no objects are allocated per frame.
+    """
+
+    def __init__(self, leds, table: FrameTable) -> None:
+        self.leds = leds
+        self.table = table
+        self.frame = 0
+        self._interval_ms = max(1, int(1000 / table.fps))
+        self._next_frame = ticks_ms()
+        if table.brightness is not None:
+            leds.brightness = table.brightness
+
+    def animate(self) -> bool:
+        now = ticks_ms()
+        if ticks_less(now, self._next_frame):
+            return False
+        self._next_frame = ticks_add(now, self._interval_ms)
+
+        t = self.table
+        d = t.data
+        o = self.frame * t.n * 3
+        leds = self.leds
+        for i in range(t.n):
+            leds[i] = (d[o] << 16) | (d[o + 1] << 8) | d[o + 2]
+            o += 3
+        leds.show()
+
+        self.frame += 1
+        if self.frame >= t.frames:
+            self.frame = 0
+        return True
+
+
+def scale(color: int, factor: float) -> int:
+    return (
+        int(((color >> 16) & 0xFF) * factor) << 16 |
+        int(((color >> 8) & 0xFF) * factor) << 8 |
+        int((color & 0xFF) * factor)
+    )
+
+
+def colorwheel(pos: int) -> int:
+    # same color wheel as adafruit_led_animation, 0..255 -> R G B
+    pos = pos & 0xFF
+    if pos < 85:
+        return int(255 - pos * 3) << 16 | int(pos * 3) << 8
+    if pos < 170:
+        pos -= 85
+        return int(pos * 3) << 8 | int(255 - pos * 3)
+    pos -= 170
+    return int(pos * 3) << 16 | int(255 - (pos * 3))
+
+
+def _pulse_levels(steps):
+    # triangle ramp 0 -> 1 -> 0, without repeating the peak and the floor
+    up = [i / (steps // 2) for i in range(steps // 2)]
+    return up + [1.0 - l for l in up]
+
+
+def compile_animation(name: str, n: int, color: int=AWS_ORANGE) -> FrameTable:
+    if name == 'Blink':
+        t = FrameTable(n, 2, fps=5)
+        for p in range(n):
+            t.set_pixel(0, p, color)
+    elif name == 'Pulse' or name == 'SparklePulse':
+        levels = _pulse_levels(32)
+        t = FrameTable(n, len(levels), fps=10)
+        for f, l in enumerate(levels):
+            sparkle = random.randrange(n) if name == 'SparklePulse' else -1
+            for p in range(n):
+                t.set_pixel(f, p, color if p == sparkle else scale(color, l))
+    elif name == 'Comet':
+        tail_length = 2
+        t = FrameTable(n, n + tail_length, fps=5, brightness=0.8)
+        for f in range(t.frames):
+            for k in range(tail_length + 1):
+                p = f - k
+                if 0 <= p < n:
+                    t.set_pixel(f, p, scale(color, 1.0 - k / (tail_length + 1)))
+    elif name == 'Chase':
+        size, spacing = 1, 2
+        period = size + spacing
+        t = FrameTable(n, period, fps=10, brightness=0.2)
+        for f in range(period):
+            for p in range(n):
+                if (p + period - f) % period < size:
+                    t.set_pixel(f, p, color)
+    elif name == 'Sparkle':
+        t = FrameTable(n, 32, fps=10)
+        dim = scale(color, 0.125)
+        for f in range(t.frames):
+            sparkle = random.randrange(n)
+            for p in range(n):
+                t.set_pixel(f, p, color if p == sparkle else dim)
+    elif name == 'RainbowChase':
+        t = FrameTable(n, 16, fps=10)
+        for f in range(t.frames):
+            for p in range(n):
+                t.set_pixel(f, p, colorwheel(f * 16 + p * 256 // n))
+    elif name == 'RainbowSparkle':
+        t = FrameTable(n, 64, fps=10)
+        for f in range(t.frames):
+            sparkle = random.randrange(n)
+            for p in range(n):
+                c = colorwheel(f * 4 + p * 256 // n)
+                t.set_pixel(f, p, c if p == sparkle else scale(c, 0.2))
+    elif name == 'RainbowComet':
+        tail_length = 4
+        t = FrameTable(n, n + tail_length, fps=10)
+        for f in range(t.frames):
+            for k in range(tail_length + 1):
+                p = f - k
+                if 0 <= p < n:
+                    t.set_pixel(f, p, scale(colorwheel(k * 256 // (tail_length + 1)), 1.0 - k / (tail_length + 1)))
+    elif name == 'ColorCycle':
+        t = FrameTable(n, 64, fps=20)
+        for f in range(t.frames):
+            for p in range(n):
+                t.set_pixel(f, p, colorwheel(f * 4))
+    elif name == 'Rainbow':
+        t = FrameTable(n, 64, fps=20)
+        for f in range(t.frames):
+            for p in range(n):
+                t.set_pixel(f, p, colorwheel(f * 4 + p * 256 // n))
+    else:
+        raise ValueError(f"unknown LED animation: {name}")
+    return t
+
+
+def compile_custom(spec: dict, n: int) -> FrameTable:
+    """
+    Compiles a custom animation supplied as data, e.g. from the shadow:
+    {"fps": 10, "brightness": 0.5, "frames": [[0xff0000, 0, 0, 0, 0], [0, 0xff0000, 0, 0, 0]]}
+    Each frame is a list of packed RGB integers, missing pixels are off.
+    """
+    frames = spec['frames']
+    fps = float(spec.get('fps', 10))
+    if not fps > 0: # also rejects nan
+        raise ValueError(f"fps must be > 0, not {fps}")
+    t = FrameTable(n, len(frames), fps=fps, brightness=spec.get('brightness'))
+    for f, frame in enumerate(frames):
+        for p, c in enumerate(frame[:n]):
+            t.set_pixel(f, p, int(c))
+    return t
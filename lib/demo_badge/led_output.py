@@ -0,0 +1,125 @@
+from adafruit_ticks import ticks_add, ticks_less, ticks_ms
+
+
+class LEDOutput:
+    """
+    Buffered front for a NeoPixel strip (created with auto_write=False).
+
+    Pixel and brightness changes only update a local buffer. commit() transmits the whole strip
+    at most once, only if something changed, and at most max_fps times per second.
+    Setting max_fps to anything but a positive integer raises ValueError.
+    """
+
+    def __init__(self, pixels, max_fps: int=50) -> None:
+        self._pixels = pixels
+        self._pixels.auto_write = False
+        self.n = len(pixels)
+        self._buf = bytearray(self.n * 3)
+        self._brightness = pixels.brightness
+        self._max_brightness = 1.0
+        self._dirty = False
+        self.max_fps = max_fps
+        self._next_commit = ticks_ms()
+        self.commits = 0
+        self.skipped = 0
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        o = index * 3
+        return self._buf[o], self._buf[o + 1], self._buf[o + 2]
+
+    def __setitem__(self, index, value):
+        if isinstance(value, int):
+            r, g, b = (value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF
+        else:
+            r, g, b = value[0], value[1], value[2]
+        o = index * 3
+        buf = self._buf
+        if buf[o] != r or buf[o + 1] != g or buf[o + 2] != b:
+            buf[o] = r
+            buf[o + 1] = g
+            buf[o + 2] = b
+            self._dirty = True
+
+    def packed(self, index) -> int:
+        o = index * 3
+        return self._buf[o] << 16 | self._buf[o + 1] << 8 | self._buf[o + 2]
+
+    def fill(self, value):
+        for i in range(self.n):
+            self[i] = value
+
+    def load(self, data):
+        # copy a precompiled R, G, B buffer of the whole strip
+        if self._buf != data:
+            self._buf[:] = data
+            self._dirty = True
+
+    @property
+    def brightness(self) -> float:
+        return self._brightness
+
+    @brightness.setter
+    def brightness(self, value: float):
+        value = min(max(value, 0.0), 1.0)
+        if value != self._brightness:
+            self._brightness = value
+            self._dirty = True
+
+    @property
+    def max_brightness(self) -> float:
+        return self._max_brightness
+
+    @max_brightness.setter
+    def max_brightness(self, value: float):
+        # caps the brightness that is sent to the strip, e.g. to save battery
+        value = min(max(value, 0.0), 1.0)
+        if value != self._max_brightness:
+            self._max_brightness = value
+            self._dirty = True
+
+    @property
+    def max_fps(self) -> int:
+        return self._max_fps
+
+    @max_fps.setter
+    def max_fps(self, value: int):
+        if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+            raise ValueError(f"max_fps must be an integer > 0, not {value!r}")
+        self._max_fps = value
+        self._interval_ms = 1000 // value
+
+    @property
+    def auto_write(self) -> bool:
+        # changes are always batched until commit()
+        return False
+
+    @auto_write.setter
+    def auto_write(self, value: bool):
+        pass
+
+    def show(self):
+        return self.commit()
+
+    def commit(self) -> bool:
+        if not self._dirty:
+            return False
+        now = ticks_ms()
+        if ticks_less(now, self._next_commit):
+            self.skipped += 1
+            return False
+        self._next_commit = ticks_add(now, self._interval_ms)
+
+        pixels = self._pixels
+        brightness = min(self._brightness, self._max_brightness)
+        if pixels.brightness != brightness:
+            pixels.brightness = brightness
+        for i in range(self.n):
+            pixels[i] = self.packed(i)
+        pixels.show()
+
+        self._dirty = False
+        self.commits += 1
+        return True
@@ -0,0 +1,91 @@
+from adafruit_ticks import ticks_add, ticks_less, ticks_ms
+
+# NS_REG session register, see Section 8.3.12, https://www.nxp.com/docs/en/data-sheet/NT3H2111_2211.pdf
+NS_REG = 6
+NDEF_DATA_READ = 0x80
+
+
+class NFCActivity:
+    """
+    Tracks phone taps and NDEF reads without polling the NT3H over I2C on every loop.
+
+    With the default FD_ON/FD_OFF configuration the FD pin is pulled low while an NFC field
+    is present. NS_REG is only queried from a field-detect edge until read_window_ms after
+    the field is gone, and at most every poll_interval_ms in between.
+    """
+
+    def __init__(self, nfc_tag, read_window_ms: int=1000, poll_interval_ms: int=50, debounce_ms: int=500) -> None:
+        self.nfc_tag = nfc_tag
+        self.read_window_ms = read_window_ms
+        self.poll_interval_ms = poll_interval_ms
+        self.debounce_ms = debounce_ms
+
+        self.url = None
+        self.taps = 0
+        self.reads = 0
+        self.register_reads = 0
+        self._per_url = {} # url -> [taps, reads]
+
+        self.tag_read = False # True for one update after an NDEF read was detected
+        self._window_open = False
+        self._window_end = ticks_ms()
+        self._next_poll = ticks_ms()
+        self._next_read = ticks_ms()
+
+    def set_url(self, url):
+        self.url = url
+        if url not in self._per_url:
+            self._per_url[url] = [0, 0]
+
+    @property
+    def field_present(self) -> bool:
+        return not self.nfc_tag.field_detect.value
+
+    def update(self):
+        self.tag_read = False
+        if not self.nfc_tag:
+            return
+
+        fd = self.nfc_tag.field_detect
+        fd.update()
+        now = ticks_ms()
+
+        if fd.fell:
+            # field switched on: a phone has been brought close to the badge
+            self.taps += 1
+            if self.url in self._per_url:
+                self._per_url[self.url][0] += 1
+            self._window_open = True
+            self._next_poll = now
+        elif fd.rose:
+            # field switched off: keep looking for a late NDEF_DATA_READ for a bounded time
+            self._window_end = ticks_add(now, self.read_window_ms)
+
+        if not self._window_open:
+            return
+
+        if fd.value and not ticks_less(now, self._window_end):
+            self._window_open = False
+            return
+
+        if ticks_less(now, self._next_poll):
+            return
+        self._next_poll = ticks_add(now, self.poll_interval_ms)
+
+        # read NS_REG register and extract NDEF_DATA_READ at bit7
+        self.register_reads += 1
+        if self.nfc_tag.read_register(NS_REG) & NDEF_DATA_READ:
+            if not ticks_less(now, self._next_read):
+                # debounce the value if multiple reads occur within a short time, as is common on most smartphones
+                self.tag_read = True
+                self.reads += 1
+                if self.url in self._per_url:
+                    self._per_url[self.url][1] += 1
+                self._next_read = ticks_add(now, self.debounce_ms)
+
+    def metrics(self) -> dict:
+        return {
+            'nfc_taps': self.taps,
+            'nfc_reads': self.reads,
+            'nfc_per_url': {url: {'taps': c[0], 'reads': c[1]} for url, c in self._per_url.items()},
+        }
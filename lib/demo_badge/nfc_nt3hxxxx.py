@@ -1,6 +1,7 @@
 import binascii
 import digitalio
 from adafruit_debouncer import Debouncer
+from adafruit_ticks import ticks_add, ticks_less, ticks_ms
 
 from .ndef_encoder import encode_uri, encode_vcard
 
@@ -53,14 +54,15 @@ class NT3Hxxxx:
         with self.device:
             self.device.write(data)
 
-    def write_page(self, page_id, data):
+    def write_page(self, page_id, data, verbose=True):
         # pad with 0x00 to a full 16-byte page
         if len(data) < 16:
             data += bytearray(b"\x00"*(16-len(data)))
         assert len(data) == 16
 
         msg = bytearray([page_id]) + data
-        print(f"NFC NT3Hxxxx: writing to page {page_id}:", msg[1:])
+        if verbose:
+            print(f"NFC NT3Hxxxx: writing to page {page_id}:", msg[1:])
         with self.device:
             self.device.write(msg)
 
@@ -146,3 +148,67 @@ class NT3Hxxxx:
     def set_vcard(self, **kwargs):
         r = encode_vcard(**kwargs)
         self.write_user_eeprom(r)
+
+
+class NDEFWriter:
+    """
+    Writes an NDEF message into the user EEPROM one page per update(), so the main loop never
+    blocks for the whole message. Pages that already hold the same bytes are skipped.
+
+    The first page is written with an empty TLV length first and completed last, so a phone
+    tapping in between reads an empty tag instead of a mix of the old and new message.
+    Writes wait while an NFC field is present, as the tag is busy with the phone then.
+    """
+
+    def __init__(self, nfc_tag, page_interval_ms: int=10) -> None:
+        self.nfc_tag = nfc_tag
+        self.page_interval_ms = page_interval_ms # EEPROM programming takes about 4.5 ms per page
+        self._written = bytearray() # what the tag holds, as far as we know
+        self._data = None
+        self._pages = [] # page numbers still to write, in order
+        self._next_write = ticks_ms()
+        self.pages_written = 0
+        self.errors = 0
+
+    @property
+    def busy(self) -> bool:
+        return bool(self._pages)
+
+    def start(self, raw):
+        if len(raw) >= 880:
+            raise ValueError(f"NFC NT3Hxxxx: not enough space for {len(raw)} bytes")
+        data = bytearray(raw)
+        if len(data) % 16:
+            data += bytes(16 - len(data) % 16)
+        self._data = data
+        pages = [p for p in range(len(data) // 16) if data[p*16:p*16+16] != self._written[p*16:p*16+16]]
+        if pages and pages != [0]:
+            # page 1 holds the TLV length: emptied first, completed last
+            pages = [0] + [p for p in pages if p] + [0]
+        self._pages = pages
+
+    def update(self) -> bool:
+        if not self._pages or not self.nfc_tag:
+            return False
+        now = ticks_ms()
+        if ticks_less(now, self._next_write) or not self.nfc_tag.field_detect.value:
+            return False
+        self._next_write = ticks_add(now, self.page_interval_ms)
+
+        p = self._pages[0]
+        page = self._data[p*16:p*16+16]
+        if p == 0 and len(self._pages) > 1:
+            page[1] = 0 # empty NDEF message until the last page is written
+        try:
+            self.nfc_tag.write_page(p + 1, page, verbose=False)
+        except OSError:
+            # EEPROM still busy, or the phone holds the tag: retry on the next update
+            self.errors += 1
+            return False
+        self._pages.pop(0)
+        self.pages_written += 1
+        end = (p + 1) * 16
+        if len(self._written) < end:
+            self._written += bytes(end - len(self._written))
+        self._written[p*16:end] = page
+        return True
@@ -0,0 +1,214 @@
+import time
+from adafruit_ticks import ticks_add, ticks_diff, ticks_less, ticks_ms
+
+from .battery import BatteryMonitor
+
+# Rough current draw of the badge components in mA, used for the current budget.
+# Measured values vary with the Wi-Fi environment and the ExpressLink module in use.
+HOST_ACTIVE_MA = 30 # RP2040 busy looping
+HOST_IDLE_MA = 12 # RP2040 mostly in time.sleep()
+EXPRESSLINK_ACTIVE_MA = 80 # connected, Wi-Fi on
+EXPRESSLINK_SLEEP_MA = 2
+BACKLIGHT_MA = 20 # display backlight at full brightness
+LED_CHANNEL_MA = 20 # one NeoPixel colour channel at full brightness
+
+
+class PowerManager:
+    """
+    Duty-cycles the badge while nobody is using it.
+
+    The badge is idle after idle_after_ms without button presses, motion or NFC field, and
+    ExpressLink only sleeps while no events are pending. While idle, ExpressLink is put into SLEEP for a duration that grows with
+    the idle time, LED and display refresh rates are lowered and the main loop polls less often.
+    Buttons, motion, an NFC field or the EVENT pin wake everything up again (the WAKE pin is
+    asserted to cut the SLEEP short). When a SLEEP ends on its own, the badge stays awake for
+    awake_ms to reconnect and report, before going back to sleep.
+
+    on_sleep(duration_s) and on_wake() are called around every ExpressLink SLEEP, e.g. to tell
+    the ConnectionManager that the connection is gone. The battery-life projection uses the state
+    of charge from a BatteryMonitor.
+    """
+
+    def __init__(self, badge, battery=None, on_sleep=None, on_wake=None, idle_after_ms: int=60000, min_sleep_s: int=30,
+                 max_sleep_s: int=600, awake_ms: int=20000, idle_poll_ms: int=100, idle_led_fps: int=5,
+                 idle_display_ms: int=30000, motion_threshold: float=1.0, battery_capacity_mah: int=1000) -> None:
+        self.badge = badge
+        self.battery = battery if battery else BatteryMonitor(badge.battery_voltage)
+        self.on_sleep = on_sleep
+        self.on_wake = on_wake
+        self.idle_after_ms = idle_after_ms
+        self.min_sleep_s = min_sleep_s
+        self.max_sleep_s = max_sleep_s
+        self.awake_ms = awake_ms
+        self.idle_poll_ms = idle_poll_ms
+        self.idle_led_fps = idle_led_fps
+        self.idle_display_ms = idle_display_ms
+        self.motion_threshold = motion_threshold
+        self.battery_capacity_mah = battery_capacity_mah
+
+        self.idle = False
+        self.sleeping = False
+        now = ticks_ms()
+        self._last_activity = now
+        self._sleep_start = now
+        self._sleep_until = now
+        self._next_sleep = now
+        self._next_motion_check = now
+        self._next_display = now
+        self._last_acceleration = None
+        self._active_led_fps = badge.leds.max_fps
+
+        self.sleeps = 0
+        self.slept_ms = 0
+        self._charge_mas = 0.0 # consumed charge in mA*s since start
+        self._last_tick = now
+        self._start = now
+
+    def activity(self):
+        # anything that should keep (or bring) the badge awake
+        self._last_activity = ticks_ms()
+        if self.idle:
+            self._leave_idle()
+
+    def _moved(self) -> bool:
+        # read the accelerometer at most twice a second, to keep the I2C bus quiet
+        accelerometer = self.badge.accelerometer
+        now = ticks_ms()
+        if not accelerometer or ticks_less(now, self._next_motion_check):
+            return False
+        self._next_motion_check = ticks_add(now, 500)
+        x, y, z = accelerometer.acceleration
+        last = self._last_acceleration
+        self._last_acceleration = (x, y, z)
+        if last is None:
+            return False
+        return abs(x - last[0]) + abs(y - last[1]) + abs(z - last[2]) > self.motion_threshold
+
+    def _busy(self) -> bool:
+        badge = self.badge
+        if not badge.button1.value or not badge.button2.value or not badge.button3.value:
+            return True
+        if badge.nfc_tag and badge.nfc_activity.field_present:
+            return True
+        return self._moved()
+
+    def _enter_idle(self):
+        self.idle = True
+        self.badge.leds.max_fps = self.idle_led_fps
+        print("Power: badge is idle")
+
+    def _leave_idle(self):
+        self.idle = False
+        self.badge.leds.max_fps = self._active_led_fps
+        self._next_display = ticks_ms()
+        if self.sleeping:
+            self._wake(early=True)
+        print("Power: badge is active")
+
+    def _sleep(self, now):
+        idle_s = ticks_diff(now, self._last_activity) // 1000
+        # the longer nobody touches the badge, the longer ExpressLink sleeps
+        duration = min(self.max_sleep_s, max(self.min_sleep_s, idle_s // 2))
+        success, line, err = self.badge.expresslink.sleep(duration)
+        if not success:
+            print(f"Power: ExpressLink refused to sleep: {err} {line}")
+            self._next_sleep = ticks_add(now, self.awake_ms)
+            return
+        self.sleeping = True
+        self.sleeps += 1
+        self._sleep_start = now
+        self._sleep_until = ticks_add(now, duration * 1000)
+        if self.on_sleep:
+            self.on_sleep(duration)
+
+    def _wake(self, early=False):
+        now = ticks_ms()
+        el = self.badge.expresslink
+        if early and el.wake_signal:
+            # asserting WAKE (low) ends the SLEEP before its duration
+            el.wake_signal.value = False
+            time.sleep(0.01)
+            el.wake_signal.value = True
+        self.sleeping = False
+        self.slept_ms += ticks_diff(now, self._sleep_start)
+        self._next_sleep = ticks_add(now, self.awake_ms)
+        if self.on_wake:
+            self.on_wake()
+
+    def update(self):
+        now = ticks_ms()
+        self._account(now)
+
+        if self._busy():
+            self.activity()
+            return
+
+        if not self.idle:
+            if ticks_diff(now, self._last_activity) >= self.idle_after_ms:
+                self._enter_idle()
+            return
+
+        # pending events (e.g. a shadow delta) are not user activity, but prevent or end a SLEEP
+        pending = self.badge.expresslink.event_signal.value
+        if self.sleeping:
+            if pending or not ticks_less(now, self._sleep_until):
+                self._wake()
+        elif not pending and not ticks_less(now, self._next_sleep):
+            self._sleep(now)
+
+    def display_due(self) -> bool:
+        # the display is refreshed on every update while active, and rarely while idle
+        if not self.idle:
+            return True
+        now = ticks_ms()
+        if ticks_less(now, self._next_display):
+            return False
+        self._next_display = ticks_add(now, self.idle_display_ms)
+        return True
+
+    def wait(self):
+        # lower host polling frequency while idle, button presses are longer than idle_poll_ms
+        if self.idle:
+            time.sleep(self.idle_poll_ms / 1000)
+
+    def current_ma(self) -> float:
+        badge = self.badge
+        ma = HOST_IDLE_MA if self.idle else HOST_ACTIVE_MA
+        ma += EXPRESSLINK_SLEEP_MA if self.sleeping else EXPRESSLINK_ACTIVE_MA
+        ma += BACKLIGHT_MA * badge.display.brightness
+        leds = badge.leds
+        channels = 0
+        for i in range(len(leds)):
+            r, g, b = leds[i]
+            channels += r + g + b
+        # the strip runs at the lower of the requested brightness and the battery cap
+        ma += LED_CHANNEL_MA * min(leds.brightness, leds.max_brightness) * channels / 255
+        return ma
+
+    def _account(self, now):
+        elapsed = ticks_diff(now, self._last_tick)
+        self._last_tick = now
+        self._charge_mas += self.current_ma() * elapsed / 1000
+
+    @property
+    def average_ma(self) -> float:
+        elapsed = ticks_diff(ticks_ms(), self._start)
+        if elapsed <= 0:
+            return self.current_ma()
+        return self._charge_mas * 1000 / elapsed
+
+    def stats(self) -> dict:
+        average_ma = self.average_ma
+        soc = self.battery.soc
+        if soc is None:
+            hours = None # powered via USB
+        else:
+            hours = round(self.battery_capacity_mah * soc / 100 / average_ma, 1)
+        return {
+            'idle': self.idle,
+            'sleeps': self.sleeps,
+            'slept_ms': self.slept_ms,
+            'current_ma': round(self.current_ma(), 1),
+            'average_ma': round(average_ma, 1),
+            'battery_hours': hours,
+        }
@@ -9,12 +9,14 @@ import usb_cdc
 import adafruit_imageload
 from adafruit_ticks import ticks_add, ticks_less, ticks_ms
 from adafruit_display_text import label
-from adafruit_led_animation.animation.rainbowcomet import RainbowComet
 
 from .badge import Badge
+from .dashboard import Dashboard
 from .expresslink import Event
+from .responses import parse_event
 from .otw import otw
 from .qrcode import encode_qr_code
+from .self_test import FAIL, OK, PENDING, SelfTest
 
 
 def render_aws_logo():
@@ -39,21 +41,31 @@ def provision(badge: Badge):
     if peripherals_missing:
         return False
 
-    for _ in range(3):
+    # the NT3H NACKs while its EEPROM is busy, retry briefly instead of sleeping whole seconds
+    deadline = ticks_add(ticks_ms(), 3000)
+    while True:
         try:
             badge.nfc_tag.provision()
             break
         except Exception as e:
             print(e)
-            time.sleep(1)
+            if not ticks_less(ticks_ms(), deadline):
+                break
+            time.sleep(0.1)
 
     if badge.expresslink.ready:
         # ExpressLink fimware upgrade over-the-wire
-        otw(uart=badge.expresslink.uart, file="/lib/demo_badge/v2.4.1.bin", new_version="2.4.1")
+        uart = badge.expresslink.uart
+        timeout = uart.timeout
+        otw(uart=uart, file="/lib/demo_badge/v2.4.1.bin", new_version="2.4.1")
+        uart.timeout = timeout # otw() waits up to 10 s per read, the self-test must not
 
     return True
 
 
+SELF_TEST_LINES = 12
+
+
 def create_test_screen():
     splash = displayio.Group()
 
@@ -70,61 +82,137 @@ def create_test_screen():
     inner_sprite = displayio.TileGrid(inner_bitmap, pixel_shader=inner_palette, x=5, y=5)
     splash.append(inner_sprite)
 
-    text_group = displayio.Group(scale=1, x=10, y=20)
-    data_label = label.Label(terminalio.FONT, text="", color=0xffffff)
-    text_group.append(data_label)
-    splash.append(text_group)
+    # one fixed-width row per self-test line, so only lines with changed results are redrawn
+    report = Dashboard([(f"line_{i}", 36) for i in range(SELF_TEST_LINES)], x=10, y=12, width=220, height=180)
+    splash.append(report)
 
-    return splash, data_label
+    return splash, report
 
 
-def update_self_test_report(badge, data_label, bundle_version, firmware_check, button1_pressed, button2_pressed, button3_pressed, ambient_light_samples, expresslink_event_signal):
-    avg_light = sum(ambient_light_samples)/len(ambient_light_samples)
-    ambiant_light_ok = "OK" if avg_light > 10 and avg_light < 30000 else "UNEXPTECTED"
+def create_version_screen(bundle_version):
+    version_label = label.Label(terminalio.FONT, text='\n'.join(["Bundle", "Version"] + bundle_version.split('T')), color=0xffffff, scale=3)
+    version_label.anchor_point = (0.5, 0.5)
+    version_label.anchored_position = (120, 120)
+    group = displayio.Group()
+    group.append(version_label)
+    return group
 
-    if badge.temperature_humidity:
-        temperature = badge.temperature_humidity.temperature
-        relative_humidity = badge.temperature_humidity.relative_humidity
-        temperature_humidity = f"OK | {temperature:.1f} C | {relative_humidity:.0f}%"
-    else:
-        temperature_humidity = "FAILED"
 
-    if badge.accelerometer:
-        x, y, z = badge.accelerometer.acceleration
-        accelerometer = f"OK | {x:+3.1f} {y:+3.1f} {z:+3.1f}"
-    else:
-        x, y, z = 0.0, 0.0, 0.0
-        accelerometer = "FAILED"
+MAX_RESPONSE_BYTES = 128 # longer than any response line the checks expect
 
-    if badge.nfc_tag:
-        nfc_id = "OK | ID:" + binascii.hexlify(badge.nfc_tag.read_page(0)[:7]).decode()
-    else:
-        nfc_id = "FAILED"
 
-    if badge.expresslink.self_test():
-        expresslink_check = f"OK | {badge.expresslink.config.Version}"
-    else:
-        expresslink_check = "FAIL"
+def _response_line(uart):
+    # one response line, read from what already arrived without waiting for the UART timeout
+    line = b""
+    while not line.endswith(b"\n"):
+        yield
+        n = uart.in_waiting
+        if n:
+            line += uart.read(min(n, MAX_RESPONSE_BYTES + 1 - len(line)))
+            if len(line) > MAX_RESPONSE_BYTES:
+                raise ValueError(f"response longer than {MAX_RESPONSE_BYTES} bytes")
+    return line.decode().strip("\r\n\x00\xff\xfe\xfd\xfc\xfb\xfa")
 
-    if expresslink_event_signal:
-        expresslink_event_check = "OK"
-    else:
-        expresslink_event_check = "FAIL"
-
-    data_label.text = "\n".join([
-        "Self-Test Results:",
-        f"{bundle_version} | Bundle",
-        f"{firmware_check}",
-        f"{expresslink_check} | ExpressLink Firmware",
-        f"{expresslink_event_check} | ExpressLink EVENT",
-        f"{ambiant_light_ok} | {avg_light:4.0f} | Ambient Light",
-        f"{accelerometer} | LIS3DH",
-        f"{temperature_humidity} | SHT-30",
-        f"{nfc_id} | NFC NT3H",
-        f"{'OK' if button1_pressed else 'not yet'} | Button 1",
-        f"{'OK' if button2_pressed else 'not yet'} | Button 2",
-        f"{'OK' if button3_pressed else 'not yet'} | Button 3",
-    ])
+
+def expresslink_version_check(badge):
+    # a single AT+CONF? Version proves the UART works and reads the firmware version, without blocking
+    uart = badge.expresslink.uart
+    uart.reset_input_buffer()
+    uart.write(b"AT+CONF? Version\n")
+    line = yield from _response_line(uart)
+    if line.startswith("OK "):
+        return OK, line[3:]
+    return FAIL, line
+
+
+def expresslink_event_check(badge):
+    el = badge.expresslink
+    # there must be at least one pending event, the UART is left to other checks until then
+    if not el.event_signal.value:
+        return PENDING, "no STARTUP event"
+    uart = el.uart
+    while True:
+        uart.reset_input_buffer()
+        uart.write(b"AT+EVENT?\n")
+        line = yield from _response_line(uart)
+        if not line.startswith("OK"):
+            return FAIL, line
+        event_id = parse_event(line[3:]).event_id
+        if event_id and event_id != Event.STARTUP:
+            print("Unexpected event:", event_id)
+        yield # badge.update() debounces the event signal
+        if not el.event_signal.value:
+            # it must be LOW after consuming the STARTUP event
+            return OK, ""
+
+
+def ambient_light_check():
+    samples = []
+
+    def run(badge):
+        # moving average filter
+        # raw values in range 0 to 65535
+        samples.append(badge.ambient_light.value)
+        if len(samples) > 10:
+            samples.pop(0)
+        avg = sum(samples) / len(samples)
+        return (OK if avg > 10 and avg < 30000 else "UNEXPECTED"), f"{avg:4.0f}"
+    return run
+
+
+def temperature_humidity_check(badge):
+    if not badge.temperature_humidity:
+        return FAIL, ""
+    temperature = badge.temperature_humidity.temperature
+    relative_humidity = badge.temperature_humidity.relative_humidity
+    return OK, f"{temperature:.1f} C | {relative_humidity:.0f}%"
+
+
+def accelerometer_check(badge):
+    if not badge.accelerometer:
+        return FAIL, ""
+    x, y, z = badge.accelerometer.acceleration
+    return OK, f"{x:+3.1f} {y:+3.1f} {z:+3.1f}"
+
+
+def nfc_check(badge):
+    if not badge.nfc_tag:
+        return FAIL, ""
+    return OK, "ID:" + binascii.hexlify(badge.nfc_tag.read_page(0)[:7]).decode()
+
+
+def button_check(button):
+    def run(badge):
+        return (PENDING if button.value else OK), ""
+    return run
+
+
+def create_self_test(badge, bundle_version, firmware_check) -> SelfTest:
+    """
+    Every check runs on its own schedule and keeps its last result: static checks once, sensors
+    every second, the ExpressLink firmware every 10 s (time-boxed to 2 s), the ExpressLink events
+    once (retried every second), buttons until pressed.
+    """
+    self_test = SelfTest(badge)
+    self_test.add("Bundle", lambda badge: (OK if bundle_version != "unknown" else FAIL, bundle_version), interval_ms=None)
+    self_test.add("CircuitPython", lambda badge: firmware_check, interval_ms=None)
+    self_test.add("ExpressLink Firmware", expresslink_version_check, interval_ms=10000, timeout_ms=2000, group="expresslink")
+    self_test.add("ExpressLink EVENT", expresslink_event_check, interval_ms=None, timeout_ms=2000, group="expresslink", retry_ms=1000)
+    self_test.add("Ambient Light", ambient_light_check(), interval_ms=100)
+    self_test.add("LIS3DH", accelerometer_check)
+    self_test.add("SHT-30", temperature_humidity_check)
+    self_test.add("NFC NT3H", nfc_check, interval_ms=5000)
+    self_test.add("Button 1", button_check(badge.button1), interval_ms=None)
+    self_test.add("Button 2", button_check(badge.button2), interval_ms=None)
+    self_test.add("Button 3", button_check(badge.button3), interval_ms=None)
+    return self_test
+
+
+def update_self_test_report(self_test, report):
+    lines = ["Self-Test Results:"] + self_test.lines()
+    for i, line in enumerate(lines[:SELF_TEST_LINES]):
+        report.set(f"line_{i}", line)
+    return lines
 
 
 def run():
@@ -143,35 +231,21 @@ def run():
 
     badge.back_led.blink = True
 
-    badge.led_animation = RainbowComet(badge.leds, speed=0.1)
+    badge.set_led_animation('RainbowComet')
     badge.leds.brightness = 0.1
 
     qr_group = encode_qr_code(badge.display, "https://aws.amazon.com/iot-expresslink/", qr_type=3)
-    test_group, data_label = create_test_screen()
-
-    ambient_light_samples = []
-    button1_pressed = False
-    button2_pressed = False
-    button3_pressed = False
-
-    expresslink_event_signal_check_state = 0
-    expresslink_event_signal = False
+    test_group, report = create_test_screen()
+    report_lines = []
 
     bundle_version = "unknown"
     try:
         with open("VERSION.txt") as boot:
             bundle_version = boot.read().strip()
 
-        data_label.text = '\n'.join(["Bundle", "Version"] + bundle_version.split('T'))
-        data_label.scale = 3
-        data_label.anchor_point = (0.5, 0.5)
-        data_label.anchored_position = (120, 120)
-        badge.display.show(test_group)
+        badge.display.show(create_version_screen(bundle_version))
         time.sleep(5)
-        data_label.text = ""
-        data_label.scale = 1
-        data_label.anchor_point = (0, 0)
-        data_label.anchored_position = (0, 0)
+        badge.display.show(test_group)
     except:
         pass
 
@@ -187,11 +261,13 @@ def run():
         while True: pass
 
     if circuit_python == "7.3.3" and board_name == "raspberry_pi_pico":
-        firmware_check = f"OK | {circuit_python} | {board_name}"
+        firmware_check = (OK, f"{circuit_python} | {board_name}")
     else:
-        firmware_check = f"FAIL | {circuit_python} | {board_name}"
+        firmware_check = (FAIL, f"{circuit_python} | {board_name}")
 
     badge.expresslink.debug = False
+    self_test = create_self_test(badge, bundle_version, firmware_check)
+    reported_pass = False
 
     ################################################################################
 
@@ -225,35 +301,18 @@ def run():
 
             next_display_update = ticks_add(ticks_ms(), 5000)
 
-        if not badge.button1.value:
-            button1_pressed = True
-        if not badge.button2.value:
-            button2_pressed = True
-        if not badge.button3.value:
-            button3_pressed = True
+        # advances the due checks, at most SelfTest.budget_ms per loop
+        self_test.step()
 
         if badge.button1.pressed or badge.button2.pressed or badge.button3.pressed:
-            print(data_label.text)
+            print("\n".join(report_lines))
+            print("SELF_TEST " + self_test.json())
 
-        # moving average filter
-        # raw values in range 0 to 65535
-        ambient_light_samples.append(badge.ambient_light.value)
-        if len(ambient_light_samples) > 10:
-            ambient_light_samples = ambient_light_samples[1:]
-
-        if expresslink_event_signal_check_state == 0:
-            if badge.expresslink.event_signal.value:
-                # there must be at least one pending event
-                expresslink_event_signal_check_state += 1
-        elif expresslink_event_signal_check_state == 1:
-            event_id, _, _, _ = badge.expresslink.get_event()
-            if event_id and event_id != Event.STARTUP:
-                print("Unexpected event:", event_id)
-            if not badge.expresslink.event_signal.value:
-                # it must be LOW after consuming the STARTUP event
-                expresslink_event_signal = True
-                expresslink_event_signal_check_state = 99
+        if self_test.passed and not reported_pass:
+            # one machine-readable line for validating a tray of badges from the host
+            reported_pass = True
+            print("SELF_TEST " + self_test.json())
 
         if ticks_less(next_data_update, ticks_ms()):
-            update_self_test_report(badge, data_label, bundle_version, firmware_check, button1_pressed, button2_pressed, button3_pressed, ambient_light_samples, expresslink_event_signal)
-            next_data_update = ticks_add(ticks_ms(), 1000)
+            report_lines = update_self_test_report(self_test, report)
+            next_data_update = ticks_add(ticks_ms(), 250)
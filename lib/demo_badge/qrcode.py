@@ -16,7 +16,7 @@ def bitmap_qr(matrix: adafruit_miniqr.QRBitMatrix) -> displayio.Bitmap:
                 bitmap[x + border_pixels, y + border_pixels] = 0
     return bitmap
 
-def encode_qr_code(display, data: str, qr_type=6, error_correct=adafruit_miniqr.L) -> displayio.Group:
+def encode_qr_code(display, data: str, qr_type=6, error_correct=adafruit_miniqr.L, height=None) -> displayio.Group:
     qr_code = adafruit_miniqr.QRCode(qr_type=qr_type, error_correct=error_correct)
     qr_code.add_data(data.encode())
     qr_code.make()
@@ -26,17 +26,19 @@ def encode_qr_code(display, data: str, qr_type=6, error_correct=adafruit_miniqr.
     palette[0] = 0xFFFFFF
     palette[1] = 0x000000
 
-    # full-screen centered size
+    # full-screen centered size, or centered in the top `height` pixels
+    if not height:
+        height = display.height
     bitmap = bitmap_qr(qr_code.matrix)
     scale = min(
         display.width // bitmap.width,
-        display.height // bitmap.height,
+        height // bitmap.height,
     )
     x = int(
         ((display.width / scale) - bitmap.width) / 2
     )
     y = int(
-        ((display.height / scale) - bitmap.height) / 2
+        ((height / scale) - bitmap.height) / 2
     )
 
     qr_img = displayio.TileGrid(
@@ -0,0 +1,248 @@
+"""
+Writes reported-state shadow updates directly into a reusable bytearray.
+
+Key fragments like b'"temperature":' are encoded once, numbers are formatted digit by digit
+into the buffer, and only fields whose value changed since the last report are written.
+Compared to building a dict and calling json.dumps on every tick, this keeps the heap quiet
+and avoids the GC pauses that show up as loop jitter.
+
+The buffer grows (up to max_size) for fields that do not fit. Fields that still do not fit
+are left out and written into the next report instead, see deferred.
+Values only count as reported once sent() confirms the update went out (or was spooled).
+"""
+
+import json
+
+PREFIX = b'{"state":{"reported":{'
+SUFFIX = b'}}}'
+FLOAT_DECIMALS = 4
+_FLOAT_SCALE = 10 ** FLOAT_DECIMALS
+
+
+class _Full(Exception):
+    pass
+
+
+class ReportWriter:
+    def __init__(self, keys, size: int=1024, max_size: int=4096) -> None:
+        self._keys = {k: b'"' + k.encode() + b'":' for k in keys}
+        self._strings = {}
+        self._last = {} # key -> value (or token) of the last sent report
+        self._pending = {} # key -> value (or token) written into the current report
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self.max_size = max_size
+        self._pos = 0
+        self._fields = 0
+        self.deferred = 0 # fields left for the next report, because this one is full
+        self.dropped = 0 # fields that do not fit into max_size on their own
+
+    def _grow(self, needed):
+        size = len(self._buf)
+        while size < needed:
+            size *= 2
+        if size > self.max_size:
+            raise _Full()
+        buf = bytearray(size)
+        buf[:self._pos] = self._view[:self._pos]
+        self._buf = buf
+        self._view = memoryview(buf)
+
+    def _put(self, data):
+        n = len(data)
+        if self._pos + n > len(self._buf):
+            self._grow(self._pos + n)
+        self._buf[self._pos:self._pos + n] = data
+        self._pos += n
+
+    def _put_byte(self, b):
+        if self._pos >= len(self._buf):
+            self._grow(self._pos + 1)
+        self._buf[self._pos] = b
+        self._pos += 1
+
+    def _put_uint(self, v, min_digits=1):
+        start = self._pos
+        while v or self._pos - start < min_digits:
+            self._put_byte(48 + v % 10)
+            v //= 10
+        # digits were written least significant first
+        buf = self._buf
+        i, j = start, self._pos - 1
+        while i < j:
+            buf[i], buf[j] = buf[j], buf[i]
+            i += 1
+            j -= 1
+
+    def _put_value(self, value):
+        if value is None:
+            self._put(b'null')
+        elif value is True:
+            self._put(b'true')
+        elif value is False:
+            self._put(b'false')
+        elif isinstance(value, int):
+            if value < 0:
+                self._put_byte(45) # '-'
+                value = -value
+            self._put_uint(value)
+        elif isinstance(value, float):
+            if value - value != 0: # NaN or infinity
+                self._put(b'null')
+                return
+            if value < 0:
+                self._put_byte(45) # '-'
+                value = -value
+            scaled = int(value * _FLOAT_SCALE + 0.5)
+            self._put_uint(scaled // _FLOAT_SCALE)
+            self._put_byte(46) # '.'
+            self._put_uint(scaled % _FLOAT_SCALE, FLOAT_DECIMALS)
+        elif isinstance(value, str):
+            # the set of reported strings is small ('pressed', 'not pressed', ...), encode each once
+            encoded = self._strings.get(value)
+            if encoded is None:
+                encoded = self._strings[value] = json.dumps(value).encode()
+            self._put(encoded)
+        else:
+            self._put(json.dumps(value).encode())
+
+    def begin(self):
+        self._pos = 0
+        self._fields = 0
+        self._pending = {} # not sent, written again if still changed
+        self.deferred = 0
+        self._put(PREFIX)
+
+    def field(self, key: str, value, token=None) -> bool:
+        """
+        Writes the field if it changed since it was last sent.
+        token: optional cheap stand-in for comparing mutable values, e.g. a version counter for a dict.
+        Returns False if unchanged, or if the report is full and the field is deferred.
+        """
+        compare = value if token is None else token
+        if key in self._last and self._last[key] == compare:
+            return False
+        start = self._pos
+        try:
+            if self._fields:
+                self._put_byte(44) # ','
+            self._put(self._keys[key])
+            self._put_value(value)
+            # room for the closing braces, so end() cannot fail
+            if self._pos + len(SUFFIX) > len(self._buf):
+                self._grow(self._pos + len(SUFFIX))
+        except _Full:
+            self._pos = start
+            if self._fields:
+                self.deferred += 1
+            else:
+                # too large even on its own, it would never be sent
+                print(f"Reported {key} exceeds {self.max_size} bytes, dropped")
+                self.dropped += 1
+                self._last[key] = compare
+            return False
+        self._pending[key] = compare
+        self._fields += 1
+        return True
+
+    def forget(self, key: str=None):
+        # force a field (or all fields) to be written again on the next report
+        if key is None:
+            self._last.clear()
+        elif key in self._last:
+            del self._last[key]
+
+    def end(self):
+        if not self._fields:
+            return None
+        self._put(SUFFIX)
+        return self._view[:self._pos]
+
+    def reported(self, key: str):
+        # value (or token) of the key in the last sent report, None if not sent yet
+        return self._last.get(key)
+
+    def sent(self):
+        # the report returned by end() went out, its values are now the reference for changes
+        self._last.update(self._pending)
+        self._pending = {}
+
+
+def _sample():
+    # badge-like reported values: drifting sensors, a rarely changing configuration
+    import random
+    return {
+        'temperature': 21 + random.random(),
+        'humidity': 40 + random.random() * 5,
+        'ambient_light': float(random.randint(1000, 2000)),
+        'acceleration_x': random.random() - 0.5,
+        'acceleration_y': random.random() - 0.5,
+        'acceleration_z': 9.8 + random.random() * 0.1,
+        'button_1': 'not pressed',
+        'button_2': 'pressed' if random.random() < 0.1 else 'not pressed',
+        'button_3': 'not pressed',
+        'led_1': 16750848,
+        'active_button_config': 1,
+    }
+
+
+def benchmark(sample=_sample, keys=None, ticks: int=50):
+    """
+    Compares allocations per tick and the longest tick (which includes any GC pause triggered
+    by it) for the dict + json.dumps reporting path and ReportWriter.
+    sample: callable returning a dict of reported values for one tick, badge-like values by default.
+
+    On the badge: import demo_badge.report_writer as r; r.benchmark()
+    On CPython: python lib/demo_badge/report_writer.py
+    """
+    import gc
+    import time
+
+    if keys is None:
+        keys = tuple(sample())
+
+    def run(report):
+        gc.collect()
+        alloc = getattr(gc, "mem_alloc", None)
+        before = alloc() if alloc else 0
+        worst = 0
+        for _ in range(ticks):
+            values = sample()
+            start = time.monotonic_ns()
+            report(values)
+            worst = max(worst, time.monotonic_ns() - start)
+        allocated = (alloc() - before) if alloc else 0
+        start = time.monotonic_ns()
+        gc.collect()
+        collect = time.monotonic_ns() - start
+        return allocated // ticks, worst // 1000, collect // 1000
+
+    last = {}
+    def json_report(values):
+        reported_state = {}
+        for k, v in values.items():
+            if k not in last or last[k] != v:
+                reported_state[k] = v
+        payload = {}
+        payload['state'] = {}
+        payload['state']['reported'] = reported_state
+        json.dumps(payload)
+        last.update(reported_state)
+
+    writer = ReportWriter(keys)
+    def writer_report(values):
+        writer.begin()
+        for k, v in values.items():
+            writer.field(k, v)
+        writer.end()
+        writer.sent()
+
+    json_result = run(json_report)
+    writer_result = run(writer_report)
+    print("json.dumps:   {} bytes/tick, max tick {} us, gc.collect {} us".format(*json_result))
+    print("ReportWriter: {} bytes/tick, max tick {} us, gc.collect {} us".format(*writer_result))
+    return json_result, writer_result
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,195 @@
+from adafruit_ticks import ticks_add, ticks_less, ticks_ms
+
+LAST = "last"
+MIN = "min"
+MAX = "max"
+MEAN = "mean"
+AGGREGATES = (LAST, MIN, MAX, MEAN)
+
+DEFAULT = "default" # policy for all keys without their own entry
+FIELDS = ("rate_ms", "deadband", "enabled", "aggregate")
+
+
+def _number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class KeyPolicy:
+    """
+    Reporting policy of one key, and its state over the current window.
+
+    rate_ms: report at most this often (0 = with every report of its shadow)
+    deadband: only report numbers that moved at least this far from the last sent value
+    enabled: False drops the key from reports
+    aggregate: last, min, max or mean of the values sampled since the last report
+    """
+
+    def __init__(self, rate_ms: int=0, deadband: float=0, enabled: bool=True, aggregate: str=LAST) -> None:
+        self.rate_ms = rate_ms
+        self.deadband = deadband
+        self.enabled = enabled
+        self.aggregate = aggregate
+        self._next_due = ticks_ms()
+        self._reset()
+
+    def _reset(self):
+        self._value = None
+        self._count = 0
+
+    def sample(self, value):
+        if self.aggregate == LAST or not _number(value):
+            self._value = value
+            self._count = 1
+            return
+        if self._count == 0:
+            self._value = value
+        elif self.aggregate == MIN:
+            self._value = min(self._value, value)
+        elif self.aggregate == MAX:
+            self._value = max(self._value, value)
+        else:
+            self._value += value # sum, divided in take()
+        self._count += 1
+
+    def take(self):
+        value = self._value
+        if self.aggregate == MEAN and self._count > 1 and _number(value):
+            value = value / self._count
+        self._reset()
+        return value
+
+    def as_dict(self) -> dict:
+        return {'rate_ms': self.rate_ms, 'deadband': self.deadband, 'enabled': self.enabled, 'aggregate': self.aggregate}
+
+
+def _validate(key, fields: dict) -> dict:
+    if not isinstance(fields, dict):
+        raise ValueError(f"reporting.{key} must be an object")
+    for name, value in fields.items():
+        if name not in FIELDS:
+            raise ValueError(f"reporting.{key}: unknown field {name}")
+        if value is None:
+            continue # back to the default
+        if name == "rate_ms" and (not isinstance(value, int) or isinstance(value, bool) or value < 0):
+            raise ValueError(f"reporting.{key}.rate_ms must be an integer >= 0")
+        if name == "deadband" and (not _number(value) or value < 0):
+            raise ValueError(f"reporting.{key}.deadband must be a number >= 0")
+        if name == "enabled" and not isinstance(value, bool):
+            raise ValueError(f"reporting.{key}.enabled must be true or false")
+        if name == "aggregate" and value not in AGGREGATES:
+            raise ValueError(f"reporting.{key}.aggregate must be one of {', '.join(AGGREGATES)}")
+    return fields
+
+
+class ReportingPolicy:
+    """
+    Per-key reporting policies, configured remotely through the `reporting` section of the
+    desired shadow state, e.g.
+
+      "reporting": {
+        "default": {"rate_ms": 4000},
+        "temperature": {"rate_ms": 30000, "deadband": 0.2, "aggregate": "mean"},
+        "acceleration_x": {"enabled": false}
+      }
+
+    Shadow deltas only carry the changed fields, so configure() merges them into the current
+    configuration, and null removes a key's own policy. The configuration is compiled into one
+    KeyPolicy per key, and every shadow is scheduled at the fastest rate of its keys.
+
+    field() replaces ShadowRouter.field(): values are sampled every time, and only handed to
+    the router when the key is due, with its aggregate, and outside of its deadband.
+    The deadband reference is the value the router last confirmed as sent, so deferred and failed
+    reports do not move it.
+    """
+
+    def __init__(self, shadows) -> None:
+        self.shadows = shadows
+        self.config = {} # key -> fields, as received
+        self.scale = 1 # multiplies every rate, e.g. to save battery
+        self._default = KeyPolicy()
+        self._policies = {} # key -> KeyPolicy
+        self.suppressed = 0
+
+    def configure(self, section: dict) -> dict:
+        """
+        Merges a (partial) reporting section and recompiles the policies. Raises ValueError if invalid.
+        Returns the section to report back: the complete configuration, plus a null for every key
+        and field the section removed, because shadow updates merge objects and would keep them.
+        """
+        if not isinstance(section, dict):
+            raise ValueError("reporting must be an object")
+        config = {k: dict(v) for k, v in self.config.items()}
+        removed = {} # key -> None, or key -> {field: None}
+        for key, fields in section.items():
+            if fields is None:
+                config.pop(key, None)
+                removed[key] = None
+                continue
+            merged = config.get(key, {})
+            for name, value in _validate(key, fields).items():
+                if value is None:
+                    merged.pop(name, None)
+                    removed.setdefault(key, {})[name] = None
+                else:
+                    merged[name] = value
+            config[key] = merged
+        self.config = config
+        self._compile()
+        reported = {k: dict(v) for k, v in config.items()}
+        for key, fields in removed.items():
+            if fields is None:
+                reported[key] = None
+            else:
+                reported[key].update(fields)
+        return reported
+
+    def _compile(self):
+        defaults = self.config.get(DEFAULT, {})
+        self._default = KeyPolicy(**defaults)
+        policies = {}
+        for key in list(self.config) + list(self._policies):
+            if key == DEFAULT or key in policies:
+                continue
+            merged = dict(defaults)
+            merged.update(self.config.get(key, {}))
+            policies[key] = KeyPolicy(**merged)
+        self._policies = policies
+
+    def policy(self, key: str) -> KeyPolicy:
+        policy = self._policies.get(key)
+        if policy is None:
+            # keys without their own entry share the default policy settings, but not its state
+            policy = self._policies[key] = KeyPolicy(**self._default.as_dict())
+        return policy
+
+    def shadow_rate(self, index: int, fallback_ms: int) -> int:
+        # the fastest enabled key sets the schedule of its shadow, keys without a rate use fallback_ms
+        rate = None
+        for key in self.shadows.shadows[index].keys:
+            policy = self.policy(key)
+            if not policy.enabled:
+                continue
+            r = policy.rate_ms or fallback_ms
+            if rate is None or r < rate:
+                rate = r
+        return rate or fallback_ms
+
+    def field(self, key: str, value, token=None) -> bool:
+        policy = self.policy(key)
+        if not policy.enabled:
+            return False
+        policy.sample(value)
+        if not self.shadows.due_for(key):
+            return False
+        now = ticks_ms()
+        if policy.rate_ms and ticks_less(now, policy._next_due):
+            return False
+
+        value = policy.take()
+        policy._next_due = ticks_add(now, policy.rate_ms * self.scale)
+        if policy.deadband and _number(value):
+            last = self.shadows.reported(key)
+            if _number(last) and abs(value - last) < policy.deadband:
+                self.suppressed += 1
+                return False
+        return self.shadows.field(key, value, token)
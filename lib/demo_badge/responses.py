@@ -0,0 +1,161 @@
+"""
+Parsers for the ExpressLink response formats, see
+https://docs.aws.amazon.com/iot-expresslink/latest/programmersguide/elpg-commands.html
+
+Patterns are compiled and result types are created once at import, so parsing an event only
+allocates the match and the result tuple. The patterns stick to the subset of regular
+expressions supported by CircuitPython (no counted repetitions, no non-capturing groups).
+"""
+
+import re
+from collections import namedtuple
+
+EventResponse = namedtuple("event", ("event_id", "parameter", "mnemonic", "detail"))
+DateTime = namedtuple("datetime", ("year", "month", "day", "hour", "minute", "second", "microsecond", "source"))
+Location = namedtuple("location", ("datetime", "latitude", "longitude", "elevation", "accuracy", "source"))
+ConnectionState = namedtuple("connection", ("connected", "customer_account", "detail"))
+OTAState = namedtuple("ota", ("code", "detail"))
+
+
+# https://docs.aws.amazon.com/iot-expresslink/latest/programmersguide/elpg-event-handling.html
+class Event:
+    MSG = 1 # parameter = topic index. A message was received on topic #.
+    STARTUP = 2 # parameter = 0. The module has entered the active state.
+    CONLOST = 3 # parameter = 0. Connection unexpectedly lost.
+    OVERRUN = 4 # parameter = 0. Receive buffer Overrun (topic in detail).
+    OTA = 5 # parameter = 0. OTA event (see OTA? command for details).
+    CONNECT = 6 # parameter = Connection Hint. Connection established or failed.
+    CONFMODE = 7 # parameter = 0. CONFMODE exit with success.
+    SUBACK = 8 # parameter = Topic Index. Subscription accepted.
+    SUBNACK = 9 # parameter = Topic Index. Subscription rejected.
+    # 10..19 RESERVED
+    SHADOW_INIT = 20 # parameter = Shadow Index. Shadow initialization successfully.
+    SHADOW_INIT_FAILED = 21 # parameter = Shadow Index. Shadow initialization failed.
+    SHADOW_DOC = 22 # parameter = Shadow Index. Shadow document received.
+    SHADOW_UPDATE = 23 # parameter = Shadow Index. Shadow update result received.
+    SHADOW_DELTA = 24 # parameter = Shadow Index. Shadow delta update received.
+    SHADOW_DELETE = 25 # parameter = Shadow Index. Shadow delete result received
+    SHADOW_SUBACK = 26 # parameter = Shadow Index. Shadow delta subscription accepted.
+    SHADOW_SUBNACK = 27 # parameter = Shadow Index. Shadow delta subscription rejected.
+    # <= 999 RESERVED
+
+
+NO_EVENT = EventResponse(None, None, None, None)
+
+# {event_identifier} {parameter} {mnemonic [detail]}
+_EVENT = re.compile(r"(\d+) (\d+) (\S+) ?(.*)")
+# date YYYY/MM/DD time hh:mm:ss.xx {source}
+_DATETIME = r"(date )?(\d\d\d\d)/(\d\d)/(\d\d) (time )?(\d\d):(\d\d):(\d\d)\.(\d\d)"
+_TIME = re.compile(_DATETIME + r" ?(.*)")
+# {date} {time} {lat} {long} {elev} {accuracy} {source}
+_NUMBER = r" (-?[0-9.]+)"
+_WHERE = re.compile(_DATETIME + _NUMBER + _NUMBER + _NUMBER + _NUMBER + r" ?(.*)")
+# {connected} {customer account} [{detail}]
+_CONNECT = re.compile(r"([01]) ([01]) ?(.*)")
+# {code} [{detail}]
+_OTA = re.compile(r"(\d+) ?(.*)")
+
+
+def parse_event(line: str) -> EventResponse:
+    m = _EVENT.match(line) if line else None
+    if not m:
+        return NO_EVENT
+    return EventResponse(int(m.group(1)), int(m.group(2)), m.group(3), m.group(4) or None)
+
+
+def _datetime(m, source) -> DateTime:
+    return DateTime(
+        year=int(m.group(2)),
+        month=int(m.group(3)),
+        day=int(m.group(4)),
+        hour=int(m.group(6)),
+        minute=int(m.group(7)),
+        second=int(m.group(8)),
+        microsecond=int(m.group(9)) * 10**4,
+        source=source,
+    )
+
+
+def parse_time(line: str):
+    m = _TIME.match(line) if line else None
+    if not m:
+        return None
+    return _datetime(m, m.group(10) or None)
+
+
+def parse_where(line: str):
+    m = _WHERE.match(line) if line else None
+    if not m:
+        return None
+    source = m.group(14) or None
+    return Location(
+        datetime=_datetime(m, source),
+        latitude=float(m.group(10)),
+        longitude=float(m.group(11)),
+        elevation=float(m.group(12)),
+        accuracy=float(m.group(13)),
+        source=source,
+    )
+
+
+def parse_connect(line: str):
+    m = _CONNECT.match(line) if line else None
+    if not m:
+        return None
+    return ConnectionState(m.group(1) == "1", m.group(2) == "1", m.group(3) or None)
+
+
+def parse_ota(line: str):
+    m = _OTA.match(line) if line else None
+    if not m:
+        return None
+    return OTAState(int(m.group(1)), m.group(2) or None)
+
+
+SAMPLE_RESPONSES = (
+    (parse_event, "1 3 MSG"),
+    (parse_event, "4 0 OVERRUN badge/demo/command"),
+    (parse_time, "date 2022/10/30 time 09:38:34.04 SNTP"),
+    (parse_where, "date 2022/10/30 time 09:38:34.04 47.3769 8.5417 408.0 25 GNSS"),
+    (parse_connect, "1 1 CONNECTED CUSTOMER"),
+    (parse_ota, "1 v2.4.1"),
+)
+
+
+def benchmark(iterations: int=200):
+    import gc
+    import time
+
+    def measure(f, line):
+        gc.collect()
+        try:
+            before = gc.mem_alloc()
+            gc.disable()
+            start = time.monotonic_ns()
+            for _ in range(iterations):
+                f(line)
+            elapsed = time.monotonic_ns() - start
+            allocated = gc.mem_alloc() - before
+            gc.enable()
+        except AttributeError:
+            # CPython has no gc.mem_alloc()
+            import tracemalloc
+            tracemalloc.start()
+            start = time.monotonic_ns()
+            for _ in range(iterations):
+                f(line)
+            elapsed = time.monotonic_ns() - start
+            allocated = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return elapsed // iterations // 1000, allocated // iterations
+
+    results = {}
+    for f, line in SAMPLE_RESPONSES:
+        us, allocated = measure(f, line)
+        print(f"{f.__name__}: {us} us, {allocated} bytes per response | {line}")
+        results[line] = (us, allocated)
+
+    # the previous get_event() compiled its pattern for every event
+    us, allocated = measure(lambda l: re.match(r"(\d+) (\d+) (\S+)( \S+)?", l).groups(), "1 3 MSG")
+    print(f"uncompiled re.match: {us} us, {allocated} bytes per event")
+    return results
@@ -0,0 +1,108 @@
+from adafruit_ticks import ticks_diff, ticks_ms
+
+from .ndef_encoder import encode_uri
+from .nfc_nt3hxxxx import NDEFWriter
+
+
+class Scene:
+    """
+    One entry of buttons_config, compiled into everything the outputs need:
+    the rendered QR code, the NDEF message for the NFC tag and the LED buffer.
+    """
+
+    def __init__(self, url: str, color, qr_group, ndef: bytes, leds: bytearray) -> None:
+        self.url = url
+        self.color = color
+        self.qr_group = qr_group
+        self.ndef = ndef
+        self.leds = leds
+
+
+class SceneManager:
+    """
+    Precompiles every buttons_config entry when the configuration arrives, so that switching
+    between them on a button press only swaps the QR group and the LED buffer.
+
+    The NFC tag is rewritten in the background, one EEPROM page per update().
+    """
+
+    def __init__(self, badge, footer=None) -> None:
+        self.badge = badge
+        self.footer = footer
+        self.scenes = {} # 'button_1' -> Scene
+        self.active = None
+        self.nfc_writer = NDEFWriter(badge.nfc_tag)
+        self.switches = 0
+        self.last_switch_ms = 0
+        self.last_compile_ms = 0
+
+    def _compile(self, url: str, color) -> Scene:
+        display = self.badge.display
+        height = display.height - self.footer.height if self.footer else None
+        try:
+            from .qrcode import encode_qr_code # import only on-demand, with the first buttons_config
+            qr_group = encode_qr_code(display, url, height=height)
+        except Exception as e:
+            # e.g. too long for the QR code version, the screen then only shows the footer
+            print(f"Scene {url}: {e}")
+            qr_group = None
+
+        leds = bytearray(len(self.badge.leds) * 3)
+        for i in range(0, len(leds), 3):
+            leds[i] = color[0]
+            leds[i + 1] = color[1]
+            leds[i + 2] = color[2]
+        return Scene(url, color, qr_group, encode_uri(url), leds)
+
+    def load(self, buttons_config: dict):
+        # (re)compiles the entries that changed, e.g. after a buttons_config shadow update
+        start = ticks_ms()
+        for name, entry in buttons_config.items():
+            url, color = entry[0], tuple(entry[1])
+            scene = self.scenes.get(name)
+            if scene and scene.url == url and scene.color == color:
+                continue
+            try:
+                self.scenes[name] = self._compile(url, color)
+            except (ValueError, TypeError, IndexError) as e:
+                print(f"Invalid {name}: {e}")
+                continue
+            if name == self.active:
+                self.activate(name)
+        self.last_compile_ms = ticks_diff(ticks_ms(), start)
+
+    def activate(self, name: str) -> bool:
+        scene = self.scenes.get(name)
+        if scene is None:
+            return False
+        start = ticks_ms()
+        badge = self.badge
+
+        print(f"Sharing URL: {scene.url}")
+        badge.nfc_activity.set_url(scene.url)
+        if scene.qr_group is not None and self.footer:
+            badge.show_qr_group(scene.qr_group, self.footer)
+        elif scene.qr_group is not None:
+            badge.display.show(scene.qr_group)
+        else:
+            badge.display.show(self.footer)
+        badge.leds.load(scene.leds)
+        badge.leds.brightness = 1.0 # sent together with the pixels on the next badge.update()
+        self.nfc_writer.start(scene.ndef)
+
+        self.active = name
+        self.switches += 1
+        self.last_switch_ms = ticks_diff(ticks_ms(), start)
+        return True
+
+    def update(self) -> bool:
+        return self.nfc_writer.update()
+
+    def stats(self) -> dict:
+        return {
+            'scene_switches': self.switches,
+            'scene_switch_ms': self.last_switch_ms,
+            'scene_compile_ms': self.last_compile_ms,
+            'nfc_pages_written': self.nfc_writer.pages_written,
+            'nfc_write_errors': self.nfc_writer.errors,
+        }
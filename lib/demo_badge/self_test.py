@@ -0,0 +1,144 @@
+import json
+from adafruit_ticks import ticks_add, ticks_diff, ticks_less, ticks_ms
+
+OK = "OK"
+FAIL = "FAIL"
+PENDING = "not yet"
+TIMEOUT = "TIMEOUT"
+
+
+class Check:
+    """
+    One peripheral check with its cached result.
+
+    run(badge) returns (status, detail), or is a generator that yields while it waits for the
+    hardware and returns (status, detail) at the end. A generator that is still running after
+    timeout_ms is abandoned with status TIMEOUT.
+    The check is repeated every interval_ms, or never again once it passed if interval_ms is None.
+    Until then, a check without interval_ms is retried retry_ms after every other result.
+    """
+
+    def __init__(self, name: str, run, interval_ms=1000, timeout_ms: int=1000, group=None, retry_ms: int=0) -> None:
+        self.name = name
+        self.run = run
+        self.interval_ms = interval_ms
+        self.timeout_ms = timeout_ms
+        self.retry_ms = retry_ms
+        self.group = group # checks of the same group (e.g. sharing the UART) never overlap
+        self.status = PENDING
+        self.detail = ""
+        self.duration_ms = 0
+        self.runs = 0
+        self._task = None
+        self._started = 0
+        self._deadline = 0
+        self._next_run = ticks_ms()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def due(self, now) -> bool:
+        if self._task is not None:
+            return True
+        if self.status == OK and self.interval_ms is None:
+            return False
+        return not ticks_less(now, self._next_run)
+
+    def _finish(self, now, result):
+        self._task = None
+        self.status, self.detail = result
+        self.duration_ms = ticks_diff(now, self._started)
+        self.runs += 1
+        self._next_run = ticks_add(now, self.interval_ms if self.interval_ms is not None else self.retry_ms)
+
+    def step(self, badge, now):
+        # advances the check by one slice: starts it, resumes it, or times it out
+        if self._task is None:
+            self._started = now
+            self._deadline = ticks_add(now, self.timeout_ms)
+            try:
+                result = self.run(badge)
+            except Exception as e:
+                self._finish(now, (FAIL, str(e)))
+                return
+            if isinstance(result, tuple):
+                self._finish(ticks_ms(), result)
+                return
+            self._task = result
+        try:
+            next(self._task)
+        except StopIteration as e:
+            self._finish(ticks_ms(), e.value or (FAIL, "no result"))
+            return
+        except Exception as e:
+            self._finish(ticks_ms(), (FAIL, str(e)))
+            return
+        if not ticks_less(ticks_ms(), self._deadline):
+            self._finish(ticks_ms(), (TIMEOUT, f"no result after {self.timeout_ms} ms"))
+
+
+class SelfTest:
+    """
+    Runs peripheral checks as independent, time-boxed tasks, interleaved with the main loop.
+
+    step() spends at most budget_ms per call: it advances the checks that are due in turn, so
+    a slow peripheral never stalls the loop, and results are cached between re-checks.
+    """
+
+    def __init__(self, badge, budget_ms: int=20) -> None:
+        self.badge = badge
+        self.budget_ms = budget_ms
+        self.checks = []
+        self._next = 0 # round-robin position
+
+    def add(self, name: str, run, interval_ms=1000, timeout_ms: int=1000, group=None, retry_ms: int=0) -> Check:
+        check = Check(name, run, interval_ms, timeout_ms, group, retry_ms)
+        self.checks.append(check)
+        return check
+
+    def __getitem__(self, name):
+        for c in self.checks:
+            if c.name == name:
+                return c
+        raise KeyError(name)
+
+    def step(self) -> int:
+        start = ticks_ms()
+        deadline = ticks_add(start, self.budget_ms)
+        busy = {c.group for c in self.checks if c.running and c.group}
+        stepped = 0
+        n = len(self.checks)
+        for i in range(n):
+            check = self.checks[(self._next + i) % n]
+            now = ticks_ms()
+            if not ticks_less(now, deadline):
+                self._next = (self._next + i) % n
+                return stepped
+            if not check.due(now):
+                continue
+            if not check.running and check.group in busy:
+                continue
+            check.step(self.badge, now)
+            stepped += 1
+            if check.running and check.group:
+                busy.add(check.group)
+        self._next = (self._next + 1) % n if n else 0
+        return stepped
+
+    @property
+    def passed(self) -> bool:
+        return all(c.status == OK for c in self.checks)
+
+    def report(self) -> dict:
+        return {
+            'passed': self.passed,
+            'checks': {c.name: {'status': c.status, 'detail': c.detail, 'ms': c.duration_ms, 'runs': c.runs} for c in self.checks},
+        }
+
+    def json(self) -> str:
+        return json.dumps(self.report())
+
+    def lines(self):
+        # one line per check for the test screen
+        return [f"{c.status} | {c.detail} | {c.name}" if c.detail else f"{c.status} | {c.name}" for c in self.checks]
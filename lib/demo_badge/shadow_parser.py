@@ -0,0 +1,250 @@
+"""
+Extracts `version` and the `state` section of a shadow document without parsing `metadata`.
+
+https://docs.aws.amazon.com/iot/latest/developerguide/device-shadow-document.html
+
+The document is scanned by index over the raw line, so skipped values (mostly `metadata`,
+which has an entry for every reported and desired key) are never materialised.
+Only the selected section is handed to json.loads. Oversized and malformed documents are
+counted and dropped, they never raise into the main loop.
+
+benchmark() compares time and bytes allocated per document with json.loads. Run it on the
+badge (import demo_badge.shadow_parser as p; p.benchmark()) or with CPython
+(python lib/demo_badge/shadow_parser.py): the heap use on the RP2040 is what the scan saves,
+CPython timings say little about it.
+"""
+
+import json
+
+WHITESPACE = " \t\r\n"
+TOP_KEYS = ("state", "version")
+STATE_KEYS = ("desired", "reported")
+
+# recorded from a Demo Badge classic shadow, used by benchmark()
+SAMPLE_SHADOW_DOC = '1 {"state":{"desired":{"active_button_config":2,"led_animation":"Static"},"reported":{"temperature":24.3147,"humidity":38.7301,"ambient_light":1843.0,"acceleration_x":0.114922,"acceleration_y":-0.229843,"acceleration_z":9.80665,"button_1":"not pressed","button_2":"not pressed","button_3":"not pressed","led_1":16750848,"led_2":16750848,"led_3":16750848,"led_4":16750848,"led_5":16750848,"active_button_config":2,"buttons_config":{"button_1":["https://aws.amazon.com/iot-expresslink/",[255,153,0]],"button_2":["https://aws.amazon.com/iot-core/",[0,255,0]],"button_3":["https://aws.amazon.com/iot-device-defender/",[0,0,255]]},"led_animation":"Static"}},"metadata":{"desired":{"active_button_config":{"timestamp":1673870123},"led_animation":{"timestamp":1673870101}},"reported":{"temperature":{"timestamp":1673870125},"humidity":{"timestamp":1673870125},"ambient_light":{"timestamp":1673870125},"acceleration_x":{"timestamp":1673870125},"acceleration_y":{"timestamp":1673870125},"acceleration_z":{"timestamp":1673870125},"button_1":{"timestamp":1673870001},"button_2":{"timestamp":1673870001},"button_3":{"timestamp":1673870001},"led_1":{"timestamp":1673870123},"led_2":{"timestamp":1673870123},"led_3":{"timestamp":1673870123},"led_4":{"timestamp":1673870123},"led_5":{"timestamp":1673870123},"active_button_config":{"timestamp":1673870123},"buttons_config":{"button_1":[{"timestamp":1673870001},[{"timestamp":1673870001},{"timestamp":1673870001},{"timestamp":1673870001}]],"button_2":[{"timestamp":1673870001},[{"timestamp":1673870001},{"timestamp":1673870001},{"timestamp":1673870001}]],"button_3":[{"timestamp":1673870001},[{"timestamp":1673870001},{"timestamp":1673870001},{"timestamp":1673870001}]]},"led_animation":{"timestamp":1673870101}}},"version":4711,"timestamp":1673870126}'
+
+
+def _skip_ws(s, i, end):
+    while i < end and s[i] in WHITESPACE:
+        i += 1
+    return i
+
+
+def _skip_string(s, i, end):
+    # s[i] is the opening quote, returns the index after the closing quote
+    i += 1
+    while True:
+        q = s.find('"', i, end)
+        if q < 0:
+            raise ValueError("unterminated string")
+        # a quote is escaped by an odd number of backslashes
+        b = q - 1
+        while s[b] == '\\':
+            b -= 1
+        if (q - 1 - b) % 2 == 0:
+            return q + 1
+        i = q + 1
+
+
+def _skip_value(s, i, end):
+    # returns the index after the JSON value starting at s[i]
+    c = s[i]
+    if c == '"':
+        return _skip_string(s, i, end)
+    if c == '{' or c == '[':
+        depth = 1
+        i += 1
+        while i < end:
+            q = s.find('"', i, end)
+            segment_end = end if q < 0 else q
+            closes = s.count('}', i, segment_end) + s.count(']', i, segment_end)
+            if closes < depth:
+                # the value cannot end before the next string, jump over the whole segment
+                depth += s.count('{', i, segment_end) + s.count('[', i, segment_end) - closes
+            else:
+                while i < segment_end:
+                    c = s[i]
+                    if c == '{' or c == '[':
+                        depth += 1
+                    elif c == '}' or c == ']':
+                        depth -= 1
+                        if depth == 0:
+                            return i + 1
+                    i += 1
+            if q < 0:
+                break
+            i = _skip_string(s, q, end)
+        raise ValueError("unterminated object")
+    # number, true, false, null
+    while i < end and s[i] not in ",}] \t\r\n":
+        i += 1
+    return i
+
+
+def _members(s, i, end, keys, spans):
+    """
+    Walks the object at s[i] and stores the start and end index of the value of keys[n] in
+    spans[2n] and spans[2n + 1], or -1 if the key is missing. Returns the index after the object.
+    """
+    for n in range(len(spans)):
+        spans[n] = -1
+    i = _skip_ws(s, i, end)
+    if i >= end or s[i] != '{':
+        raise ValueError("expected object")
+    i += 1
+    while True:
+        i = _skip_ws(s, i, end)
+        if i >= end:
+            raise ValueError("unterminated object")
+        if s[i] == '}':
+            return i + 1
+        if s[i] != '"':
+            raise ValueError("expected key")
+        key_start = i
+        key_end = _skip_string(s, i, end)
+        i = _skip_ws(s, key_end, end)
+        if i >= end or s[i] != ':':
+            raise ValueError("expected ':'")
+        i = _skip_ws(s, i + 1, end)
+        if i >= end:
+            raise ValueError("expected value")
+        value_end = _skip_value(s, i, end)
+        for n in range(len(keys)):
+            # compare in place, without slicing the key out of the document
+            k = keys[n]
+            if key_end - key_start == len(k) + 2 and s.startswith(k, key_start + 1):
+                spans[2 * n] = i
+                spans[2 * n + 1] = value_end
+        i = _skip_ws(s, value_end, end)
+        if i < end and s[i] == ',':
+            i += 1
+        elif i >= end or s[i] != '}':
+            raise ValueError("expected ',' or '}'")
+
+
+class ShadowParser:
+    """
+    Reusable parser: results and the index spans of the scan are kept on the instance instead
+    of being allocated per call.
+
+    After parse() returned True:
+      version: shadow document version, or None if not present
+      section: 'desired', 'reported' or 'state' (delta documents have no sub-sections)
+      state: the parsed section
+
+    max_size caps the document, max_state_size the section that is decoded with json.loads.
+    """
+
+    def __init__(self, max_size: int=8192, max_state_size: int=4096) -> None:
+        self.max_size = max_size
+        self.max_state_size = max_state_size
+        self.version = None
+        self.section = None
+        self.state = None
+        self.rejected = 0 # too large or malformed
+        self._top = [-1] * (2 * len(TOP_KEYS))
+        self._sections = [-1] * (2 * len(STATE_KEYS))
+
+    def _reject(self, reason: str) -> bool:
+        self.section = None
+        self.rejected += 1
+        print("Dropping shadow document:", reason)
+        return False
+
+    def parse(self, line: str) -> bool:
+        self.version = None
+        self.section = None
+        self.state = None
+
+        start = 0
+        if line.startswith("1 "):
+            start = 2
+        elif line.startswith("0 "):
+            print("ExpressLink SHADOW rejected:", line)
+            return False
+
+        end = len(line)
+        if end - start > self.max_size:
+            return self._reject(f"too large: {end - start} bytes")
+
+        top = self._top
+        sections = self._sections
+        try:
+            _members(line, start, end, TOP_KEYS, top)
+            if top[2] >= 0:
+                self.version = int(line[top[2]:top[3]])
+            if top[0] < 0:
+                return False
+            state_start = top[0]
+            state_end = top[1]
+            _members(line, state_start, state_end, STATE_KEYS, sections)
+        except (ValueError, IndexError) as e:
+            return self._reject(f"invalid JSON: {e}")
+
+        if sections[0] >= 0:
+            # first: handle delta updates and unfinished desired
+            self.section = "desired"
+            value_start = sections[0]
+            value_end = sections[1]
+        elif sections[2] >= 0:
+            # second: handle initial shadow doc from previous reported
+            self.section = "reported"
+            value_start = sections[2]
+            value_end = sections[3]
+        else:
+            self.section = "state"
+            value_start = state_start
+            value_end = state_end
+
+        if value_end - value_start > self.max_state_size:
+            return self._reject(f"{self.section} too large: {value_end - value_start} bytes")
+        try:
+            state = json.loads(line[value_start:value_end])
+        except ValueError as e:
+            return self._reject(f"invalid JSON: {e}")
+        if not isinstance(state, dict):
+            return self._reject(f"{self.section} is not an object")
+        self.state = state
+        return True
+
+
+def benchmark(doc: str=SAMPLE_SHADOW_DOC, iterations: int=20):
+    """
+    Time and bytes allocated per document, for json.loads of the whole document and ShadowParser.
+    The bytes come from gc.mem_alloc() on the badge, and from tracemalloc on CPython.
+    """
+    import gc
+    import time
+
+    def measure(f):
+        gc.collect()
+        alloc = getattr(gc, "mem_alloc", None)
+        if alloc is None:
+            import tracemalloc # CPython has no gc.mem_alloc()
+            tracemalloc.start()
+        else:
+            before = alloc()
+            gc.disable() # count every allocation, not what is left after a collection
+        start = time.monotonic_ns()
+        for _ in range(iterations):
+            f()
+        elapsed = time.monotonic_ns() - start
+        if alloc is None:
+            # the peak, each iteration frees what the previous one allocated
+            allocated = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            allocated = (alloc() - before) // iterations
+            gc.enable()
+        return elapsed // iterations // 1000, allocated
+
+    parser = ShadowParser()
+    json_us, json_bytes = measure(lambda: json.loads(doc[2:])['state'])
+    parser_us, parser_bytes = measure(lambda: parser.parse(doc))
+    print(f"json.loads:   {json_us} us, {json_bytes} bytes per document")
+    print(f"ShadowParser: {parser_us} us, {parser_bytes} bytes per document")
+    return (json_us, json_bytes), (parser_us, parser_bytes)
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,208 @@
+import json
+from adafruit_ticks import ticks_add, ticks_less, ticks_ms
+
+from .responses import Event
+from .report_writer import ReportWriter
+
+CLASSIC = 0 # shadow index 0 is the classic (unnamed) shadow
+
+
+def _index(index):
+    # ExpressLink commands address the classic shadow without an index
+    return '' if index == CLASSIC else index
+
+
+class Shadow:
+    def __init__(self, index: int, name, keys, rate_ms: int) -> None:
+        self.index = index
+        self.name = name
+        self.keys = keys
+        self.rate_ms = rate_ms
+        self.writer = ReportWriter(keys)
+        self.due = True
+        self._next_update = ticks_ms()
+        self.version = None # version of the last applied document
+        self.applied = {} # desired key -> value last applied to the hardware
+        self.stale = 0
+
+
+class ShadowRouter:
+    """
+    Routes reported keys to the classic shadow or to named shadows (Shadow1..N), each with its
+    own reporting rate, so fast-changing telemetry does not churn the configuration shadow.
+
+    on_document(index, line) is called with every SHADOW_DOC and SHADOW_DELTA line.
+    accept() drops documents that are not newer than the last applied one, and filters their
+    state down to the keys whose value differs from what was last applied.
+    """
+
+    def __init__(self, el, on_document=None) -> None:
+        self.el = el
+        self.on_document = on_document
+        self.shadows = {} # index -> Shadow
+        self._routes = {} # key -> Shadow
+
+    def add(self, index: int, name, keys, rate_ms: int=4000) -> Shadow:
+        shadow = Shadow(index, name, keys, rate_ms)
+        self.shadows[index] = shadow
+        for k in keys:
+            self._routes[k] = shadow
+        return shadow
+
+    def shadow_for(self, key):
+        return self._routes.get(key)
+
+    def setup(self):
+        # configure, initialise and subscribe all shadows, needed after every (re)connect
+        self.el.config.enable_shadow = True
+        for index, shadow in self.shadows.items():
+            # the shadow may have been deleted and recreated meanwhile, restarting its version
+            shadow.version = None
+            if index != CLASSIC:
+                self.el.config.set_shadow(index, shadow.name)
+            self.el.shadow_init(_index(index))
+            self.el.shadow_doc(_index(index))
+            self.el.shadow_subscribe(_index(index))
+
+    def due(self) -> bool:
+        now = ticks_ms()
+        for shadow in self.shadows.values():
+            if not ticks_less(now, shadow._next_update):
+                return True
+        return False
+
+    def begin(self):
+        now = ticks_ms()
+        for shadow in self.shadows.values():
+            shadow.due = not ticks_less(now, shadow._next_update)
+            if shadow.due:
+                shadow.writer.begin()
+
+    def due_for(self, key: str) -> bool:
+        # True between begin() and end() if the shadow of this key is reported in this round
+        return self._routes[key].due
+
+    def field(self, key: str, value, token=None) -> bool:
+        # values for shadows that are not due yet stay unreported until their next slot
+        shadow = self._routes[key]
+        if not shadow.due:
+            return False
+        return shadow.writer.field(key, value, token)
+
+    def reported(self, key: str):
+        # last value of the key that was confirmed as sent, see ReportWriter.sent()
+        return self._routes[key].writer.reported(key)
+
+    def end(self, send=None) -> int:
+        """
+        Sends the changed values of every due shadow, and schedules its next update.
+        send(index, payload) can replace the direct shadow update, e.g. to spool while offline,
+        and returns True once the values are taken care of. Values of a failed update are
+        written again with the next report.
+        Returns the number of shadow updates.
+        """
+        n = 0
+        now = ticks_ms()
+        for index, shadow in self.shadows.items():
+            if not shadow.due:
+                continue
+            shadow.due = False
+            shadow._next_update = ticks_add(now, shadow.rate_ms)
+            payload = shadow.writer.end()
+            if not payload:
+                continue
+            if send:
+                ok = send(index, payload)
+            else:
+                ok = self.send(index, payload)[0]
+            if ok:
+                shadow.writer.sent()
+            if shadow.writer.deferred:
+                shadow._next_update = now # the report was full, the rest goes out with the next loop
+            n += 1
+        return n
+
+    def send(self, index: int, payload):
+        return self.el.shadow_update(payload, _index(index))
+
+    def request(self, index: int):
+        # report the given shadow on the next loop iteration, instead of waiting for its slot
+        self.shadows[index]._next_update = ticks_ms()
+
+    def set_rate(self, index: int, rate_ms: int):
+        shadow = self.shadows[index]
+        shadow.rate_ms = rate_ms
+        shadow._next_update = ticks_ms()
+
+    def forget(self):
+        for shadow in self.shadows.values():
+            shadow.writer.forget()
+
+    def update(self, index: int, state: dict):
+        # JSON shadow update for a given shadow, e.g. to acknowledge desired state
+        return self.send(index, json.dumps(state))
+
+    def send_values(self, values: dict) -> bool:
+        # report a plain dict of values, split by owning shadow (unknown keys go to the classic shadow)
+        grouped = {}
+        for k, v in values.items():
+            shadow = self._routes.get(k)
+            index = shadow.index if shadow else CLASSIC
+            if index not in grouped:
+                grouped[index] = {}
+            grouped[index][k] = v
+        ok = True
+        for index, reported in grouped.items():
+            success, line, err = self.update(index, {'state': {'reported': reported}})
+            ok = ok and success
+        return ok
+
+    def accept(self, index: int, version, state: dict):
+        """
+        Returns the part of a desired state that changed since the last applied document,
+        or None if the document is stale (its version is not newer than the last applied).
+        The returned values are recorded as applied.
+        """
+        shadow = self.shadows.get(index)
+        if shadow is None:
+            return state
+        if version is not None:
+            if shadow.version is not None and version <= shadow.version:
+                shadow.stale += 1
+                return None
+            shadow.version = version
+        changed = {}
+        applied = shadow.applied
+        for k, v in state.items():
+            if k not in applied or applied[k] != v:
+                applied[k] = v
+                changed[k] = v
+        return changed
+
+    def invalidate(self, key: str):
+        # the value of key was changed locally, so the next desired value is applied again
+        shadow = self._routes.get(key) or self.shadows[CLASSIC]
+        shadow.applied.pop(key, None)
+
+    def handle_event(self, event_id, parameter) -> bool:
+        if event_id == Event.SHADOW_DOC:
+            success, line, err = self.el.shadow_get_doc(_index(parameter))
+        elif event_id == Event.SHADOW_DELTA:
+            success, line, err = self.el.shadow_get_delta(_index(parameter))
+        elif event_id == Event.SHADOW_UPDATE:
+            t = self.el.debug
+            self.el.debug = False
+            self.el.shadow_get_update(_index(parameter))
+            self.el.debug = t
+            # shadow update accepted, no further processing needed
+            return True
+        elif event_id == Event.SHADOW_INIT_FAILED or event_id == Event.SHADOW_SUBNACK:
+            print(f"Shadow {parameter} failed: event {event_id}")
+            return True
+        elif event_id == Event.SHADOW_INIT or event_id == Event.SHADOW_SUBACK:
+            return True
+        else:
+            return False
+        if self.on_document:
+            self.on_document(parameter, line)
+        return True
@@ -0,0 +1,224 @@
+"""
+Store-and-forward spool for reported state while the badge is offline.
+
+Deltas are appended to a compact binary log on flash, one record per key:
+  B    key length
+  ...  key (utf-8)
+  B    type: i=int32, f=float32, b=bool, n=None, s=str, j=JSON
+  ...  value (int32/float32 little-endian, bool as one byte, str/JSON as H length + utf-8)
+
+Only the latest value of each key is kept in memory. The flash is written at most every
+write_interval_ms, so reporting every 100 ms neither wears the flash nor blocks the loop on it:
+either one append with the latest value of every key changed since the last write, or, once
+values were sent or discarded, or the log grew beyond max_bytes, a rewrite with just the
+pending values. A reboot during replay sends again at most the values sent in the last interval.
+Values that a newer live report replaced are discarded, they must not overwrite it when replayed.
+After a reboot the log is read back. A truncated last record (power loss while writing) is ignored.
+
+The CIRCUITPY drive is read-only for code unless boot.py remounts it, see boot.py in the root
+of this repo. Without a writable filesystem the spool keeps working from RAM only, which is
+reported once at startup and in stats(). Any file path works on Linux as well.
+"""
+
+import json
+import struct
+from adafruit_ticks import ticks_add, ticks_less, ticks_ms
+
+
+def _encode(key, value) -> bytes:
+    k = key.encode()
+    if value is None:
+        v = b'n'
+    elif value is True or value is False:
+        v = b'b' + (b'\x01' if value else b'\x00')
+    elif isinstance(value, int) and -0x80000000 <= value <= 0x7FFFFFFF:
+        v = b'i' + struct.pack('<i', value)
+    elif isinstance(value, float):
+        v = b'f' + struct.pack('<f', value)
+    elif isinstance(value, str):
+        s = value.encode()
+        v = b's' + struct.pack('<H', len(s)) + s
+    else:
+        s = json.dumps(value).encode()
+        v = b'j' + struct.pack('<H', len(s)) + s
+    return bytes([len(k)]) + k + v
+
+
+def _decode(data, pending):
+    i = 0
+    end = len(data)
+    try:
+        while i < end:
+            n = data[i]
+            key = bytes(data[i + 1:i + 1 + n]).decode()
+            i += 1 + n
+            t = data[i]
+            i += 1
+            if t == 0x6E: # n
+                value = None
+            elif t == 0x62: # b
+                value = bool(data[i])
+                i += 1
+            elif (t == 0x69 or t == 0x66) and i + 4 > end:
+                break
+            elif t == 0x69: # i
+                value = struct.unpack_from('<i', data, i)[0]
+                i += 4
+            elif t == 0x66: # f
+                value = struct.unpack_from('<f', data, i)[0]
+                i += 4
+            elif t == 0x73 or t == 0x6A: # s, j
+                if i + 2 > end:
+                    break
+                length = struct.unpack_from('<H', data, i)[0]
+                if i + 2 + length > end:
+                    break
+                value = bytes(data[i + 2:i + 2 + length]).decode()
+                if t == 0x6A:
+                    value = json.loads(value)
+                i += 2 + length
+            else:
+                print(f"Spool: unknown record type {t}, ignoring the rest of the log")
+                break
+            if i > end:
+                break
+            pending[key] = value
+    except (IndexError, ValueError) as e:
+        # incomplete last record
+        print("Spool: truncated log:", e)
+
+
+def _read_only() -> bool:
+    # CircuitPython tells whether code may write the filesystem, elsewhere the first write does
+    try:
+        import storage
+    except ImportError:
+        return False
+    try:
+        return storage.getmount("/").readonly
+    except (OSError, ValueError):
+        return False
+
+
+class ReportSpool:
+    def __init__(self, path: str="/spool.bin", max_bytes: int=8192, batch_size: int=8, min_interval_ms: int=1000, write_interval_ms: int=10000) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.min_interval_ms = min_interval_ms
+        self.write_interval_ms = write_interval_ms
+        self.pending = {}
+        self._unwritten = set() # keys whose latest value is not on flash yet
+        self._stale = False # the log holds values that were sent or discarded since
+        self._size = 0
+        self._writable = True
+        self._next_flush = ticks_ms()
+        self._next_write = ticks_ms()
+
+        self.spooled = 0
+        self.flushed = 0
+        self.writes = 0
+
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+            self._size = len(data)
+            _decode(data, self.pending)
+            if self.pending:
+                print(f"Spool: {len(self.pending)} values from before the last reboot")
+        except OSError:
+            pass # no log yet
+
+        if _read_only():
+            print("Spool: the filesystem is read-only for code, spooled values are kept in RAM only")
+            self._writable = False
+
+    def __len__(self):
+        return len(self.pending)
+
+    @property
+    def persistent(self) -> bool:
+        # False if spooled values would be lost on a reboot
+        return self._writable
+
+    def _write(self, data, mode):
+        if not self._writable:
+            return
+        try:
+            with open(self.path, mode) as f:
+                f.write(data)
+            self._size = len(data) if mode == "wb" else self._size + len(data)
+            self.writes += 1
+        except OSError as e:
+            print("Spool: filesystem not writable, keeping values in RAM only:", e)
+            self._writable = False
+
+    def _compact(self):
+        self._write(b''.join(_encode(k, v) for k, v in self.pending.items()), "wb")
+        self._unwritten.clear()
+        self._stale = False
+
+    def update(self, force: bool=False):
+        """
+        Brings the log up to date with the pending values, at most every write_interval_ms.
+        Called from the main loop, so the last changes reach the flash even if no more arrive.
+        """
+        if not (self._unwritten or self._stale) or not self._writable:
+            return
+        if not force and ticks_less(ticks_ms(), self._next_write):
+            return
+        self._next_write = ticks_add(ticks_ms(), self.write_interval_ms)
+        data = b''.join(_encode(k, self.pending[k]) for k in self._unwritten if k in self.pending)
+        if self._stale or self._size + len(data) > self.max_bytes:
+            # superseded values are dropped, only the latest value per key is rewritten
+            self._compact()
+        else:
+            self._write(data, "ab")
+            self._unwritten.clear()
+
+    def append(self, values: dict):
+        self.pending.update(values)
+        self._unwritten.update(values)
+        self.spooled += len(values)
+        self.update()
+
+    def discard(self, keys):
+        # a newer value of these keys was reported live, the spooled ones are outdated
+        for k in keys:
+            if k in self.pending:
+                del self.pending[k]
+                self._unwritten.discard(k)
+                self._stale = True
+
+    def flush(self, send) -> int:
+        """
+        Sends up to batch_size pending values, at most every min_interval_ms.
+        send(values) must return True once the values were accepted.
+        """
+        if not self.pending or ticks_less(ticks_ms(), self._next_flush):
+            return 0
+        self._next_flush = ticks_add(ticks_ms(), self.min_interval_ms)
+
+        batch = {}
+        for k in self.pending:
+            batch[k] = self.pending[k]
+            if len(batch) >= self.batch_size:
+                break
+        if not send(batch):
+            return 0
+
+        for k in batch:
+            del self.pending[k]
+            self._unwritten.discard(k)
+        self.flushed += len(batch)
+        # sent values are removed from the log with the next write, not after every batch
+        self._stale = True
+        self.update()
+        return len(batch)
+
+    def stats(self) -> dict:
+        return {
+            'spool_pending': len(self.pending),
+            'spool_persistent': self.persistent,
+            'spool_writes': self.writes,
+        }
@@ -0,0 +1,87 @@
+"""
+Compact binary telemetry frames for high-rate sensor reporting.
+
+A frame is packed with struct into a reused buffer and published base64-encoded,
+because ExpressLink SEND takes a single line of text.
+
+Frame layout, little-endian, schema version 1 (21 bytes, 28 characters base64):
+  B  magic 0xEB
+  B  schema version
+  H  sequence number
+  I  badge uptime in ms (ticks)
+  h  temperature in 0.01 degree C
+  H  relative humidity in 0.01 %
+  H  ambient light, raw ADC value
+  h  acceleration x in 0.01 m/s^2
+  h  acceleration y in 0.01 m/s^2
+  h  acceleration z in 0.01 m/s^2
+  B  buttons pressed bit field, bit0 = button 1
+
+decode() runs on CPython as well. The decodeTelemetry Lambda function has its own decoder,
+deploy/sync_lambda.py checks that it reads the frames this encoder writes.
+"""
+
+import binascii
+import struct
+
+MAGIC = 0xEB
+SCHEMA_VERSION = 1
+FRAME_FORMAT = "<BBHIhHHhhhB"
+FRAME_SIZE = struct.calcsize(FRAME_FORMAT)
+FIELDS = (
+    "sequence", "uptime_ms", "temperature", "humidity", "ambient_light",
+    "acceleration_x", "acceleration_y", "acceleration_z", "buttons",
+)
+
+
+def _clamp(v, lo, hi):
+    return lo if v < lo else hi if v > hi else v
+
+
+class TelemetryEncoder:
+    def __init__(self) -> None:
+        self.sequence = 0
+        self._buf = bytearray(FRAME_SIZE)
+
+    def encode(self, uptime_ms, temperature, humidity, ambient_light, acceleration, buttons) -> bytes:
+        struct.pack_into(
+            FRAME_FORMAT, self._buf, 0,
+            MAGIC,
+            SCHEMA_VERSION,
+            self.sequence,
+            uptime_ms & 0xFFFFFFFF,
+            _clamp(int(temperature * 100), -32768, 32767),
+            _clamp(int(humidity * 100), 0, 65535),
+            _clamp(int(ambient_light), 0, 65535),
+            _clamp(int(acceleration[0] * 100), -32768, 32767),
+            _clamp(int(acceleration[1] * 100), -32768, 32767),
+            _clamp(int(acceleration[2] * 100), -32768, 32767),
+            buttons & 0xFF,
+        )
+        self.sequence = (self.sequence + 1) & 0xFFFF
+        return binascii.b2a_base64(self._buf).rstrip()
+
+    def publish(self, el, topic_index, *args):
+        return el.publish(topic_index, self.encode(*args).decode())
+
+
+def decode(data) -> dict:
+    if isinstance(data, str):
+        data = data.encode()
+    raw = binascii.a2b_base64(data)
+    if len(raw) < 2 or raw[0] != MAGIC:
+        raise ValueError("not a telemetry frame")
+    if raw[1] != SCHEMA_VERSION:
+        raise ValueError(f"unsupported telemetry schema version {raw[1]}")
+    if len(raw) != FRAME_SIZE:
+        raise ValueError(f"invalid telemetry frame size {len(raw)}")
+
+    values = struct.unpack(FRAME_FORMAT, raw)[2:]
+    frame = dict(zip(FIELDS, values))
+    frame["schema_version"] = SCHEMA_VERSION
+    for k in ("temperature", "humidity", "acceleration_x", "acceleration_y", "acceleration_z"):
+        frame[k] = frame[k] / 100
+    frame["ambient_light"] = float(frame["ambient_light"])
+    for i in range(3):
+        frame[f"button_{i + 1}"] = "pressed" if frame["buttons"] & (1 << i) else "not pressed"
+    return frame
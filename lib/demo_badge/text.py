@@ -0,0 +1,229 @@
+import os
+import bitmaptools
+import displayio
+import terminalio
+
+DIGITS = "0123456789.-+ "
+
+
+class GlyphLRU:
+    """
+    Bounded glyph cache for a BDF/PCF font loaded with adafruit_bitmap_font.
+
+    The font's own cache keeps every glyph ever drawn. This wrapper keeps at most max_glyphs of
+    them, and drops the least recently used one from the font when a new glyph is loaded.
+    It can be used wherever a font is expected, e.g. label.Label or NumericField.
+    """
+
+    def __init__(self, font, max_glyphs: int=64) -> None:
+        self._font = font
+        self.max_glyphs = max_glyphs
+        self._used = {} # code point -> last use
+        self._clock = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getattr__(self, name):
+        return getattr(self._font, name)
+
+    def get_bounding_box(self):
+        return self._font.get_bounding_box()
+
+    def load_glyphs(self, code_points):
+        # one load_glyphs call for all glyphs not cached yet, the BDF loader scans the file once per call
+        if isinstance(code_points, str):
+            code_points = [ord(c) for c in code_points]
+        elif isinstance(code_points, int):
+            code_points = (code_points,)
+        missing = []
+        for c in code_points:
+            self._clock += 1
+            if c in self._used:
+                self.hits += 1
+            elif c not in missing:
+                self.misses += 1
+                if len(self._used) >= self.max_glyphs:
+                    evicted = self._evict()
+                    if evicted in missing: # more glyphs than fit, the first ones are not loaded
+                        missing.remove(evicted)
+                missing.append(c)
+            self._used[c] = self._clock
+        if missing:
+            self._font.load_glyphs(missing)
+
+    def get_glyph(self, code_point: int):
+        self._clock += 1
+        if code_point in self._used:
+            self.hits += 1
+        else:
+            self.misses += 1
+            if len(self._used) >= self.max_glyphs:
+                self._evict()
+        self._used[code_point] = self._clock
+        return self._font.get_glyph(code_point)
+
+    def _evict(self):
+        oldest = None
+        for c, t in self._used.items():
+            if oldest is None or t < self._used[oldest]:
+                oldest = c
+        del self._used[oldest]
+        glyphs = getattr(self._font, "_glyphs", None)
+        if glyphs is not None and oldest in glyphs:
+            del glyphs[oldest]
+        self.evictions += 1
+        return oldest
+
+    def stats(self) -> dict:
+        return {
+            'glyphs': len(self._used),
+            'glyph_hits': self.hits,
+            'glyph_misses': self.misses,
+            'glyph_evictions': self.evictions,
+        }
+
+
+def load_font(path=None, max_glyphs: int=64):
+    # BDF or PCF font from the filesystem, or the built-in terminal font if there is none
+    if path is None:
+        return terminalio.FONT
+    try:
+        os.stat(path)
+    except OSError:
+        return terminalio.FONT
+    from adafruit_bitmap_font import bitmap_font # import only on-demand to save memory
+    return GlyphLRU(bitmap_font.load_font(path), max_glyphs)
+
+
+def _cell_size(font, text: str):
+    # monospaced cell for the given characters: the widest advance, and the font's line height
+    if hasattr(font, "load_glyphs"):
+        font.load_glyphs(text)
+    width = 0
+    for c in text:
+        glyph = font.get_glyph(ord(c))
+        if glyph:
+            width = max(width, glyph.shift_x, glyph.width + max(glyph.dx, 0))
+    return width, font.get_bounding_box()[1]
+
+
+def _blit_glyph(bitmap, font, glyph, x: int, height: int):
+    # glyphs are tiles of width glyph.width in one row of the font bitmap
+    box = font.get_bounding_box()
+    baseline = height + (box[3] if len(box) > 3 else 0) # the built-in font has no offsets
+    dx = x + glyph.dx
+    dy = baseline - glyph.height - glyph.dy
+    x1 = glyph.tile_index * glyph.width
+    y1 = 0
+    x2 = x1 + glyph.width
+    y2 = glyph.height
+    # clip to the destination
+    if dx < 0:
+        x1 -= dx
+        dx = 0
+    if dy < 0:
+        y1 -= dy
+        dy = 0
+    x2 = min(x2, x1 + bitmap.width - dx)
+    y2 = min(y2, y1 + bitmap.height - dy)
+    if x2 > x1 and y2 > y1:
+        bitmaptools.blit(bitmap, glyph.bitmap, dx, dy, x1=x1, y1=y1, x2=x2, y2=y2, skip_source_index=0)
+
+
+def render_text(font, text: str, cell_width: int=0) -> displayio.Bitmap:
+    """
+    Rasterises text once into a 2-color bitmap (0 background, 1 text).
+    With cell_width, every character gets a fixed-width cell (e.g. a sheet of digit tiles).
+    """
+    height = font.get_bounding_box()[1]
+    if hasattr(font, "load_glyphs"): # not the built-in font
+        font.load_glyphs(text)
+    glyphs = [font.get_glyph(ord(c)) for c in text]
+    if cell_width:
+        width = cell_width * len(text)
+    else:
+        width = sum(g.shift_x for g in glyphs if g)
+    bitmap = displayio.Bitmap(max(width, 1), height, 2)
+    x = 0
+    for g in glyphs:
+        if g:
+            _blit_glyph(bitmap, font, g, x, height)
+        x += cell_width or (g.shift_x if g else 0)
+    return bitmap
+
+
+def _palette(color, background=None):
+    palette = displayio.Palette(2)
+    palette[0] = background if background is not None else 0x000000
+    palette[1] = color
+    if background is None:
+        palette.make_transparent(0)
+    return palette
+
+
+class NumericField(displayio.Group):
+    """
+    A fixed-width field drawn from a pre-rendered sheet of character tiles.
+
+    The digits, sign, decimal point and the literal characters of fmt are rendered once into
+    the sheet. set() only changes the tile index of the characters that differ, so displayio
+    redraws those cells and nothing is rasterised at runtime. Characters missing from the sheet
+    are shown as blanks.
+    """
+
+    def __init__(self, font, width: int, fmt: str="{}", color=0xFFFFFF, background=None, charset: str=DIGITS, scale: int=1, name: str=None) -> None:
+        super().__init__(scale=scale)
+        self.name = name
+        self.width = width
+        self.fmt = fmt
+        # literal characters of the format string, outside of the {} replacement fields
+        literal = ""
+        depth = 0
+        for c in fmt:
+            if c == "{":
+                depth += 1
+            elif c == "}":
+                depth -= 1
+            elif not depth:
+                literal += c
+        chars = ""
+        for c in " " + charset + literal:
+            if c not in chars:
+                chars += c
+        self._index = {c: i for i, c in enumerate(chars)}
+
+        cell_width, cell_height = _cell_size(font, chars)
+        self.cell_pixels = cell_width * cell_height * scale * scale
+        sheet = render_text(font, chars, cell_width)
+        self.tiles = displayio.TileGrid(
+            sheet,
+            pixel_shader=_palette(color, background),
+            width=width,
+            height=1,
+            tile_width=cell_width,
+            tile_height=cell_height,
+            default_tile=0,
+        )
+        self.append(self.tiles)
+        self.text = " " * width
+        self.changed_pixels = 0
+
+    def set(self, value) -> bool:
+        text = self.fmt.format(value) if value is not None else ""
+        if len(text) > self.width:
+            text = text[:self.width]
+        elif len(text) < self.width:
+            text = text + " " * (self.width - len(text))
+        if text == self.text:
+            return False
+        changed = 0
+        tiles = self.tiles
+        for i in range(self.width):
+            tile = self._index.get(text[i], 0)
+            if tiles[i] != tile:
+                tiles[i] = tile
+                changed += 1
+        self.text = text
+        self.changed_pixels = changed * self.cell_pixels
+        return changed > 0
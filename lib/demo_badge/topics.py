@@ -0,0 +1,160 @@
+from adafruit_ticks import ticks_add, ticks_less, ticks_ms
+
+from .responses import Event
+
+# ExpressLink provides at least Topic1..Topic16, see MaxTopic in the configuration dictionary
+# https://docs.aws.amazon.com/iot-expresslink/latest/programmersguide/elpg-configuration-dictionary.html
+MAX_TOPICS = 16
+
+
+class TopicManager:
+    """
+    Keeps the bidirectional topic index <-> name map, allocates free TopicN slots and routes
+    incoming messages to per-topic callbacks. ExpressLink itself only deals in indices.
+
+    callback(topic_name, message) is called for every message received on a subscribed topic.
+    With an inbox (MessageInbox), messages are drained into the inbox on Event.MSG and
+    delivered from process().
+    """
+
+    def __init__(self, el, max_topics: int=MAX_TOPICS, inbox=None) -> None:
+        self.el = el
+        self.max_topics = max_topics
+        self.inbox = inbox
+        self._names = {} # index -> name
+        self._indices = {} # name -> index
+        self._callbacks = {} # index -> callback
+        self._subscribed = {} # index -> True once SUBACK was received
+        self._configured = {} # index -> True if CONF TopicN is set on the module
+        self._paused = {} # index -> ticks when the subscription is restored
+
+    def index(self, name):
+        return self._indices.get(name)
+
+    def name(self, index):
+        return self._names.get(index)
+
+    def _allocate(self, name):
+        index = self._indices.get(name)
+        if index is not None:
+            return index
+        for index in range(1, self.max_topics + 1):
+            if index not in self._names:
+                self._names[index] = name
+                self._indices[name] = index
+                return index
+        raise RuntimeError(f"no free topic slot for {name}")
+
+    def _configure(self, index):
+        success, line, err = self.el.config.set_topic(index, self._names[index])
+        self._configured[index] = success
+        return success
+
+    def register(self, name: str) -> int:
+        # configure a topic for publishing only
+        name = name.strip()
+        index = self._allocate(name)
+        if not self._configured.get(index):
+            self._configure(index)
+        return index
+
+    def subscribe(self, name: str, callback=None) -> int:
+        index = self.register(name)
+        if callback:
+            self._callbacks[index] = callback
+        self._subscribed[index] = False
+        self.el.subscribe(index)
+        return index
+
+    def unsubscribe(self, name: str):
+        index = self._indices.pop(name, None)
+        if index is None:
+            return
+        del self._names[index]
+        self._callbacks.pop(index, None)
+        self._configured.pop(index, None)
+        self._paused.pop(index, None)
+        if self._subscribed.pop(index, None) is not None:
+            self.el.unsubscribe(index)
+
+    def pause(self, name: str, duration_ms: int):
+        # unsubscribes for duration_ms, the topic stays registered and is subscribed again by process()
+        index = self._indices.get(name)
+        if index is None or index not in self._subscribed:
+            return
+        if index not in self._paused:
+            self.el.unsubscribe(index)
+        self._subscribed[index] = False
+        self._paused[index] = ticks_add(ticks_ms(), duration_ms)
+
+    def _resume(self):
+        now = ticks_ms()
+        for index in list(self._paused):
+            if not ticks_less(now, self._paused[index]):
+                del self._paused[index]
+                print(f"Subscribing to {self._names[index]} again")
+                self.el.subscribe(index)
+
+    def publish(self, name: str, message: str):
+        return self.el.publish(self._indices[name], message)
+
+    def restore(self, reconfigure: bool=False):
+        """
+        Re-subscribes all topics after a reconnect, in one pass.
+        CONF TopicN survives a lost connection, so it is only sent again after the module was
+        (re)started or when reconfigure is set.
+        """
+        for index in self._names:
+            if reconfigure or not self._configured.get(index):
+                self._configure(index)
+            if index in self._subscribed and index not in self._paused:
+                self._subscribed[index] = False
+                self.el.subscribe(index)
+
+    def handle_event(self, event_id, parameter, detail=None) -> bool:
+        if event_id == Event.MSG:
+            if self.inbox is not None:
+                self.inbox.drain(self.el)
+            else:
+                self.deliver(parameter)
+        elif event_id == Event.OVERRUN:
+            if self.inbox is not None:
+                self.inbox.overrun(detail, self)
+            else:
+                print(f"Receive buffer overrun: {detail}")
+        elif event_id == Event.SUBACK:
+            if parameter in self._subscribed:
+                self._subscribed[parameter] = True
+        elif event_id == Event.SUBNACK:
+            print(f"Subscription rejected: {self._names.get(parameter)}")
+        elif event_id == Event.STARTUP:
+            # the module restarted and lost its topic configuration
+            self._configured.clear()
+        else:
+            return False
+        return True
+
+    def deliver(self, index):
+        success, message = self.el.get_message(topic_index=index)
+        if success is False or not message:
+            return
+        self.dispatch(self._names.get(index), message)
+
+    def dispatch(self, name, message):
+        callback = self._callbacks.get(self._indices.get(name))
+        if callback:
+            callback(name, message)
+        else:
+            print(f"No handler for message on topic {name}: {message}")
+
+    def process(self, limit: int=4):
+        # deliver up to `limit` queued messages per call, to keep the main loop responsive
+        if self._paused:
+            self._resume()
+        if self.inbox is None:
+            return
+        for _ in range(limit):
+            name, message = self.inbox.pop()
+            if name is None:
+                return
+            self.dispatch(name, message)
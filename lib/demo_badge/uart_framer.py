@@ -0,0 +1,136 @@
+from adafruit_ticks import ticks_add, ticks_less, ticks_ms
+
+LF = 0x0A
+# bytes stripped from both ends of a line: line endings and the noise some modules emit after a reset
+JUNK = b"\r\n\x00\xff\xfe\xfd\xfc\xfb\xfa"
+
+
+class LineFramer:
+    """
+    Splits UART input into lines without allocating per line.
+
+    Data is read with readinto() into one preallocated buffer, and line terminators are searched
+    in place (every byte is scanned only once). Lines are handed out as memoryview slices of that
+    buffer, which stay valid until the next call to readline() / readlines() / reset().
+
+    A line that does not fit into the buffer is returned truncated, and the rest of it is dropped.
+    """
+
+    def __init__(self, uart, size: int=4096, metrics=None) -> None:
+        self.uart = uart
+        self.size = size
+        self.metrics = metrics
+        self._buf = bytearray(size)
+        self._mv = memoryview(self._buf)
+        self._start = 0 # first byte not handed out yet
+        self._end = 0 # end of received data
+        self._scan = 0 # bytes before this position have been searched for LF already
+        self._discard = False # dropping the rest of an overlong line
+        self.overlong = 0
+
+    def reset(self):
+        # forget buffered input, e.g. together with uart.reset_input_buffer()
+        self._start = 0
+        self._end = 0
+        self._scan = 0
+        self._discard = False
+
+    def _compact(self) -> int:
+        # move unconsumed data to the front, returns how far it was moved
+        shift = self._start
+        if shift:
+            n = self._end - shift
+            buf = self._buf
+            for i in range(n): # overlapping copy, front to back
+                buf[i] = buf[shift + i]
+            self._start = 0
+            self._end = n
+            self._scan -= shift
+        return shift
+
+    def _fill(self) -> int:
+        n = self.uart.readinto(self._mv[self._end:])
+        if not n:
+            return 0
+        self._end += n
+        if self.metrics:
+            self.metrics.bytes_in += n
+        return n
+
+    def _find_lf(self, line_start, deadline):
+        """
+        Returns (line_start, index of LF) with line_start adjusted for compaction.
+        The index is None on timeout, or -1 if the buffer is full without a line terminator.
+        """
+        buf = self._buf
+        while True:
+            i = self._scan
+            end = self._end
+            while i < end:
+                if buf[i] == LF:
+                    self._scan = i + 1
+                    return line_start, i
+                i += 1
+            self._scan = end
+
+            if end == self.size:
+                if self._start == 0:
+                    return line_start, -1
+                line_start -= self._compact()
+            if not self._fill():
+                if not ticks_less(ticks_ms(), deadline):
+                    return line_start, None
+
+    def _strip(self, start, end):
+        buf = self._buf
+        while start < end and buf[start] in JUNK:
+            start += 1
+        while end > start and buf[end - 1] in JUNK:
+            end -= 1
+        return self._mv[start:end]
+
+    def readlines(self, n: int=1, timeout_ms: int=30000, quiet: bool=False):
+        """
+        Returns the next n lines as one memoryview (lines separated by CR LF, or LF), with junk
+        bytes stripped from both ends. On timeout, whatever was received is returned
+        (and counted, unless quiet, e.g. while polling a module that is still booting).
+        """
+        deadline = ticks_add(ticks_ms(), timeout_ms)
+        line_start = self._start
+        lf = None
+        for _ in range(n):
+            while True:
+                line_start, lf = self._find_lf(line_start, deadline)
+                if self._discard and lf is not None:
+                    # drop the tail of an overlong line, up to and including its LF
+                    self._start = self._end if lf < 0 else lf + 1
+                    self._scan = self._start
+                    line_start = self._start
+                    self._discard = lf < 0
+                    continue
+                break
+            if lf is None or lf < 0:
+                break
+
+        if lf is None:
+            if not quiet:
+                if self.metrics:
+                    self.metrics.timeouts += 1
+                print("Expresslink uart timeout - response might be incomplete.")
+            end = self._end
+        elif lf < 0:
+            self.overlong += 1
+            if self.metrics:
+                self.metrics.overlong += 1
+            print(f"Expresslink response longer than {self.size} bytes, truncated.")
+            end = self._end
+            self._discard = True
+        else:
+            end = lf + 1
+        self._start = end
+        if self._scan < end:
+            self._scan = end
+        return self._strip(line_start, end)
+
+    def readline(self, timeout_ms: int=30000, quiet: bool=False):
+        return self.readlines(1, timeout_ms, quiet)
@@ -0,0 +1,34 @@
+"""
+The badge modules under test are plain Python and only need adafruit_ticks (from Blinka),
+see requirements.txt. They are loaded from lib/demo_badge by file, because the package's
+__init__ imports the hardware drivers. Modules with relative imports are loaded as submodules
+of a demo_badge package whose __init__ is not run, see load_submodule().
+"""
+
+import importlib
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+LIB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "demo_badge")
+DEPLOY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "deploy")
+
+
+def load(name, directory=LIB):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(directory, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_submodule(name):
+    # demo_badge.<name>, its relative imports resolve to the files in lib/demo_badge
+    if "demo_badge" not in sys.modules:
+        package = importlib.util.module_from_spec(importlib.machinery.ModuleSpec("demo_badge", None, is_package=True))
+        package.__path__ = [LIB]
+        sys.modules["demo_badge"] = package
+    return importlib.import_module("demo_badge." + name)
@@ -0,0 +1,21 @@
+from conftest import load
+
+boot_timing = load("boot_timing")
+
+
+def test_marks_are_relative_to_the_start(monkeypatch, capsys):
+    # supervisor.ticks_ms() starts close to 2**29 and wraps at 2**29
+    now = [(1 << 29) - 300]
+    monkeypatch.setattr(boot_timing, "ticks_ms", lambda: now[0])
+    timer = boot_timing.BootTimer()
+    now[0] += 120
+    assert timer.mark('imports') == 120
+    now[0] = 500 # wrapped
+    assert timer.mark('display') == 800
+
+    assert timer.report() == {'imports': 120, 'display': 800}
+    assert timer.done('display') and not timer.done('connected')
+    timer.print_report()
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[1].split() == ['imports', '120', '+120']
+    assert lines[2].split() == ['display', '800', '+680']
@@ -0,0 +1,221 @@
+import json
+import os
+import select
+import threading
+import traceback
+import tty
+
+import pytest
+
+from conftest import DEPLOY, load
+
+fleet = load("fleet", DEPLOY)
+
+CERTIFICATE = "\n".join([
+    "-----BEGIN CERTIFICATE-----",
+    "MIIBszCCAVmgAwIBAgIUQ3VzdG9tZXJFeHByZXNzTGlua0RlbW9CYWRnZTAKBggq",
+    "hkjOPQQDAjAaMRgwFgYDVQQDDA9FeHByZXNzTGluayBEZW1vMB4XDTIzMDEwMTAw",
+    "MDAwMFoXDTMzMDEwMTAwMDAwMFowGjEYMBYGA1UEAwwPRXhwcmVzc0xpbmsgRGVt",
+    "-----END CERTIFICATE-----",
+])
+
+
+class SimulatedExpressLink:
+    """
+    Answers the AT commands fleet.py sends through ExpressLink.cmd(), like a factory-fresh module:
+    CONF? Certificate pem echoes `pem` on the OK line, CONNECT needs SSID and Endpoint.
+    """
+
+    def __init__(self, thing_name: str, fail: str=None) -> None:
+        self.conf = {'ThingName': thing_name, 'Certificate pem': CERTIFICATE}
+        self.fail = fail # command prefix answered with an error
+        self.commands = []
+        self.config = self.Config(self)
+
+    class Config:
+        # the accessors of demo_badge.expresslink.Config that fleet.py uses
+        def __init__(self, el) -> None:
+            self.el = el
+
+        def _extract_value(self, query):
+            success, line, error_code = self.el.cmd(f"CONF? {query}")
+            if success:
+                return line
+            raise RuntimeError(f"failed to get config {query}: ERR{error_code} {line}")
+
+        @property
+        def ThingName(self):
+            return self._extract_value("ThingName")
+
+        @property
+        def Certificate(self):
+            return self._extract_value("Certificate pem").lstrip("pem").strip()
+
+    def cmd(self, command):
+        self.commands.append(command)
+        if self.fail and command.startswith(self.fail):
+            return False, "INVALID PARAM", 7
+        if command.startswith("CONF? "):
+            key = command[len("CONF? "):]
+            if key == "Certificate pem":
+                return True, "pem\n" + self.conf[key], None
+            return True, self.conf.get(key, ""), None
+        if command.startswith("CONF "):
+            key, value = command[len("CONF "):].split("=", 1)
+            self.conf[key] = value
+            return True, "", None
+        if command == "CONNECT":
+            if self.conf.get("SSID") and self.conf.get("Endpoint"):
+                return True, "1 CONNECTED", None
+            return False, "NOT CONFIGURED", 14
+        return False, "UNKNOWN COMMAND", 3
+
+
+class SimulatedBadge:
+    """
+    The serial console of a Demo Badge on a pseudo-terminal: the friendly REPL, and the raw REPL
+    (Ctrl-A) that runs the received code on Ctrl-D and answers OK, stdout, Ctrl-D, stderr, Ctrl-D, >.
+    fleet.BADGE_SETUP binds `el` and `at` to a SimulatedExpressLink instead of the UART.
+    """
+
+    def __init__(self, thing_name: str, fail: str=None) -> None:
+        self.el = SimulatedExpressLink(thing_name, fail)
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.soft_reboots = 0
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def _write(self, data: bytes):
+        os.write(self.master, data)
+
+    def _run(self, code: str):
+        out = []
+        err = ""
+        if code.strip() == fleet.BADGE_SETUP.strip():
+            el = self.el
+            def at(c):
+                success, line, error = el.cmd(c)
+                return {'success': success, 'line': line, 'error': error}
+            self.namespace = {'json': json, 'el': el, 'at': at}
+        else:
+            namespace = dict(self.namespace)
+            namespace['print'] = lambda *args: out.append(" ".join(str(a) for a in args) + "\r\n")
+            try:
+                exec(code, namespace)
+            except Exception:
+                err = traceback.format_exc()
+        self._write(b"OK" + "".join(out).encode() + b"\x04" + err.encode() + b"\x04>")
+
+    def _serve(self):
+        raw = False
+        code = b""
+        while self._running:
+            if not select.select([self.master], [], [], 0.02)[0]:
+                continue
+            try:
+                data = os.read(self.master, 1024)
+            except OSError:
+                return
+            for b in data:
+                if not raw:
+                    if b == 0x01:
+                        raw = True
+                        code = b""
+                        self._write(b"raw REPL; CTRL-B to exit\r\n>")
+                    elif b == 0x04:
+                        self.soft_reboots += 1
+                elif b == 0x02:
+                    raw = False
+                    self._write(b"\r\nAdafruit CircuitPython 7.3.3\r\n>>> ")
+                elif b == 0x04:
+                    self._run(code.decode())
+                    code = b""
+                elif b == 0x03:
+                    code = b""
+                elif b != 0x01:
+                    code += bytes([b])
+
+
+@pytest.fixture
+def badges():
+    created = []
+    def create(thing_name, fail=None):
+        badge = SimulatedBadge(thing_name, fail)
+        created.append(badge)
+        return badge
+    yield create
+    for badge in created:
+        badge.close()
+
+
+def test_provision_badges_concurrently(badges, tmp_path, monkeypatch):
+    monkeypatch.setenv(fleet.PASSPHRASE_VARIABLE, "not on the command line")
+    one = badges("badge-one")
+    two = badges("badge-two")
+    manifest = tmp_path / "fleet.json"
+    registration = tmp_path / "fleet.jsonl"
+    parameters = tmp_path / "params"
+
+    rc = fleet.main([
+        "--port", one.port, "--port", two.port,
+        "--ssid", "Workshop", "--endpoint", "example-ats.iot.eu-central-1.amazonaws.com", "--connect",
+        "--manifest", str(manifest), "--registration", str(registration), "--parameters", str(parameters),
+    ])
+
+    assert rc == 0
+    for badge in (one, two):
+        assert badge.el.conf["SSID"] == "Workshop"
+        assert badge.el.conf["Passphrase"] == "not on the command line"
+        assert badge.el.conf["Endpoint"] == "example-ats.iot.eu-central-1.amazonaws.com"
+        assert badge.el.commands[-1] == "CONNECT"
+        assert badge.soft_reboots == 1
+
+    badge_list = json.loads(manifest.read_text())['badges']
+    assert sorted(b['thing_name'] for b in badge_list) == ["badge-one", "badge-two"]
+    for b in badge_list:
+        assert b['certificate_pem'] == CERTIFICATE
+        assert b['connected'] is True
+
+    lines = [json.loads(l) for l in registration.read_text().splitlines()]
+    assert sorted(l['ThingName'] for l in lines) == ["badge-one", "badge-two"]
+
+    params = json.loads((parameters / "badge-one.json").read_text())
+    assert params[0] == {'ParameterKey': 'ExpressLinkThingName', 'ParameterValue': "badge-one"}
+    body = params[1]['ParameterValue']
+    assert body == "".join(CERTIFICATE.splitlines()[1:-1])
+    assert "pem" not in body
+
+
+def test_passphrase_is_prompted_for(badges, tmp_path, monkeypatch):
+    monkeypatch.delenv(fleet.PASSPHRASE_VARIABLE, raising=False)
+    monkeypatch.setattr(fleet.getpass, "getpass", lambda prompt: "typed in")
+    badge = badges("badge-prompt")
+
+    assert fleet.main(["--port", badge.port, "--ssid", "Workshop", "--no-reboot"]) == 0
+    assert badge.el.conf["Passphrase"] == "typed in"
+    assert badge.soft_reboots == 0
+
+
+def test_failed_badge_is_reported_and_left_out(badges, tmp_path, capsys):
+    good = badges("badge-good")
+    bad = badges("badge-bad", fail="CONF Endpoint")
+    manifest = tmp_path / "fleet.json"
+
+    rc = fleet.main(["--port", good.port, "--port", bad.port, "--endpoint", "example-ats.iot.eu-central-1.amazonaws.com", "--manifest", str(manifest)])
+
+    assert rc == 2
+    assert [b['thing_name'] for b in json.loads(manifest.read_text())['badges']] == ["badge-good"]
+    assert f"FAILED {bad.port}: {bad.port}: AT+CONF Endpoint failed: 7 INVALID PARAM" in capsys.readouterr().out
+
+
+def test_certificate_body_drops_the_pem_echo():
+    assert fleet.certificate_body("pem\n" + CERTIFICATE) == "".join(CERTIFICATE.splitlines()[1:-1])
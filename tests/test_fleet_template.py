@@ -0,0 +1,39 @@
+import base64
+
+from conftest import DEPLOY, load
+
+fleet_template = load("fleet_template", DEPLOY)
+
+CERTIFICATE = "-----BEGIN CERTIFICATE-----\n" + base64.b64encode(bytes(300)).decode() + "\n-----END CERTIFICATE-----"
+
+
+def manifest(n, prefix="badge"):
+    return [{'thing_name': f"{prefix}-{i}", 'certificate_pem': CERTIFICATE} for i in range(n)]
+
+
+def test_small_fleet_is_valid():
+    badges = manifest(3)
+    template = fleet_template.generate(badges, "workshop")
+    assert fleet_template.validate(template, badges) == []
+
+
+def test_lambda_timeout_grows_with_the_fleet():
+    resources = fleet_template.generate(manifest(50), "workshop")['Resources']
+    assert resources['GetFleetShadowFunction']['Properties']['Timeout'] == 60
+    assert resources['UpdateFleetShadowFunction']['Properties']['Timeout'] == 60
+    assert resources['DecodeTelemetryFunction']['Properties']['Timeout'] == fleet_template.LAMBDA_TIMEOUT
+    resources = fleet_template.generate(manifest(1000), "workshop")['Resources']
+    assert resources['GetFleetShadowFunction']['Properties']['Timeout'] == fleet_template.MAX_LAMBDA_TIMEOUT
+
+
+def test_policy_size_is_checked():
+    # 40 character thing names, as ExpressLink modules report them
+    badges = manifest(50, prefix="0123456789abcdef0123456789abcdef012345")
+    errors = fleet_template.validate(fleet_template.generate(badges, "workshop"), badges)
+    assert len(errors) == 3
+    assert all("--all-things" in e for e in errors)
+
+    template = fleet_template.generate(badges, "workshop", all_things=True)
+    assert fleet_template.validate(template, badges) == []
+    statement = template['Resources']['GetFleetShadowRole']['Properties']['Policies'][0]['PolicyDocument']['Statement'][0]
+    assert statement['Resource'] == [{'Fn::Sub': "arn:${AWS::Partition}:iot:${AWS::Region}:${AWS::AccountId}:thing/*"}]
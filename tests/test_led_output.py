@@ -0,0 +1,26 @@
+import pytest
+
+from conftest import load
+
+led_output = load("led_output")
+
+
+class Pixels(list):
+    def __init__(self, n: int) -> None:
+        super().__init__([0] * n)
+        self.brightness = 0.2
+        self.auto_write = True
+        self.shows = 0
+
+    def show(self):
+        self.shows += 1
+
+
+@pytest.mark.parametrize("fps", [0, -5, 2.5, None, True])
+def test_invalid_max_fps_is_rejected(fps):
+    with pytest.raises(ValueError):
+        led_output.LEDOutput(Pixels(5), max_fps=fps)
+    leds = led_output.LEDOutput(Pixels(5), max_fps=10)
+    with pytest.raises(ValueError):
+        leds.max_fps = fps
+    assert leds.max_fps == 10 and leds._interval_ms == 100
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from conftest import load, load_submodule
+
+reporting = load("reporting")
+shadows = load_submodule("shadows")
+
+
+def merge(document, update):
+    # how AWS IoT merges a shadow update into the reported state: objects merge, null deletes
+    for k, v in update.items():
+        if v is None:
+            document.pop(k, None)
+        elif isinstance(v, dict) and isinstance(document.get(k), dict):
+            merge(document[k], v)
+        else:
+            document[k] = v
+    return document
+
+
+def test_removed_keys_and_fields_are_reported_as_null():
+    policy = reporting.ReportingPolicy(shadows=None)
+    shadow = {}
+    merge(shadow, policy.configure({
+        'default': {'rate_ms': 4000},
+        'temperature': {'rate_ms': 30000, 'deadband': 0.2},
+        'acceleration_x': {'enabled': False},
+    }))
+    assert shadow == policy.config
+
+    reported = policy.configure({'temperature': {'deadband': None}, 'acceleration_x': None})
+    assert reported['acceleration_x'] is None
+    assert reported['temperature'] == {'rate_ms': 30000, 'deadband': None}
+    assert merge(shadow, reported) == {'default': {'rate_ms': 4000}, 'temperature': {'rate_ms': 30000}}
+    assert shadow == policy.config
+
+    # after a reboot, the configuration is restored from the reported shadow
+    restored = reporting.ReportingPolicy(shadows=None)
+    restored.configure(shadow)
+    assert restored.config == policy.config
+
+
+def test_invalid_section_changes_nothing():
+    policy = reporting.ReportingPolicy(shadows=None)
+    policy.configure({'temperature': {'rate_ms': 1000}})
+    with pytest.raises(ValueError):
+        policy.configure({'humidity': None, 'temperature': {'rate_ms': -1}})
+    assert policy.config == {'temperature': {'rate_ms': 1000}}
+
+
+def test_deadband_reference_is_the_last_sent_value():
+    router = shadows.ShadowRouter(el=None)
+    router.add(0, None, ['temperature'], rate_ms=0)
+    policy = reporting.ReportingPolicy(router)
+    policy.configure({'temperature': {'deadband': 0.5}})
+    results = []
+
+    def report(value, ok):
+        router.begin()
+        policy.field('temperature', value)
+        router.end(lambda index, payload: results.append(json.loads(bytes(payload))['state']['reported']) or ok)
+
+    report(20.0, False) # written, but the update failed
+    assert router.reported('temperature') is None
+    report(20.3, True) # no reference yet, so not suppressed
+    assert router.reported('temperature') == 20.3
+    report(20.6, True) # within the deadband of the sent value
+    report(20.9, True)
+    assert results == [{'temperature': 20.0}, {'temperature': 20.3}, {'temperature': 20.9}]
+    assert policy.suppressed == 1
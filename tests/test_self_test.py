@@ -0,0 +1,61 @@
+from conftest import load
+
+self_test = load("self_test")
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000
+
+    def __call__(self):
+        return self.now
+
+
+def test_failed_check_is_retried_after_retry_ms(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(self_test, "ticks_ms", clock)
+    results = [(self_test.PENDING, "waiting"), (self_test.OK, "")]
+    runs = []
+
+    def check(badge):
+        runs.append(clock.now)
+        return results[len(runs) - 1]
+
+    test = self_test.SelfTest(badge=None)
+    c = test.add("once", check, interval_ms=None, retry_ms=1000)
+    test.step()
+    assert c.status == self_test.PENDING
+    clock.now += 999
+    test.step()
+    assert runs == [1000]
+    clock.now += 1
+    test.step()
+    assert runs == [1000, 2000] and c.status == self_test.OK
+    clock.now += 5000
+    test.step()
+    assert len(runs) == 2 # passed, never run again
+
+
+def test_timed_out_check_releases_its_group(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(self_test, "ticks_ms", clock)
+
+    def waits_forever(badge):
+        while True:
+            yield
+
+    def answers(badge):
+        return self_test.OK, "answered"
+
+    test = self_test.SelfTest(badge=None)
+    slow = test.add("slow", waits_forever, interval_ms=None, timeout_ms=2000, group="uart", retry_ms=1000)
+    fast = test.add("fast", answers, group="uart")
+    test.step()
+    assert slow.running and fast.status == self_test.PENDING # the group is busy
+    clock.now += 2000
+    test.step()
+    assert slow.status == self_test.TIMEOUT and not slow.running
+    test.step()
+    assert fast.status == self_test.OK
+    test.step()
+    assert not slow.running # not restarted before retry_ms
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from conftest import load
+
+shadow_parser = load("shadow_parser")
+
+SAMPLE = json.loads(shadow_parser.SAMPLE_SHADOW_DOC[2:])
+
+
+@pytest.fixture
+def parser():
+    return shadow_parser.ShadowParser()
+
+
+def test_recorded_document_prefers_desired(parser):
+    assert parser.parse(shadow_parser.SAMPLE_SHADOW_DOC)
+    assert parser.version == 4711
+    assert parser.section == 'desired'
+    assert parser.state == SAMPLE['state']['desired']
+
+
+def test_reported_and_delta_documents(parser):
+    doc = {'state': {'reported': SAMPLE['state']['reported']}, 'metadata': SAMPLE['metadata'], 'version': 3}
+    assert parser.parse("1 " + json.dumps(doc))
+    assert (parser.section, parser.version, parser.state) == ('reported', 3, SAMPLE['state']['reported'])
+
+    delta = {'version': 12, 'timestamp': 1, 'state': {'led_1': 255}, 'metadata': {'led_1': {'timestamp': 1}}}
+    assert parser.parse(json.dumps(delta, indent=2)) # whitespace and no prefix
+    assert (parser.section, parser.version, parser.state) == ('state', 12, {'led_1': 255})
+
+
+def test_strings_with_escapes_and_brackets(parser):
+    desired = {'buttons_config': {'button_1': ["https://example.com/?q=\"}]{\\", [1, 2, 3]]}, 'text': "a \\\" b"}
+    doc = {'metadata': {'desired': {'text': {'timestamp': 1}}}, 'state': {'desired': desired}}
+    assert parser.parse("1 " + json.dumps(doc))
+    assert parser.state == desired
+    assert parser.version is None
+
+
+def test_scan_buffers_are_reused(parser):
+    top = parser._top
+    sections = parser._sections
+    parser.parse(shadow_parser.SAMPLE_SHADOW_DOC)
+    parser.parse('1 {"state":{"reported":{"a":1}}}')
+    assert parser._top is top and parser._sections is sections
+    assert parser.state == {'a': 1}
+
+
+@pytest.mark.parametrize("line", [
+    '1 {"state":{"desired":{"a":1}',
+    '1 {"state":{"desired":{"a":1}},"version":x}',
+    '1 {"state" {"desired":{}}}',
+    '1 {"state":{"desired":[1]}}',
+    '1 [1, 2]',
+    '1 ',
+])
+def test_malformed_documents_are_counted_and_dropped(parser, line):
+    assert not parser.parse(line)
+    assert parser.rejected == 1
+    assert parser.state is None and parser.section is None
+
+
+def test_size_caps(parser):
+    parser.max_size = 100
+    assert not parser.parse("1 " + json.dumps({'state': {'desired': {'a': "x" * 100}}}))
+    parser.max_size = 8192
+    parser.max_state_size = 50
+    big = {'state': {'desired': {'a': "x" * 100}}, 'version': 1}
+    assert not parser.parse("1 " + json.dumps(big))
+    assert parser.rejected == 2
+    # metadata does not count against the section cap
+    small = {'state': {'desired': {'a': 1}}, 'metadata': {'x': "y" * 1000}}
+    assert parser.parse("1 " + json.dumps(small))
+
+
+def test_rejected_document_is_not_counted(parser):
+    assert not parser.parse("0 rejected")
+    assert parser.rejected == 0
+
+
+def test_benchmark_allocates_less_than_json_loads(capsys):
+    (json_us, json_bytes), (parser_us, parser_bytes) = shadow_parser.benchmark(iterations=5)
+    assert parser_bytes < json_bytes
+    assert "ShadowParser" in capsys.readouterr().out
@@ -0,0 +1,132 @@
+from conftest import load
+
+spool = load("spool")
+ReportSpool = spool.ReportSpool
+
+
+def _sent(batches):
+    def send(values):
+        batches.append(dict(values))
+        return True
+    return send
+
+
+def test_values_survive_a_reboot(tmp_path):
+    path = str(tmp_path / "spool.bin")
+    s = ReportSpool(path, write_interval_ms=0)
+    s.append({'temperature': 21.5, 'button_1': 'pressed', 'led_1': 0xFF9900})
+    s.append({'temperature': 22.25, 'buttons_config': {'button_1': ["https://aws.amazon.com/", [255, 153, 0]]}, 'reconnects': None, 'high_update_rate': True})
+
+    rebooted = ReportSpool(path)
+    assert rebooted.pending == {
+        'temperature': 22.25, # the latest value wins
+        'button_1': 'pressed',
+        'led_1': 0xFF9900,
+        'buttons_config': {'button_1': ["https://aws.amazon.com/", [255, 153, 0]]},
+        'reconnects': None,
+        'high_update_rate': True,
+    }
+
+
+def test_truncated_last_record_is_ignored(tmp_path):
+    path = tmp_path / "spool.bin"
+    s = ReportSpool(str(path), write_interval_ms=0)
+    s.append({'humidity': 40})
+    s.append({'nfc_per_url': {'https://aws.amazon.com/': 3}})
+    data = path.read_bytes()
+    path.write_bytes(data[:-3]) # power loss while writing
+
+    assert ReportSpool(str(path)).pending == {'humidity': 40}
+
+
+def test_flash_writes_are_rate_limited(tmp_path):
+    path = tmp_path / "spool.bin"
+    s = ReportSpool(str(path), write_interval_ms=60000)
+    for i in range(50):
+        s.append({'temperature': 20 + i / 4, 'humidity': 40 + i}) # exact as float32
+    # the first append writes, the rest waits for the interval
+    assert s.writes == 1
+    assert ReportSpool(str(path)).pending == {'temperature': 20.0, 'humidity': 40}
+
+    s.update(force=True)
+    assert s.writes == 2
+    assert ReportSpool(str(path)).pending == {'temperature': 32.25, 'humidity': 89}
+
+
+def test_log_is_compacted_beyond_max_bytes(tmp_path):
+    path = tmp_path / "spool.bin"
+    s = ReportSpool(str(path), max_bytes=128, write_interval_ms=0)
+    for i in range(100):
+        s.append({'ambient_light': i, 'button_2': 'not pressed'})
+    assert path.stat().st_size <= 128
+    assert ReportSpool(str(path)).pending == {'ambient_light': 99, 'button_2': 'not pressed'}
+
+
+def test_replayed_batches_are_not_sent_again_after_a_reboot(tmp_path):
+    path = str(tmp_path / "spool.bin")
+    s = ReportSpool(path, batch_size=2, min_interval_ms=0, write_interval_ms=0)
+    s.append({'a': 1, 'b': 2, 'c': 3, 'd': 4, 'e': 5})
+
+    batches = []
+    assert s.flush(_sent(batches)) == 2
+    # reboot in the middle of the replay
+    rebooted = ReportSpool(path, batch_size=2, min_interval_ms=0, write_interval_ms=0)
+    assert rebooted.pending == {'c': 3, 'd': 4, 'e': 5}
+
+    while rebooted:
+        rebooted.flush(_sent(batches))
+    assert batches == [{'a': 1, 'b': 2}, {'c': 3, 'd': 4}, {'e': 5}]
+    assert ReportSpool(path).pending == {}
+
+
+def test_failed_batch_stays_pending(tmp_path):
+    path = str(tmp_path / "spool.bin")
+    s = ReportSpool(path, min_interval_ms=0, write_interval_ms=0)
+    s.append({'a': 1})
+    assert s.flush(lambda values: False) == 0
+    assert s.pending == {'a': 1}
+    assert ReportSpool(path).pending == {'a': 1}
+
+
+def test_flush_is_rate_limited(tmp_path):
+    s = ReportSpool(str(tmp_path / "spool.bin"), batch_size=1, min_interval_ms=60000)
+    s.append({'a': 1, 'b': 2})
+    batches = []
+    assert s.flush(_sent(batches)) == 1
+    assert s.flush(_sent(batches)) == 0
+    assert batches == [{'a': 1}]
+
+
+def test_unwritable_path_falls_back_to_ram(tmp_path):
+    s = ReportSpool(str(tmp_path / "missing" / "spool.bin"), write_interval_ms=0)
+    s.append({'a': 1})
+    assert not s.persistent
+    assert s.pending == {'a': 1}
+    assert s.stats()['spool_persistent'] is False
+
+
+def test_replay_compacts_at_most_once_per_write_interval(tmp_path):
+    path = str(tmp_path / "spool.bin")
+    s = ReportSpool(path, batch_size=1, min_interval_ms=0, write_interval_ms=60000)
+    s.append({'a': 1, 'b': 2, 'c': 3}) # first write
+    batches = []
+    while s:
+        s.flush(_sent(batches))
+    assert len(batches) == 3
+    assert s.writes == 1 # the sent values are removed from the log with the next write
+    s.update(force=True)
+    assert s.writes == 2
+    assert ReportSpool(path).pending == {}
+
+
+def test_live_values_replace_spooled_ones(tmp_path):
+    path = str(tmp_path / "spool.bin")
+    s = ReportSpool(path, min_interval_ms=0, write_interval_ms=0)
+    s.append({'temperature': 20.5, 'humidity': 40})
+    s.discard(['temperature', 'led_1'])
+    assert s.pending == {'humidity': 40}
+    s.update()
+    assert ReportSpool(path).pending == {'humidity': 40}
+    batches = []
+    s.flush(_sent(batches))
+    assert batches == [{'humidity': 40}]
@@ -0,0 +1,85 @@
+import pytest
+
+from conftest import load_submodule
+
+topics = load_submodule("topics")
+inbox = load_submodule("inbox")
+Event = load_submodule("responses").Event
+
+COMMAND_TOPIC = "badge/demo/command"
+
+
+class FakeExpressLink:
+    # records the topic commands TopicManager sends
+    def __init__(self) -> None:
+        self.commands = []
+        self.config = self
+
+    def set_topic(self, index, name):
+        self.commands.append(f"CONF Topic{index}={name}")
+        return True, "", None
+
+    def subscribe(self, index):
+        self.commands.append(f"SUBSCRIBE{index}")
+
+    def unsubscribe(self, index):
+        self.commands.append(f"UNSUBSCRIBE{index}")
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(topics, "ticks_ms", clock)
+    monkeypatch.setattr(inbox, "ticks_ms", clock)
+    return clock
+
+
+def test_overrunning_topic_is_paused_and_subscribed_again(clock):
+    el = FakeExpressLink()
+    box = inbox.MessageInbox(throttle_ms=10000, overrun_limit=3)
+    manager = topics.TopicManager(el, inbox=box)
+    index = manager.subscribe(COMMAND_TOPIC, lambda name, message: None)
+    assert el.commands == [f"CONF Topic{index}={COMMAND_TOPIC}", f"SUBSCRIBE{index}"]
+
+    for _ in range(3):
+        manager.handle_event(Event.OVERRUN, 0, COMMAND_TOPIC + " ")
+    assert el.commands[-1] == f"UNSUBSCRIBE{index}"
+    assert manager.index(COMMAND_TOPIC) == index # still registered
+
+    # a reconnect while paused does not subscribe it early
+    manager.restore()
+    assert el.commands[-1] == f"UNSUBSCRIBE{index}"
+    clock.now += 9999
+    manager.process()
+    assert el.commands[-1] == f"UNSUBSCRIBE{index}"
+
+    clock.now += 1
+    manager.process()
+    assert el.commands[-1] == f"SUBSCRIBE{index}"
+    manager.handle_event(Event.SUBACK, index)
+    assert manager._subscribed[index]
+
+    # and after the next reconnect, it is restored like any other topic
+    manager.restore()
+    assert el.commands[-1] == f"SUBSCRIBE{index}"
+
+
+def test_overruns_below_the_limit_only_throttle(clock):
+    el = FakeExpressLink()
+    box = inbox.MessageInbox(throttle_ms=10000, overrun_limit=3)
+    manager = topics.TopicManager(el, inbox=box)
+    manager.subscribe(COMMAND_TOPIC)
+    manager.handle_event(Event.OVERRUN, 0, COMMAND_TOPIC)
+    manager.handle_event(Event.OVERRUN, 0, COMMAND_TOPIC)
+    assert not any(c.startswith("UNSUBSCRIBE") for c in el.commands)
+    assert not box.push(COMMAND_TOPIC, "{}") # throttled
+    clock.now += 10000
+    assert box.push(COMMAND_TOPIC, "{}")
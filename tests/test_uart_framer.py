@@ -0,0 +1,161 @@
+from conftest import load
+
+LineFramer = load("uart_framer").LineFramer
+
+
+class FakeUART:
+    """
+    Hands out the scripted chunks one readinto() call at a time, like bytes trickling in
+    from the ExpressLink module. Returns None once the script is exhausted (no data yet).
+    """
+
+    def __init__(self, *chunks) -> None:
+        self.chunks = list(chunks)
+        self.reads = 0
+
+    def feed(self, *chunks):
+        self.chunks.extend(chunks)
+
+    def readinto(self, buf):
+        self.reads += 1
+        if not self.chunks:
+            return None
+        chunk = self.chunks.pop(0)
+        n = min(len(chunk), len(buf))
+        buf[:n] = chunk[:n]
+        if n < len(chunk):
+            self.chunks.insert(0, chunk[n:])
+        return n
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.bytes_in = 0
+        self.timeouts = 0
+        self.overlong = 0
+
+
+def bytewise(data):
+    return [data[i:i + 1] for i in range(len(data))]
+
+
+def test_line_in_one_read():
+    framer = LineFramer(FakeUART(b"OK 1.2.3\r\n"))
+    line = framer.readline()
+    assert isinstance(line, memoryview)
+    assert bytes(line) == b"OK 1.2.3"
+
+
+def test_partial_lines_across_reads():
+    framer = LineFramer(FakeUART(b"O", b"K 1 CON", b"NECTED\r", b"\nERR", b"14 INVALID\r\n"))
+    assert bytes(framer.readline()) == b"OK 1 CONNECTED"
+    assert bytes(framer.readline()) == b"ERR14 INVALID"
+
+
+def test_byte_by_byte():
+    framer = LineFramer(FakeUART(*bytewise(b"OK 2 3 MSG\r\nOK\r\n")))
+    assert bytes(framer.readline()) == b"OK 2 3 MSG"
+    assert bytes(framer.readline()) == b"OK"
+
+
+def test_several_lines_in_one_read():
+    uart = FakeUART(b"OK first\r\nOK second\r\nOK third\r\n")
+    framer = LineFramer(uart)
+    assert [bytes(framer.readline()) for _ in range(3)] == [b"OK first", b"OK second", b"OK third"]
+    assert uart.reads == 1
+
+
+def test_junk_bytes_are_stripped():
+    # the module emits 0xFF / 0x00 noise after a reset
+    framer = LineFramer(FakeUART(b"\xff\xff\x00\xfe", b"OK\r\n", b"\x00\x00\xfaOK 1 2 CONNLOST\xff\r\n\x00"))
+    assert bytes(framer.readline()) == b"OK"
+    assert bytes(framer.readline()) == b"OK 1 2 CONNLOST"
+
+
+def test_junk_inside_a_line_is_kept():
+    framer = LineFramer(FakeUART(b"OK a\x00b\r\n"))
+    assert bytes(framer.readline()) == b"OK a\x00b"
+
+
+def test_lf_only_line_endings():
+    framer = LineFramer(FakeUART(b"OK\nOK 1\n"))
+    assert bytes(framer.readline()) == b"OK"
+    assert bytes(framer.readline()) == b"OK 1"
+
+
+def test_multi_line_response():
+    # OK<n> is followed by n more lines, e.g. a certificate or a list
+    cert = b"-----BEGIN CERTIFICATE-----\r\n" + b"MIIBszCCAVmgAwIBAgIU\r\n" * 20 + b"-----END CERTIFICATE-----\r\n"
+    data = b"OK22 pem\r\n" + cert
+    framer = LineFramer(FakeUART(*[data[i:i + 7] for i in range(0, len(data), 7)]))
+    assert bytes(framer.readline()) == b"OK22 pem"
+    lines = bytes(framer.readlines(22))
+    assert lines == cert.rstrip(b"\r\n")
+    assert lines.split(b"\r\n")[-1] == b"-----END CERTIFICATE-----"
+
+
+def test_multi_line_response_is_not_read_past():
+    framer = LineFramer(FakeUART(b"OK2 list\r\na\r\nb\r\nOK next\r\n"))
+    framer.readline()
+    assert bytes(framer.readlines(2)) == b"a\r\nb"
+    assert bytes(framer.readline()) == b"OK next"
+
+
+def test_overlong_line_is_truncated_and_its_tail_dropped():
+    metrics = Metrics()
+    framer = LineFramer(FakeUART(b"OK " + b"x" * 60, b"y" * 40 + b"\r\n", b"OK after\r\n"), size=32, metrics=metrics)
+    line = bytes(framer.readline())
+    assert line == (b"OK " + b"x" * 60)[:32]
+    assert framer.overlong == 1
+    assert metrics.overlong == 1
+    # the rest of the overlong line never shows up as a line of its own
+    assert bytes(framer.readline()) == b"OK after"
+
+
+def test_buffer_is_compacted_for_lines_that_fit():
+    uart = FakeUART()
+    framer = LineFramer(uart, size=32)
+    for i in range(20):
+        uart.feed(b"OK line %d\r\n" % i)
+        assert bytes(framer.readline()) == b"OK line %d" % i
+    assert framer.overlong == 0
+
+
+def test_line_spanning_the_buffer_end():
+    # the first line leaves the second one straddling the end of the buffer
+    framer = LineFramer(FakeUART(b"OK 0123456789012345678\r\nOK abcdef", b"ghijklmnop\r\n"), size=32)
+    assert bytes(framer.readline()) == b"OK 0123456789012345678"
+    assert bytes(framer.readline()) == b"OK abcdefghijklmnop"
+    assert framer.overlong == 0
+
+
+def test_timeout_returns_what_was_received():
+    metrics = Metrics()
+    framer = LineFramer(FakeUART(b"OK incompl"), metrics=metrics)
+    assert bytes(framer.readline(timeout_ms=20)) == b"OK incompl"
+    assert metrics.timeouts == 1
+
+
+def test_quiet_timeout_is_not_counted():
+    metrics = Metrics()
+    framer = LineFramer(FakeUART(), metrics=metrics)
+    assert bytes(framer.readline(timeout_ms=10, quiet=True)) == b""
+    assert metrics.timeouts == 0
+
+
+def test_reset_drops_buffered_input():
+    uart = FakeUART(b"OK stale\r\nOK stale too\r\n")
+    framer = LineFramer(uart)
+    framer.readline()
+    framer.reset()
+    uart.chunks.clear()
+    uart.feed(b"OK fresh\r\n")
+    assert bytes(framer.readline()) == b"OK fresh"
+
+
+def test_bytes_in_are_counted():
+    metrics = Metrics()
+    framer = LineFramer(FakeUART(b"OK\r\n", b"OK 1\r\n"), metrics=metrics)
+    framer.readline()
+    framer.readline()
+    assert metrics.bytes_in == 10